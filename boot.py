@@ -15,7 +15,9 @@ from .plugin.core.main import startup as plugin_loaded
 from .plugin.core.panels import LspClearPanelCommand
 from .plugin.core.panels import LspUpdatePanelCommand
 from .plugin.core.panels import LspUpdateServerPanelCommand
+from .plugin.core.registry import LspDumpRpcMetricsCommand
 from .plugin.core.registry import LspRestartClientCommand
+from .plugin.core.registry import LspToggleTrafficRecordingCommand
 from .plugin.diagnostics import DiagnosticsCursorListener
 from .plugin.diagnostics import LspClearDiagnosticsCommand
 from .plugin.diagnostics import LspHideDiagnosticCommand
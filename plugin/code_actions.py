@@ -1,8 +1,9 @@
 import sublime
 import sublime_plugin
 from .core.edit import parse_workspace_edit
+from .core.promise import Promise
 from .core.protocol import Diagnostic
-from .core.protocol import Request, Point
+from .core.protocol import ErrorCode, Request, Point
 from .core.registry import LspTextCommand
 from .core.registry import sessions_for_view, client_from_session
 from .core.settings import settings
@@ -24,17 +25,33 @@ class CodeActionsAtLocation(object):
 
     def __init__(self, on_complete_handler: Callable[[CodeActionsByConfigName], None]) -> None:
         self._commands_by_config = {}  # type: CodeActionsByConfigName
-        self._requested_configs = []  # type: List[str]
+        self._responses = []  # type: List[Promise]
         self._on_complete_handler = on_complete_handler
+        self.completed = False
+        self.cancelled = False
 
-    def collect(self, config_name: str) -> Callable[[CodeActionsResponse], None]:
-        self._requested_configs.append(config_name)
-        return lambda actions: self.store(config_name, actions)
+    def collect(self, config_name: str, response: Promise) -> None:
+        self._responses.append(response.then(lambda actions: self.store(config_name, actions), self.fail))
 
     def store(self, config_name: str, actions: CodeActionsResponse) -> None:
         self._commands_by_config[config_name] = actions or []
-        if len(self._requested_configs) == len(self._commands_by_config):
-            self._on_complete_handler(self._commands_by_config)
+
+    def fail(self, error: Any) -> None:
+        # A cancelled request is never handled, a request that failed otherwise just has no actions.
+        if isinstance(error, dict) and error.get("code") == ErrorCode.RequestCancelled:
+            self.cancelled = True
+
+    def complete(self) -> None:
+        if self._responses:
+            Promise.all(self._responses).then(lambda _: self._handle_complete())
+        else:
+            self.completed = True
+
+    def _handle_complete(self) -> None:
+        if self.cancelled:
+            return
+        self.completed = True
+        self._on_complete_handler(self._commands_by_config)
 
     def deliver(self, recipient_handler: Callable[[CodeActionsByConfigName], None]) -> None:
         recipient_handler(self._commands_by_config)
@@ -47,31 +64,43 @@ class CodeActionsManager(object):
         self._requests = {}  # type: Dict[str, CodeActionsAtLocation]
 
     def request(self, view: sublime.View, point: int,
-                actions_handler: Callable[[CodeActionsByConfigName], None]) -> None:
+                actions_handler: Callable[[CodeActionsByConfigName], None], user_invoked: bool = False) -> None:
         current_location = self.get_location_key(view, point)
         # debug("requesting actions for {}".format(current_location))
-        if current_location in self._requests:
-            self._requests[current_location].deliver(actions_handler)
+        cached = self._requests.get(current_location)
+        if cached and not cached.cancelled and (cached.completed or not user_invoked):
+            cached.deliver(actions_handler)
+        elif user_invoked:
+            # Requests the user asked for don't supersede the ones of the bulb and hover, and aren't superseded.
+            request_code_actions(view, point, actions_handler, user_invoked=True)
         else:
-            self._requests.clear()
+            # The bulb and hover ask for actions at different locations, so only actions for other versions of the
+            # document are dropped.
+            document = self.get_document_key(view)
+            for location in [location for location in self._requests if not location.startswith(document)]:
+                del self._requests[location]
             self._requests[current_location] = request_code_actions(view, point, actions_handler)
 
+    def get_document_key(self, view: sublime.View) -> str:
+        return "{}#{}:".format(view.file_name(), view.change_count())
+
     def get_location_key(self, view: sublime.View, point: int) -> str:
-        return "{}#{}:{}".format(view.file_name(), view.change_count(), point)
+        return "{}{}".format(self.get_document_key(view), point)
 
 
 actions_manager = CodeActionsManager()
 
 
 def request_code_actions(view: sublime.View, point: int,
-                         actions_handler: Callable[[CodeActionsByConfigName], None]) -> CodeActionsAtLocation:
+                         actions_handler: Callable[[CodeActionsByConfigName], None],
+                         user_invoked: bool = False) -> CodeActionsAtLocation:
     diagnostics_by_config = filter_by_point(view_diagnostics(view), Point(*view.rowcol(point)))
-    return request_code_actions_with_diagnostics(view, diagnostics_by_config, point, actions_handler)
+    return request_code_actions_with_diagnostics(view, diagnostics_by_config, point, actions_handler, user_invoked)
 
 
 def request_code_actions_with_diagnostics(view: sublime.View, diagnostics_by_config: Dict[str, List[Diagnostic]],
-                                          point: int, actions_handler: Callable[[CodeActionsByConfigName], None]
-                                          ) -> CodeActionsAtLocation:
+                                          point: int, actions_handler: Callable[[CodeActionsByConfigName], None],
+                                          user_invoked: bool = False) -> CodeActionsAtLocation:
 
     actions_at_location = CodeActionsAtLocation(actions_handler)
 
@@ -93,9 +122,15 @@ def request_code_actions_with_diagnostics(view: sublime.View, diagnostics_by_con
                     }
                 }
                 if session.client:
-                    session.client.send_request(
-                        Request.codeAction(params),
-                        actions_at_location.collect(session.config.name))
+                    request = Request.codeAction(params)
+                    actions_at_location.collect(
+                        session.config.name,
+                        session.client.send_request(request,
+                                                    view_id=None if user_invoked else view.id(),
+                                                    view_key="{}@{}".format(request.method, point),
+                                                    timeout=settings.feature_request_timeout or None,
+                                                    document_version=view.change_count()))
+    actions_at_location.complete()
     return actions_at_location
 
 
@@ -186,7 +221,7 @@ class LspCodeActionsCommand(LspTextCommand):
     def run(self, edit: sublime.Edit) -> None:
         self.commands = []  # type: List[Tuple[str, str, CodeActionOrCommand]]
         self.commands_by_config = {}  # type: CodeActionsByConfigName
-        actions_manager.request(self.view, self.view.sel()[0].begin(), self.handle_responses)
+        actions_manager.request(self.view, self.view.sel()[0].begin(), self.handle_responses, user_invoked=True)
 
     def combine_commands(self) -> 'List[Tuple[str, str, CodeActionOrCommand]]':
         results = []
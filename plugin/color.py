@@ -84,7 +84,9 @@ class LspColorListener(sublime_plugin.ViewEventListener):
                 }
                 client.send_request(
                     Request.documentColor(params),
-                    self.handle_response
+                    self.handle_response,
+                    view_id=self.view.id(),
+                    timeout=settings.feature_request_timeout or None
                 )
 
     def handle_response(self, response: Optional[List[dict]]) -> None:
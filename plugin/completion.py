@@ -266,7 +266,9 @@ class CompletionHandler(LSPViewEventListener):
             client.send_request(
                 Request.complete(document_position),
                 self.handle_response,
-                self.handle_error)
+                self.handle_error,
+                view_id=view.id(),
+                timeout=settings.feature_request_timeout or None)
 
     def do_resolve(self, item: dict) -> None:
         view = self.view
@@ -275,7 +277,7 @@ class CompletionHandler(LSPViewEventListener):
         if not client:
             return
 
-        client.send_request(Request.resolveCompletionItem(item), self.handle_resolve_response)
+        client.send_request(Request.resolveCompletionItem(item), self.handle_resolve_response, view_id=view.id())
 
     def handle_resolve_response(self, response: Optional[Dict]) -> None:
         if response:
@@ -0,0 +1,366 @@
+from .logging import debug, exception_log
+from .protocol import Error, ErrorCode, Request
+from .codec import StreamingBody
+from .transports import ContentLengthFramer, SendQueue, Transport
+from .transports import encode_message
+from .typing import Any, Callable, Dict, IO, Optional
+from collections import deque
+from queue import Empty
+import os
+import subprocess
+import threading
+
+try:
+    import asyncio
+except ImportError:
+    # Python 3.3 (Sublime Text 3) has no asyncio module.
+    asyncio = None  # type: ignore
+
+
+def asyncio_available() -> bool:
+    return asyncio is not None
+
+
+def asyncio_pipes_available() -> bool:
+    # The proactor event loop of Windows can't read the (non-overlapped) pipes of a subprocess.Popen.
+    return asyncio is not None and os.name != "nt"
+
+
+class EventLoopThread(object):
+    """
+    Runs an asyncio event loop on a thread of its own. All transports and request futures of this module live on it.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="LSP asyncio loop")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def call_soon(self, callback: Callable[..., None], *args: Any) -> None:
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+_loop_thread = None  # type: Optional[EventLoopThread]
+_loop_thread_lock = threading.Lock()
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    global _loop_thread
+    with _loop_thread_lock:
+        if _loop_thread is None:
+            _loop_thread = EventLoopThread()
+        return _loop_thread
+
+
+class FlowControlledProtocol(object):
+    """
+    Tells the AsyncioTransport when to stop writing, because the buffer of the asyncio transport is full.
+    """
+
+    def __init__(self, owner: 'AsyncioTransport') -> None:
+        self._owner = owner
+
+    def pause_writing(self) -> None:
+        self._owner.pause_writing()
+
+    def resume_writing(self) -> None:
+        self._owner.resume_writing()
+
+
+class FramedProtocol(FlowControlledProtocol):
+    """
+    An asyncio protocol that splits the received bytes into messages.
+    """
+
+    def __init__(self, owner: 'AsyncioTransport', framer: ContentLengthFramer, on_eof: Callable[[], None]) -> None:
+        super().__init__(owner)
+        self._framer = framer
+        self._on_eof = on_eof
+
+    def connection_made(self, transport: Any) -> None:
+        pass
+
+    def data_received(self, data: bytes) -> None:
+        self._framer.feed(data)
+
+    def eof_received(self) -> bool:
+        self._on_eof()
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if exc:
+            exception_log("Failure reading from server", exc)
+        self._on_eof()
+
+
+class WriterProtocol(FlowControlledProtocol):
+    """
+    The protocol of a write-only pipe.
+    """
+
+    def __init__(self, owner: 'AsyncioTransport', on_lost: Callable[[], None]) -> None:
+        super().__init__(owner)
+        self._on_lost = on_lost
+
+    def connection_made(self, transport: Any) -> None:
+        pass
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if exc:
+            exception_log("Failure writing to server", exc)
+        self._on_lost()
+
+
+class AsyncioTransport(Transport):
+    """
+    A transport that is serviced by the shared asyncio event loop, instead of threads of its own.
+
+    Everything but send and close runs on the event loop thread.
+    """
+
+    def __init__(self, loop_thread: EventLoopThread, process: Optional[subprocess.Popen] = None,
+                 sock: Optional[Any] = None) -> None:
+        self._loop_thread = loop_thread
+        self._process = process
+        self._socket = sock
+        self._reader = None  # type: Any
+        self._writer = None  # type: Any
+        self._queue = SendQueue()
+        # Buffers taken from the queue, and iterators over the chunks of streaming bodies, that were not handed to the
+        # writer yet.
+        self._outgoing = deque()  # type: deque
+        self._paused = False
+        self._closed = False
+
+    @classmethod
+    def for_process(cls, process: subprocess.Popen) -> 'AsyncioTransport':
+        return cls(get_event_loop_thread(), process=process)
+
+    @classmethod
+    def for_socket(cls, sock: Any) -> 'AsyncioTransport':
+        return cls(get_event_loop_thread(), sock=sock)
+
+    def start(self, on_receive: Callable[[str], None], on_closed: Callable[[], None]) -> None:
+        self.on_receive = on_receive
+        self.on_closed = on_closed
+        self._loop_thread.call_soon(self._connect)
+
+    def send(self, content: str) -> None:
+        self._queue.put(encode_message(content))
+        self._loop_thread.call_soon(self._pump)
+
+    def send_payload(self, payload: Dict[str, Any]) -> int:
+        size = self._queue.put_payload(payload)
+        self._loop_thread.call_soon(self._pump)
+        return size
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)  # tell the writer to stop
+        self._loop_thread.call_soon(self._close_streams)
+        self.on_closed()
+
+    def _connect(self) -> None:
+        loop = self._loop_thread.loop
+        framer = ContentLengthFramer(self.on_receive)
+        if self._socket is not None:
+            self._watch(loop.create_connection(lambda: FramedProtocol(self, framer, self._on_socket_eof),
+                                               sock=self._socket),
+                        self._on_socket_connected)
+        elif self._process is not None:
+            process = self._process
+            self._watch(loop.connect_read_pipe(lambda: FramedProtocol(self, framer, self._on_process_eof),
+                                               process.stdout),
+                        self._on_reader_connected)
+            self._watch(loop.connect_write_pipe(lambda: WriterProtocol(self, self.close), process.stdin),
+                        self._on_writer_connected)
+
+    def _watch(self, coroutine: Any, on_connected: Callable[[Any], None]) -> None:
+
+        def on_done(task: Any) -> None:
+            if task.cancelled():
+                return
+            error = task.exception()
+            if error:
+                exception_log("Failure connecting to server", error)
+                self.close()
+            else:
+                transport, _ = task.result()
+                on_connected(transport)
+
+        self._loop_thread.loop.create_task(coroutine).add_done_callback(on_done)
+
+    def _on_socket_connected(self, transport: Any) -> None:
+        self._reader = transport
+        self._on_writer_connected(transport)
+
+    def _on_reader_connected(self, transport: Any) -> None:
+        self._reader = transport
+        if self._closed:
+            self._close_streams()
+
+    def _on_writer_connected(self, transport: Any) -> None:
+        self._writer = transport
+        if self._closed:
+            self._close_streams()
+        else:
+            self._pump()
+
+    def pause_writing(self) -> None:
+        self._paused = True
+
+    def resume_writing(self) -> None:
+        self._paused = False
+        self._pump()
+
+    def _pump(self) -> None:
+        """
+        Hands the outgoing messages to the writer until its buffer is full. Streaming bodies are encoded as they go, so
+        a large message doesn't pile up in the buffer of the asyncio transport. Messages stay in the queue, where they
+        can be superseded, until the writer has room for them.
+        """
+        while self._writer is not None and not self._paused and not self._closed:
+            if not self._outgoing:
+                try:
+                    message = self._queue.get_nowait()
+                except Empty:
+                    break
+                if message is None:
+                    break
+                header, body = message
+                self._outgoing.append(header)
+                self._outgoing.append(body.chunks() if isinstance(body, StreamingBody) else body)
+            item = self._outgoing.popleft()
+            if isinstance(item, bytes):
+                self._writer.write(item)
+                continue
+            chunk = next(item, None)
+            if chunk is not None:
+                self._outgoing.appendleft(item)
+                self._writer.write(chunk)
+
+    def _on_socket_eof(self) -> None:
+        if not self._closed:
+            debug("no data received, closing")
+        self.close()
+
+    def _on_process_eof(self) -> None:
+        process = self._process
+        if not process:
+            return
+        debug("process {} stdout ended".format(process.pid))
+        self._process = None
+
+        def on_exit(task: Any) -> None:
+            returncode = task.result()
+            debug("process {} exited with code {}".format(process.pid, returncode))
+            if returncode != 0:
+                self.close()
+
+        # The process must be waited on, or zombie processes may be the result.
+        self._loop_thread.loop.run_in_executor(None, process.wait).add_done_callback(on_exit)
+
+    def _close_streams(self) -> None:
+        for stream in (self._reader, self._writer):
+            if stream is not None:
+                stream.close()
+
+
+class LineLoggerProtocol(object):
+    """
+    An asyncio protocol that hands every received line to a log callback.
+    """
+
+    def __init__(self, log_callback: Callable[[str], None]) -> None:
+        self._log_callback = log_callback
+        self._pending = b""
+
+    def connection_made(self, transport: Any) -> None:
+        pass
+
+    def data_received(self, data: bytes) -> None:
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._log_callback(line.decode('UTF-8', 'replace').strip())
+
+    def eof_received(self) -> bool:
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self._pending:
+            self._log_callback(self._pending.decode('UTF-8', 'replace').strip())
+            self._pending = b""
+        debug("LSP stream logger stopped.")
+
+
+def attach_logger(process: subprocess.Popen, stream: IO[Any], log_callback: Callable[[str], None]) -> None:
+    """
+    Same as process.attach_logger, but the stream is read by the asyncio event loop instead of a thread of its own.
+    """
+    loop_thread = get_event_loop_thread()
+    loop = loop_thread.loop  # type: Any
+
+    def connect() -> None:
+        loop.create_task(loop.connect_read_pipe(lambda: LineLoggerProtocol(log_callback), stream))
+
+    loop_thread.call_soon(connect)
+
+
+def send_request_async(client: Any, request: Request, timeout: Optional[float] = None) -> Any:
+    """
+    Sends a request with client, and returns an asyncio future for its result that lives on the shared event loop.
+
+    Coroutines on that loop can await the future. It fails with a protocol Error when the server returns an error or
+    when the timeout expires. Cancelling the future, or letting it time out, sends $/cancelRequest to the server.
+    """
+    loop = get_event_loop_thread().loop
+    future = asyncio.Future(loop=loop)  # type: Any
+
+    def resolve(result: Any) -> None:
+        if not future.done():
+            future.set_result(result)
+
+    def reject(error: Optional[Any]) -> None:
+        if future.done():
+            return
+        if isinstance(error, dict):
+            future.set_exception(Error(error.get("code", ErrorCode.InternalError), error.get("message", ""),
+                                       error.get("data")))
+        else:
+            future.set_exception(Error(ErrorCode.InternalError, "unable to send {}".format(request.method)))
+
+    # The future reports errors, so the client doesn't need to display them.
+    promise = client.send_request(request, error_handler=lambda error: None)
+    promise.then(lambda result: loop.call_soon_threadsafe(resolve, result),
+                 lambda error: loop.call_soon_threadsafe(reject, error))
+    if promise.request_id is None:
+        return future
+
+    def expire() -> None:
+        if not future.done():
+            future.set_exception(Error(ErrorCode.Timeout, "timeout on {}".format(request.method)))
+            promise.cancel()
+
+    def on_done(_: Any) -> None:
+        if future.cancelled():
+            promise.cancel()
+
+    def watch() -> None:
+        future.add_done_callback(on_done)
+        if timeout is not None:
+            handle = loop.call_later(timeout, expire)
+            future.add_done_callback(lambda _: handle.cancel())
+
+    loop.call_soon_threadsafe(watch)
+    return future
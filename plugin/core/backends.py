@@ -0,0 +1,55 @@
+from .aio import AsyncioTransport, asyncio_available, asyncio_pipes_available
+from .aio import attach_logger as asyncio_attach_logger
+from .reactor import ReactorTransport, reactor_available
+from .reactor import attach_logger as reactor_attach_logger
+from .transports import StdioTransport, TCPTransport, Transport
+from .types import Settings
+from .typing import Any, Callable, IO, Optional
+import subprocess
+
+
+BACKEND_THREADS = "threads"
+BACKEND_REACTOR = "reactor"
+BACKEND_ASYNCIO = "asyncio"
+
+
+def io_backend(settings: Settings, pipes: bool) -> str:
+    """
+    Returns the I/O backend that services the transports of language servers, falling back to threads when the
+    configured backend isn't available here. Pipes is whether the backend must be able to service pipes.
+    """
+    if settings.io_backend == BACKEND_REACTOR and reactor_available():
+        return BACKEND_REACTOR
+    if settings.io_backend == BACKEND_ASYNCIO and (asyncio_pipes_available() if pipes else asyncio_available()):
+        return BACKEND_ASYNCIO
+    return BACKEND_THREADS
+
+
+def create_stdio_transport(process: subprocess.Popen, settings: Settings) -> Transport:
+    backend = io_backend(settings, pipes=True)
+    if backend == BACKEND_REACTOR:
+        return ReactorTransport.for_process(process)
+    elif backend == BACKEND_ASYNCIO:
+        return AsyncioTransport.for_process(process)
+    return StdioTransport(process)
+
+
+def create_socket_transport(sock: Any, settings: Settings) -> Transport:
+    backend = io_backend(settings, pipes=False)
+    if backend == BACKEND_REACTOR:
+        return ReactorTransport.for_socket(sock)
+    elif backend == BACKEND_ASYNCIO:
+        return AsyncioTransport.for_socket(sock)
+    return TCPTransport(sock)
+
+
+def stderr_logger(settings: Settings) -> Optional[Callable[[subprocess.Popen, IO[Any], Callable[[str], None]], None]]:
+    """
+    Returns how the stderr of a language server is logged, None means by a thread of its own.
+    """
+    backend = io_backend(settings, pipes=True)
+    if backend == BACKEND_REACTOR:
+        return reactor_attach_logger
+    elif backend == BACKEND_ASYNCIO:
+        return asyncio_attach_logger
+    return None
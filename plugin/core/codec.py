@@ -0,0 +1,242 @@
+from .typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+import json
+import re
+
+try:
+    import orjson as fast_json
+except ImportError:
+    try:
+        import ujson as fast_json  # type: ignore
+    except ImportError:
+        fast_json = None  # type: ignore
+
+
+# Strings longer than this are escaped piece by piece while they are written, instead of all at once.
+STREAMING_THRESHOLD = 256 * 1024
+STREAMING_CHUNK_SIZE = 64 * 1024
+
+
+def format_request(payload: Dict[str, Any]) -> str:
+    """Converts the request into json"""
+    return json.dumps(payload, sort_keys=False, check_circular=False, separators=(',', ':'))
+
+
+def decode(message: str) -> Any:
+    """
+    Decodes JSON text with the fastest backend that is importable, raises ValueError for malformed JSON.
+    """
+    if fast_json is not None:
+        return fast_json.loads(message)
+    return json.loads(message)
+
+
+# A member of a JSON-RPC message, in the order the object is read. Other keys, like "result", end the peek.
+_MEMBER = re.compile(r'\s*[{,]\s*"(jsonrpc|id|method|params)"\s*:\s*')
+# The start of a response to one of our requests, whose IDs are always integers.
+_RESPONSE_ID = re.compile(r'\s*\{\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?"id"\s*:\s*(\d+)\s*,\s*"(?:result|error)"\s*:')
+# The start of a response whose result is an array; the match ends right before the array.
+_ARRAY_RESULT = re.compile(r'\s*\{\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?"id"\s*:\s*(\d+)\s*,'
+                           r'\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?"result"\s*:\s*(?=\[)')
+_END = re.compile(r'\s*\}')
+_WHITESPACE = re.compile(r'\s*')
+_ELEMENT_END = re.compile(r'\s*([,\]])')
+_CLOSERS = {"{": "}", "[": "]"}
+_decoder = json.JSONDecoder()
+
+
+class PeekedMessage(object):
+    """
+    The id and method of a JSON-RPC request or notification, with its params still undecoded.
+    """
+
+    __slots__ = ('has_id', 'id', 'method', '_params')
+
+    def __init__(self, has_id: bool, request_id: Any, method: str, params: Optional[str]) -> None:
+        self.has_id = has_id
+        self.id = request_id
+        self.method = method
+        self._params = params
+
+    def params(self) -> Any:
+        return None if self._params is None else decode(self._params)
+
+
+def peek_message(message: str) -> Optional[PeekedMessage]:
+    """
+    Reads the id and method of message without decoding its params.
+
+    Returns None when that can't be done cheaply, for example for responses, or when "params" comes before "id" or
+    "method". The caller decodes the whole message then.
+    """
+    members = {}  # type: Dict[str, Any]
+    params = None  # type: Optional[str]
+    position = 0
+    while True:
+        match = _MEMBER.match(message, position)
+        if match is None:
+            if _END.match(message, position) is None:
+                return None
+            break
+        key = match.group(1)
+        if key == "params":
+            closer = _CLOSERS.get(message[match.end():match.end() + 1])
+            # JSON-RPC messages have no other members that could be objects or arrays, so when params closes right
+            # before the message does, params is its last member.
+            rest = message.rstrip()
+            if closer is None or not rest.endswith("}"):
+                return None
+            rest = rest[:-1].rstrip()
+            if not rest.endswith(closer):
+                return None
+            params = message[match.end():len(rest)]
+            break
+        try:
+            members[key], position = _decoder.raw_decode(message, match.end())
+        except ValueError:
+            return None
+    method = members.get("method")
+    if not isinstance(method, str):
+        return None
+    return PeekedMessage("id" in members, members.get("id"), method, params)
+
+
+def peek_response_id(message: str) -> Optional[int]:
+    """
+    Returns the ID of a response without decoding it, or None when message doesn't start like a response.
+    """
+    match = _RESPONSE_ID.match(message)
+    return int(match.group(1)) if match else None
+
+
+def encode_payload(payload: Dict[str, Any]) -> Tuple[bytes, Union[bytes, 'StreamingBody']]:
+    """
+    Returns the header and the body of the message for payload.
+
+    Payloads that hold a large string, like the content of a document in didOpen and didChange, get a StreamingBody,
+    so that neither the JSON text nor the bytes of the whole message ever exist at once.
+    """
+    if contains_large_string(payload):
+        body = StreamingBody(payload)  # type: Union[bytes, StreamingBody]
+    else:
+        body = format_request(payload).encode("UTF-8")
+    return "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii"), body
+
+
+def contains_large_string(value: Any) -> bool:
+    if isinstance(value, str):
+        return len(value) > STREAMING_THRESHOLD
+    elif isinstance(value, dict):
+        return any(contains_large_string(v) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        return any(contains_large_string(v) for v in value)
+    return False
+
+
+class StreamingBody(object):
+    """
+    A JSON message body that is encoded into chunks, which are written one at a time.
+
+    The length for the Content-Length header is counted in a first pass over the chunks, which drops each of them
+    once it is counted, and the chunks are encoded again while they are written. At most one chunk is held at a
+    time, at the cost of encoding the body twice.
+    """
+
+    __slots__ = ('_payload', '_length')
+
+    def __init__(self, payload: Dict[str, Any]) -> None:
+        self._payload = payload
+        self._length = sum(len(chunk) for chunk in _encode_chunks(payload))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def chunks(self) -> Iterator[bytes]:
+        return _encode_chunks(self._payload)
+
+
+def _encode_chunks(payload: Dict[str, Any]) -> Iterator[bytes]:
+    pending = []  # type: List[str]
+    pending_size = 0
+    for fragment in _iter_fragments(payload):
+        pending.append(fragment)
+        pending_size += len(fragment)
+        if pending_size >= STREAMING_CHUNK_SIZE:
+            yield "".join(pending).encode("UTF-8")
+            pending = []
+            pending_size = 0
+    if pending:
+        yield "".join(pending).encode("UTF-8")
+
+
+def _iter_fragments(value: Any) -> Iterator[str]:
+    """
+    Yields the JSON text of value in fragments, compatible with format_request.
+    """
+    if isinstance(value, (dict, list, tuple)) and not contains_large_string(value):
+        yield json.dumps(value, check_circular=False, separators=(',', ':'))
+    elif isinstance(value, str):
+        if len(value) <= STREAMING_THRESHOLD:
+            yield json.dumps(value)
+            return
+        yield '"'
+        for start in range(0, len(value), STREAMING_CHUNK_SIZE):
+            # Slicing a str never splits a code point, so every piece can be escaped on its own.
+            yield json.dumps(value[start:start + STREAMING_CHUNK_SIZE])[1:-1]
+        yield '"'
+    elif isinstance(value, dict):
+        yield "{"
+        separator = ""
+        for key, item in value.items():
+            yield separator
+            yield json.dumps(str(key))
+            yield ":"
+            for fragment in _iter_fragments(item):
+                yield fragment
+            separator = ","
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "["
+        separator = ""
+        for item in value:
+            yield separator
+            for fragment in _iter_fragments(item):
+                yield fragment
+            separator = ","
+        yield "]"
+    else:
+        yield json.dumps(value, check_circular=False, separators=(',', ':'))
+
+
+def peek_array_response(message: str) -> Optional[Tuple[int, int]]:
+    """
+    Returns the ID of a response whose result is an array, and the position where that array starts in message,
+    without decoding it. Returns None for other messages.
+    """
+    match = _ARRAY_RESULT.match(message)
+    return (int(match.group(1)), match.end()) if match else None
+
+
+def iter_array(text: str, position: int) -> Iterator[Any]:
+    """
+    Decodes the elements of the JSON array that starts at position in text, one at a time, so that each can be used
+    before the next is decoded. Raises ValueError for malformed JSON, once the elements before it are yielded.
+    """
+    if not text.startswith("[", position):
+        raise ValueError("expected an array at {}".format(position))
+    position = _skip_whitespace(text, position + 1)
+    if text.startswith("]", position):
+        return
+    while True:
+        value, position = _decoder.raw_decode(text, position)
+        yield value
+        match = _ELEMENT_END.match(text, position)
+        if match is None:
+            raise ValueError("expected ',' or ']' at {}".format(position))
+        if match.group(1) == "]":
+            return
+        position = _skip_whitespace(text, match.end())
+
+
+def _skip_whitespace(text: str, position: int) -> int:
+    match = _WHITESPACE.match(text, position)
+    return match.end() if match else position
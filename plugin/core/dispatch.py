@@ -0,0 +1,125 @@
+from .logging import exception_log
+from .typing import Callable, List, Optional
+from abc import ABCMeta, abstractmethod
+from collections import deque
+import threading
+
+
+DISPATCH_WORKERS = 4
+# A serial queue runs at most this many tasks before it lets the other queues of its pool have a worker.
+DISPATCH_BATCH = 16
+
+
+class TaskQueue(metaclass=ABCMeta):
+
+    @abstractmethod
+    def submit(self, task: Callable[[], None]) -> None:
+        pass
+
+    @abstractmethod
+    def qsize(self) -> int:
+        """
+        Returns the number of tasks that were submitted but didn't start yet.
+        """
+        pass
+
+
+class SerialQueue(TaskQueue):
+    """
+    Runs tasks one at a time, in the order they were submitted, on the workers of a DispatchPool. Tasks of different
+    queues run in parallel.
+    """
+
+    def __init__(self, pool: 'DispatchPool') -> None:
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._tasks = deque()  # type: deque
+        self._scheduled = False
+
+    def submit(self, task: Callable[[], None]) -> None:
+        with self._lock:
+            self._tasks.append(task)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._pool._schedule(self)
+
+    def qsize(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def _run(self) -> None:
+        for _ in range(DISPATCH_BATCH):
+            with self._lock:
+                if not self._tasks:
+                    self._scheduled = False
+                    return
+                task = self._tasks.popleft()
+            try:
+                task()
+            except Exception as ex:
+                exception_log("Error in dispatched task", ex)
+        with self._lock:
+            if not self._tasks:
+                self._scheduled = False
+                return
+        self._pool._schedule(self)
+
+
+class InlineQueue(TaskQueue):
+    """
+    Runs tasks right away on the thread that submits them.
+    """
+
+    def submit(self, task: Callable[[], None]) -> None:
+        task()
+
+    def qsize(self) -> int:
+        return 0
+
+
+class DispatchPool(object):
+    """
+    A few worker threads that run the tasks of serial queues. Workers are started on first use and never stop; they
+    are daemon threads.
+    """
+
+    def __init__(self, workers: int = DISPATCH_WORKERS) -> None:
+        self._size = workers
+        self._workers = []  # type: List[threading.Thread]
+        self._ready = deque()  # type: deque
+        self._condition = threading.Condition()
+
+    def serial(self) -> SerialQueue:
+        return SerialQueue(self)
+
+    def _schedule(self, queue: SerialQueue) -> None:
+        with self._condition:
+            self._ready.append(queue)
+            if len(self._workers) < self._size:
+                worker = threading.Thread(target=self._work, name="LSP dispatch {}".format(len(self._workers)))
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+            else:
+                self._condition.notify()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready:
+                    self._condition.wait()
+                queue = self._ready.popleft()
+            queue._run()
+
+
+_shared_pool = None  # type: Optional[DispatchPool]
+_shared_pool_lock = threading.Lock()
+
+
+def shared_pool() -> DispatchPool:
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = DispatchPool()
+        return _shared_pool
@@ -80,6 +80,10 @@ class DocumentSyncListener(LSPViewEventListener):
         self.manager.documents.handle_did_save(self.view)
 
     def on_close(self) -> None:
-        if self.view.file_name() and self.view.is_primary() and self.has_manager():
+        if not self.has_manager():
+            return
+        # Every view cancels its own requests, clones included.
+        self.manager.cancel_view_requests(self.view)
+        if self.view.file_name() and self.view.is_primary():
             self.manager.handle_view_closed(self.view)
             self.manager.documents.handle_did_close(self.view)
@@ -0,0 +1,74 @@
+from .typing import Callable, List, Tuple
+from collections import deque
+import threading
+import time
+
+
+# The server panel only keeps this many lines anyway.
+LOG_BUFFER_CAPACITY = 500
+# Lines a server may log per second, on average, after a burst of as many lines.
+LOG_RATE_LIMIT = 200
+LOG_FLUSH_INTERVAL_MS = 100
+
+
+class LogBuffer(object):
+    """
+    Collects the log lines of a server, and hands them to flush in batches.
+
+    Logging never blocks the thread that logs, and a chatty server can't flood the UI: lines beyond the rate limit
+    are dropped, and when the buffer is full the oldest lines make room. Dropped lines are counted, and the number of
+    lines dropped since the previous batch is reported at its end.
+    """
+
+    def __init__(self,
+                 flush: Callable[[List[Tuple[str, str]]], None],
+                 schedule: Callable[[Callable[[], None], int], None],
+                 capacity: int = LOG_BUFFER_CAPACITY,
+                 rate_limit: float = LOG_RATE_LIMIT,
+                 flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS) -> None:
+        self._flush = flush
+        self._schedule = schedule
+        self._flush_interval_ms = flush_interval_ms
+        self._lines = deque(maxlen=capacity)  # type: deque
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+        self._rate_limit = rate_limit
+        self._burst = max(1.0, rate_limit)
+        self._tokens = self._burst
+        self._last_refill = time.monotonic()
+        self._unreported = 0
+        self._last_prefix = ""
+        self.rate_limited = 0  # lines that were dropped because they came in too fast
+        self.overflowed = 0  # lines that were dropped because the buffer was full
+
+    def append(self, prefix: str, message: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate_limit)
+            self._last_refill = now
+            self._last_prefix = prefix
+            if self._tokens < 1:
+                self.rate_limited += 1
+                self._unreported += 1
+            else:
+                self._tokens -= 1
+                if len(self._lines) == self._lines.maxlen:
+                    self.overflowed += 1
+                    self._unreported += 1
+                self._lines.append((prefix, message))
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self._schedule(self.flush, self._flush_interval_ms)
+
+    def flush(self) -> None:
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            dropped = self._unreported
+            self._unreported = 0
+            self._flush_scheduled = False
+            if dropped:
+                lines.append((self._last_prefix, "({} log lines were dropped)".format(dropped)))
+        if lines:
+            self._flush(lines)
@@ -5,6 +5,7 @@ from ..diagnostics import DiagnosticsPresenter
 from ..highlights import remove_highlights
 from .logging import set_debug_logging, set_exception_logging
 from .panels import destroy_output_panels, ensure_panel, PanelName
+from .pool import servers
 from .popups import popups
 from .registry import windows, load_handlers, unload_sessions
 from .settings import settings, load_settings, unload_settings
@@ -32,6 +33,7 @@ def shutdown() -> None:
     # Also needs to handle package being disabled or removed
     # https://github.com/sublimelsp/LSP/issues/375
     unload_settings()
+    servers.close()
 
     for window in sublime.windows():
         unload_sessions(window)  # unloads view state from document sync and diagnostics
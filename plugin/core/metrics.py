@@ -0,0 +1,177 @@
+from .typing import Any, Dict, List, Optional
+import threading
+
+
+# Upper bounds of the latency histogram buckets, in milliseconds. The last bucket takes everything slower.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram(object):
+    """
+    Counts durations in fixed buckets, so that recording one is cheap and the memory it takes is constant.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, milliseconds: float) -> None:
+        index = 0
+        while index < len(LATENCY_BUCKETS_MS) and milliseconds > LATENCY_BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Returns the upper bound of the bucket that holds the given fraction of durations, or None when there are none.
+        """
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else self.maximum
+        return self.maximum
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.maximum if self.count else None,
+            "buckets_ms": dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ["inf"], self.counts))
+        }
+
+
+class MethodMetrics(object):
+
+    __slots__ = ('sent', 'received', 'responses', 'errors', 'timeouts', 'bytes_out', 'bytes_in', 'time_to_first_byte',
+                 'time_to_response', 'dispatch_wait', 'handler_time')
+
+    def __init__(self) -> None:
+        self.sent = 0  # requests and notifications to the server
+        self.received = 0  # requests and notifications from the server
+        self.responses = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.time_to_first_byte = Histogram()
+        self.time_to_response = Histogram()
+        self.dispatch_wait = Histogram()
+        self.handler_time = Histogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "responses": self.responses,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "time_to_first_byte": self.time_to_first_byte.to_dict(),
+            "time_to_response": self.time_to_response.to_dict(),
+            "dispatch_wait": self.dispatch_wait.to_dict(),
+            "handler_time": self.handler_time.to_dict()
+        }
+
+
+class RpcMetrics(object):
+    """
+    Counters and latency histograms of the messages that a client exchanges with its server, per method.
+
+    Sizes are the bytes of the JSON bodies. The time to first byte runs from queueing a request until the first byte
+    of its response arrives, the time to response until the response is read in full, and the dispatch wait from
+    reading a message until its handler starts.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._methods = {}  # type: Dict[str, MethodMetrics]
+
+    def _method(self, method: str) -> MethodMetrics:
+        metrics = self._methods.get(method)
+        if metrics is None:
+            metrics = self._methods[method] = MethodMetrics()
+        return metrics
+
+    def sent(self, method: str, size: int) -> None:
+        with self._lock:
+            metrics = self._method(method)
+            metrics.sent += 1
+            metrics.bytes_out += size
+
+    def received(self, method: str, size: int) -> None:
+        with self._lock:
+            metrics = self._method(method)
+            metrics.received += 1
+            metrics.bytes_in += size
+
+    def response(self, method: str, seconds: float, size: int, is_error: bool,
+                 first_byte_seconds: Optional[float] = None) -> None:
+        with self._lock:
+            metrics = self._method(method)
+            metrics.responses += 1
+            metrics.bytes_in += size
+            if is_error:
+                metrics.errors += 1
+            if first_byte_seconds is not None:
+                metrics.time_to_first_byte.record(first_byte_seconds * 1000)
+            metrics.time_to_response.record(seconds * 1000)
+
+    def timed_out(self, method: str) -> None:
+        with self._lock:
+            self._method(method).timeouts += 1
+
+    def waited(self, method: str, seconds: float) -> None:
+        with self._lock:
+            self._method(method).dispatch_wait.record(seconds * 1000)
+
+    def handled(self, method: str, seconds: float) -> None:
+        with self._lock:
+            self._method(method).handler_time.record(seconds * 1000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {method: metrics.to_dict() for method, metrics in sorted(self._methods.items())}
+
+
+def format_metrics_table(metrics_by_server: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Formats the metrics of every server as a plain text table. The metrics of a server are the to_dict() of its
+    RpcMetrics under "methods", and gauges such as "pending_requests" next to it.
+    """
+    columns = "{:<40}{:>8}{:>8}{:>8}{:>8}{:>8}{:>12}{:>12}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}"
+    lines = []  # type: List[str]
+    for server, server_metrics in sorted(metrics_by_server.items()):
+        methods = server_metrics["methods"]
+        gauges = ["{}: {}".format(name.replace("_", " "), value)
+                  for name, value in sorted(server_metrics.items()) if name != "methods"]
+        lines.append("{} ({})".format(server, ", ".join(gauges)) if gauges else server)
+        lines.append(columns.format("method", "sent", "recv", "resp", "errors", "timeout", "bytes out", "bytes in",
+                                    "ttfb p50", "p50 ms", "p99 ms", "wait p99", "hdl p50", "hdl p99"))
+        for method, metrics in methods.items():
+            lines.append(columns.format(
+                method, metrics["sent"], metrics["received"], metrics["responses"], metrics["errors"],
+                metrics["timeouts"], metrics["bytes_out"], metrics["bytes_in"],
+                _format_ms(metrics["time_to_first_byte"]["p50_ms"]),
+                _format_ms(metrics["time_to_response"]["p50_ms"]), _format_ms(metrics["time_to_response"]["p99_ms"]),
+                _format_ms(metrics["dispatch_wait"]["p99_ms"]),
+                _format_ms(metrics["handler_time"]["p50_ms"]), _format_ms(metrics["handler_time"]["p99_ms"])))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _format_ms(value: Optional[float]) -> str:
+    return "-" if value is None else "{:g}".format(value)
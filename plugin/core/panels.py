@@ -107,18 +107,19 @@ class LspUpdatePanelCommand(sublime_plugin.TextCommand):
 
 
 class LspUpdateServerPanelCommand(sublime_plugin.TextCommand):
-    def run(self, edit: sublime.Edit, prefix: str, message: str) -> None:
+    def run(self, edit: sublime.Edit, prefix: str = "", message: str = "",
+            messages: Optional[List[List[str]]] = None) -> None:
+        """
+        Appends a message, or a batch of [prefix, message] pairs, to the panel, and trims the oldest lines.
+        """
+        if messages is None:
+            messages = [[prefix, message]]
+        text = "".join("{}: {}\n".format(p, m) for p, m in messages)
         with mutable(self.view):
-            message = message.replace("\r\n", "\n")  # normalize Windows eol
-            self.view.insert(edit, self.view.size(), "{}: {}\n".format(prefix, message))
+            text = text.replace("\r\n", "\n")  # normalize Windows eol
+            self.view.insert(edit, self.view.size(), text)
             total_lines, _ = self.view.rowcol(self.view.size())
-            point = 0  # Starting from point 0 in the panel ...
-            regions = []  # type: List[sublime.Region]
-            for _ in range(0, max(0, total_lines - SERVER_PANEL_MAX_LINES)):
-                # ... collect all regions that span an entire line ...
-                region = self.view.full_line(point)
-                regions.append(region)
-                point = region.b
-            for region in reversed(regions):
-                # ... and erase them in reverse order
-                self.view.erase(edit, region)
+            if total_lines > SERVER_PANEL_MAX_LINES:
+                # Erase all surplus lines at once.
+                end = self.view.text_point(total_lines - SERVER_PANEL_MAX_LINES, 0)
+                self.view.erase(edit, sublime.Region(0, end))
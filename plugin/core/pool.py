@@ -0,0 +1,149 @@
+from .logging import debug, exception_log
+from .process import attach_logger, spawn_server
+from .rpc import try_terminate_process
+from .typing import Any, Callable, Dict, IO, List, Optional, Set, Tuple
+import subprocess
+import threading
+import time
+
+
+# Processes that are spawned for the same command line, environment and working directory are interchangeable.
+PoolKey = Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...], Optional[str], bool]
+
+
+def pool_key(args: List[str], working_dir: Optional[str], env: Dict[str, str], pipe_stderr: bool) -> PoolKey:
+    return tuple(args), tuple(sorted(env.items())), working_dir, pipe_stderr
+
+
+class ServerPool(object):
+    """
+    Language server processes that are spawned ahead of time, so that starting a session doesn't wait for the
+    process to start.
+
+    A process started for a command line, environment and working directory is replaced in the background by a new
+    one, which waits, before initialize, for the next session that starts with the same ones. Processes that wait
+    longer than the idle timeout are terminated.
+    """
+
+    def __init__(self,
+                 spawn: Callable[[List[str], Optional[str], Dict[str, str], bool], subprocess.Popen] = spawn_server,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._spawn = spawn
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._idle = {}  # type: Dict[PoolKey, List[Tuple[float, subprocess.Popen]]]
+        self._refilling = set()  # type: Set[PoolKey]
+        self._sweep_timer = None  # type: Optional[threading.Timer]
+        self._closed = False
+
+    def start(self,
+              args: List[str],
+              working_dir: Optional[str],
+              env: Dict[str, str],
+              on_stderr_log: Optional[Callable[[str], None]],
+              stderr_logger: Optional[Callable[[subprocess.Popen, IO[Any], Callable[[str], None]], None]],
+              size: int,
+              idle_timeout: float) -> subprocess.Popen:
+        """
+        Returns a process for args, spawned ahead of time if there is one, and keeps size processes like it waiting.
+        """
+        key = pool_key(args, working_dir, env, on_stderr_log is not None)
+        process = self._claim(key, idle_timeout)
+        if process is None:
+            process = self._spawn(args, working_dir, env, on_stderr_log is not None)
+        else:
+            debug("claimed a spawned server", args)
+        if on_stderr_log is not None and process.stderr:
+            (stderr_logger or attach_logger)(process, process.stderr, on_stderr_log)
+        if size > 0:
+            self._refill_soon(key, args, working_dir, env, size, idle_timeout)
+        return process
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return sum(len(processes) for processes in self._idle.values())
+
+    def _claim(self, key: PoolKey, idle_timeout: float) -> Optional[subprocess.Popen]:
+        now = self._clock()
+        with self._lock:
+            processes = self._idle.get(key, [])
+            while processes:
+                spawned, process = processes.pop(0)
+                if process.poll() is None and now - spawned < idle_timeout:
+                    return process
+                try_terminate_process(process)
+        return None
+
+    def _refill_soon(self, key: PoolKey, args: List[str], working_dir: Optional[str], env: Dict[str, str],
+                     size: int, idle_timeout: float) -> None:
+        with self._lock:
+            if self._closed or key in self._refilling:
+                return
+            self._refilling.add(key)
+        thread = threading.Thread(target=self._refill, args=(key, args, working_dir, env, size, idle_timeout),
+                                  name="LSP server pool")
+        thread.daemon = True
+        thread.start()
+
+    def _refill(self, key: PoolKey, args: List[str], working_dir: Optional[str], env: Dict[str, str], size: int,
+                idle_timeout: float) -> None:
+        try:
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle.get(key, [])) >= size:
+                        return
+                process = self._spawn(args, working_dir, env, key[3])
+                with self._lock:
+                    if self._closed:
+                        try_terminate_process(process)
+                        return
+                    self._idle.setdefault(key, []).append((self._clock(), process))
+                    if self._sweep_timer is None:
+                        self._schedule_sweep(idle_timeout)
+        except Exception as ex:
+            exception_log("Error spawning a server for the pool", ex)
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _schedule_sweep(self, idle_timeout: float) -> None:
+        self._sweep_timer = threading.Timer(idle_timeout, lambda: self.sweep(idle_timeout))
+        self._sweep_timer.daemon = True
+        self._sweep_timer.start()
+
+    def sweep(self, idle_timeout: float) -> None:
+        """
+        Terminates the processes that waited longer than idle_timeout seconds, or that exited.
+        """
+        now = self._clock()
+        with self._lock:
+            for key, processes in list(self._idle.items()):
+                for entry in list(processes):
+                    spawned, process = entry
+                    if process.poll() is not None or now - spawned >= idle_timeout:
+                        processes.remove(entry)
+                        try_terminate_process(process)
+                if not processes:
+                    del self._idle[key]
+            if self._idle and not self._closed:
+                self._schedule_sweep(idle_timeout)
+            else:
+                self._sweep_timer = None
+
+    def close(self) -> None:
+        """
+        Terminates every waiting process, and stops spawning new ones.
+        """
+        with self._lock:
+            self._closed = True
+            if self._sweep_timer:
+                self._sweep_timer.cancel()
+                self._sweep_timer = None
+            idle = self._idle
+            self._idle = {}
+        for processes in idle.values():
+            for _, process in processes:
+                try_terminate_process(process)
+
+
+servers = ServerPool()
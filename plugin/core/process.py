@@ -31,8 +31,24 @@ def start_server(
     server_binary_args: List[str],
     working_dir: Optional[str],
     env: Dict[str, str],
-    on_stderr_log: Optional[Callable[[str], None]]
+    on_stderr_log: Optional[Callable[[str], None]],
+    stderr_logger: Optional[Callable[[subprocess.Popen, IO[Any], Callable[[str], None]], None]] = None
 ) -> Optional[subprocess.Popen]:
+    process = spawn_server(server_binary_args, working_dir, env, on_stderr_log is not None)
+    if on_stderr_log is not None and process.stderr:
+        (stderr_logger or attach_logger)(process, process.stderr, on_stderr_log)
+    return process
+
+
+def spawn_server(
+    server_binary_args: List[str],
+    working_dir: Optional[str],
+    env: Dict[str, str],
+    pipe_stderr: bool
+) -> subprocess.Popen:
+    """
+    Starts a server process, without reading its stderr yet when that is piped.
+    """
     si = None
     if os.name == "nt":
         server_binary_args = add_extension_if_missing(server_binary_args)
@@ -41,22 +57,15 @@ def start_server(
 
     debug("starting " + str(server_binary_args))
 
-    stderr_destination = subprocess.PIPE if on_stderr_log else subprocess.DEVNULL
-
-    process = subprocess.Popen(
+    return subprocess.Popen(
         server_binary_args,
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
-        stderr=stderr_destination,
+        stderr=subprocess.PIPE if pipe_stderr else subprocess.DEVNULL,
         cwd=working_dir,
         env=env,
         startupinfo=si)
 
-    if on_stderr_log is not None:
-        attach_logger(process, process.stderr, on_stderr_log)
-
-    return process
-
 
 def attach_logger(process: subprocess.Popen, stream: IO[Any], log_callback: Callable[[str], None]) -> None:
     threading.Thread(target=log_stream, args=(process, stream, log_callback)).start()
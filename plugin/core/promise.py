@@ -0,0 +1,163 @@
+from .protocol import ErrorCode
+from .typing import Any, Callable, Iterable, List, Optional, Tuple
+import threading
+
+
+PENDING = 0
+RESOLVED = 1
+REJECTED = 2
+
+
+class Promise(object):
+    """
+    A value that may not be there yet, like the response to a request.
+
+    A promise is settled once, by either resolve or reject; later calls are ignored. Callbacks run on the thread that
+    settles the promise, or right away when it is settled already. Rejection values are whatever the producer
+    rejects with; for requests that is the error of the response, a dict with "code" and "message".
+    """
+
+    __slots__ = ('_lock', '_state', '_value', '_callbacks')
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state = PENDING
+        self._value = None  # type: Any
+        self._callbacks = []  # type: List[Tuple[Callable[[Any], Any], Callable[[Any], Any]]]
+
+    @classmethod
+    def resolved(cls, value: Any) -> 'Promise':
+        promise = cls()
+        promise.resolve(value)
+        return promise
+
+    @classmethod
+    def rejected(cls, error: Any) -> 'Promise':
+        promise = cls()
+        promise.reject(error)
+        return promise
+
+    def done(self) -> bool:
+        return self._state != PENDING
+
+    def resolve(self, value: Any) -> bool:
+        return self._settle(RESOLVED, value)
+
+    def reject(self, error: Any) -> bool:
+        return self._settle(REJECTED, error)
+
+    def _settle(self, state: int, value: Any) -> bool:
+        with self._lock:
+            if self._state != PENDING:
+                return False
+            self._state = state
+            self._value = value
+            callbacks = self._callbacks
+            self._callbacks = []
+        for on_resolved, on_rejected in callbacks:
+            (on_resolved if state == RESOLVED else on_rejected)(value)
+        return True
+
+    def _subscribe(self, on_resolved: Callable[[Any], Any], on_rejected: Callable[[Any], Any]) -> None:
+        with self._lock:
+            if self._state == PENDING:
+                self._callbacks.append((on_resolved, on_rejected))
+                return
+        (on_resolved if self._state == RESOLVED else on_rejected)(self._value)
+
+    def then(self,
+             on_resolved: Optional[Callable[[Any], Any]] = None,
+             on_rejected: Optional[Callable[[Any], Any]] = None) -> 'Promise':
+        """
+        Returns a promise of what on_resolved or on_rejected return, or of the same outcome when they're None.
+
+        When a callback returns a promise, the returned promise follows it. When a callback raises, the returned
+        promise is rejected with the exception.
+        """
+        chained = Promise()
+
+        def call(callback: Optional[Callable[[Any], Any]], settle: Callable[[Any], bool], value: Any) -> None:
+            if callback is None:
+                settle(value)
+                return
+            try:
+                result = callback(value)
+            except Exception as ex:
+                chained.reject(ex)
+                return
+            if isinstance(result, Promise):
+                result._subscribe(chained.resolve, chained.reject)
+            else:
+                chained.resolve(result)
+
+        self._subscribe(lambda value: call(on_resolved, chained.resolve, value),
+                        lambda error: call(on_rejected, chained.reject, error))
+        return chained
+
+    def with_timeout(self, timeout: float) -> 'Promise':
+        """
+        Returns a promise with the same outcome, unless that takes longer than timeout seconds: then it is rejected
+        with a timeout error. This promise itself is not affected.
+        """
+        bounded = Promise()
+        error = {"code": ErrorCode.Timeout, "message": "timeout after {}s".format(timeout)}
+        timer = threading.Timer(timeout, lambda: bounded.reject(error))
+        timer.daemon = True
+
+        def finish(settle: Callable[[Any], bool], value: Any) -> None:
+            timer.cancel()
+            settle(value)
+
+        self._subscribe(lambda value: finish(bounded.resolve, value), lambda error: finish(bounded.reject, error))
+        if not bounded.done():
+            timer.start()
+        return bounded
+
+    @staticmethod
+    def all(promises: Iterable['Promise']) -> 'Promise':
+        """
+        Returns a promise of the list of values of promises, or of the first rejection among them.
+        """
+        promises = list(promises)
+        combined = Promise()
+        values = [None] * len(promises)  # type: List[Any]
+        remaining = [len(promises)]
+        lock = threading.Lock()
+
+        def on_resolved(index: int, value: Any) -> None:
+            with lock:
+                values[index] = value
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            combined.resolve(values)
+
+        for index, promise in enumerate(promises):
+            promise._subscribe(lambda value, index=index: on_resolved(index, value), combined.reject)  # type: ignore
+        if not promises:
+            combined.resolve(values)
+        return combined
+
+    @staticmethod
+    def any(promises: Iterable['Promise']) -> 'Promise':
+        """
+        Returns a promise of the first value among promises. When they're all rejected, so is the returned promise,
+        with the last rejection.
+        """
+        promises = list(promises)
+        combined = Promise()
+        remaining = [len(promises)]
+        lock = threading.Lock()
+
+        def on_rejected(error: Any) -> None:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            combined.reject(error)
+
+        for promise in promises:
+            promise._subscribe(combined.resolve, on_rejected)
+        if not promises:
+            combined.reject({"code": ErrorCode.InvalidParams, "message": "no promises"})
+        return combined
@@ -208,6 +208,7 @@ class ErrorCode:
 
     # Defined by us
     Timeout = -40000
+    ServerBusy = -40001
 
 
 class Error(Exception):
@@ -292,6 +293,10 @@ class Notification:
     def exit(cls) -> 'Notification':
         return Notification("exit")
 
+    @classmethod
+    def cancelRequest(cls, params: dict) -> 'Notification':
+        return Notification("$/cancelRequest", params)
+
     def __repr__(self) -> str:
         return self.method + " " + str(self.params)
 
@@ -0,0 +1,356 @@
+from .codec import StreamingBody
+from .logging import debug, exception_log
+from .transports import ContentLengthFramer, SendQueue, Transport, MAX_COALESCED_MESSAGES
+from .transports import encode_message
+from .typing import Any, Callable, Dict, IO, List, Optional
+from collections import deque
+from queue import Empty
+import os
+import subprocess
+import threading
+
+try:
+    import fcntl
+    import selectors
+except ImportError:
+    # Python 3.3 (Sublime Text 3) has no selectors module, and Windows can't select on pipes.
+    fcntl = None  # type: ignore
+    selectors = None  # type: ignore
+
+
+READ_EVENT = 1  # selectors.EVENT_READ
+WRITE_EVENT = 2  # selectors.EVENT_WRITE
+STDERR_CHUNK_SIZE = 4096
+
+
+def reactor_available() -> bool:
+    return selectors is not None and fcntl is not None
+
+
+def set_non_blocking(fd: int) -> None:
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class IOReactor(object):
+    """
+    Waits on the file descriptors of all sessions from a single thread, and runs their callbacks on that thread.
+
+    The selector is only ever touched from the reactor thread. Other threads hand work to it with call_soon.
+    """
+
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._interests = {}  # type: Dict[int, int]
+        self._calls = deque()  # type: deque
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        set_non_blocking(self._wakeup_read)
+        set_non_blocking(self._wakeup_write)
+        self._selector.register(self._wakeup_read, READ_EVENT, self._drain_wakeup)
+        self._thread = threading.Thread(target=self._run, name="LSP I/O reactor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def call_soon(self, callback: Callable[[], None]) -> None:
+        self._calls.append(callback)
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            pass  # the wakeup pipe is full, so the reactor is about to wake up anyway
+
+    def set_interest(self, fd: int, events: int, callback: Callable[[int], None]) -> None:
+        """
+        Selects on fd for the given events, or stops selecting on fd when events is 0.
+        """
+        current = self._interests.get(fd, 0)
+        if events == current:
+            return
+        if not events:
+            del self._interests[fd]
+            self._selector.unregister(fd)
+        elif current:
+            self._interests[fd] = events
+            self._selector.modify(fd, events, callback)
+        else:
+            self._interests[fd] = events
+            self._selector.register(fd, events, callback)
+
+    def _drain_wakeup(self, events: int) -> None:
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            for key, events in self._selector.select():
+                try:
+                    key.data(events)
+                except Exception as err:
+                    exception_log("Error handling I/O event", err)
+            while self._calls:
+                callback = self._calls.popleft()
+                try:
+                    callback()
+                except Exception as err:
+                    exception_log("Error running I/O reactor callback", err)
+
+
+_reactor = None  # type: Optional[IOReactor]
+_reactor_lock = threading.Lock()
+
+
+def get_reactor() -> IOReactor:
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = IOReactor()
+        return _reactor
+
+
+class PipeChannel(object):
+
+    def __init__(self, reader: IO[Any], writer: IO[Any]) -> None:
+        self._reader = reader
+        self._writer = writer
+        self.read_fd = reader.fileno()
+        self.write_fd = writer.fileno()
+        set_non_blocking(self.read_fd)
+        set_non_blocking(self.write_fd)
+
+    def readinto(self, buffer: memoryview) -> int:
+        return os.readv(self.read_fd, [buffer])
+
+    def writev(self, buffers: List[Any]) -> int:
+        return os.writev(self.write_fd, buffers)
+
+    def close(self) -> None:
+        for stream in (self._writer, self._reader):
+            try:
+                stream.close()
+            except OSError as err:
+                exception_log("Failure closing pipe", err)
+
+
+class SocketChannel(object):
+
+    def __init__(self, sock: Any) -> None:
+        self.socket = sock
+        self.read_fd = self.write_fd = sock.fileno()
+        sock.setblocking(False)
+
+    def readinto(self, buffer: memoryview) -> int:
+        return self.socket.recv_into(buffer)
+
+    def writev(self, buffers: List[Any]) -> int:
+        return self.socket.sendmsg(buffers)
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class ReactorTransport(Transport):
+    """
+    A transport without threads of its own: the shared IOReactor reads and writes its file descriptors.
+    """
+
+    def __init__(self, reactor: IOReactor, channel: Any, process: Optional[subprocess.Popen] = None) -> None:
+        self._reactor = reactor
+        self._channel = channel
+        self._process = process
+        self._queue = SendQueue()
+        # Buffers taken from the queue, and iterators over the chunks of streaming bodies, that were not written yet.
+        # Only the reactor thread touches these.
+        self._outgoing = deque()  # type: deque
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+        self._reading = True
+        self._closed = False
+
+    @classmethod
+    def for_process(cls, process: subprocess.Popen) -> 'ReactorTransport':
+        channel = PipeChannel(process.stdout, process.stdin)  # type: ignore
+        return cls(get_reactor(), channel, process)
+
+    @classmethod
+    def for_socket(cls, sock: Any) -> 'ReactorTransport':
+        return cls(get_reactor(), SocketChannel(sock))
+
+    def start(self, on_receive: Callable[[str], None], on_closed: Callable[[], None]) -> None:
+        self.on_receive = on_receive
+        self.on_closed = on_closed
+        self._framer = ContentLengthFramer(on_receive)
+        self._reactor.call_soon(self._update_interest)
+
+    def send(self, content: str) -> None:
+        self._queue.put(encode_message(content))
+        self._schedule_flush()
+
+    def send_payload(self, payload: Dict[str, Any]) -> int:
+        size = self._queue.put_payload(payload)
+        self._schedule_flush()
+        return size
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _schedule_flush(self) -> None:
+        with self._lock:
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self._reactor.call_soon(self._flush)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)  # tell the writer to stop
+        self._reactor.call_soon(self._release)
+        self.on_closed()
+
+    def _release(self) -> None:
+        # The descriptors are closed only after the selector stopped waiting on them.
+        self._update_interest()
+        self._channel.close()
+
+    def _update_interest(self) -> None:
+        read_events = READ_EVENT if self._reading and not self._closed else 0
+        pending = self._outgoing or self._queue.qsize()
+        write_events = WRITE_EVENT if pending and not self._closed else 0
+        if self._channel.read_fd == self._channel.write_fd:
+            self._reactor.set_interest(self._channel.read_fd, read_events | write_events, self._on_events)
+        else:
+            self._reactor.set_interest(self._channel.read_fd, read_events, self._on_events)
+            self._reactor.set_interest(self._channel.write_fd, write_events, self._on_events)
+
+    def _on_events(self, events: int) -> None:
+        if events & READ_EVENT:
+            self._read()
+        if events & WRITE_EVENT:
+            self._flush()
+
+    def _read(self) -> None:
+        try:
+            received = self._framer.read_from(self._channel.readinto)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            exception_log("Failure reading from server", err)
+            self.close()
+            return
+        if received:
+            self._framer.process()
+        elif self._process:
+            self._handle_process_eof(self._process)
+        else:
+            debug("no data received, closing")
+            self.close()
+
+    def _handle_process_eof(self, process: subprocess.Popen) -> None:
+        pid = process.pid
+        debug("process {} stdout ended".format(pid))
+        self._process = None
+        self._reading = False
+        self._update_interest()
+
+        def wait_for_exit() -> None:
+            # The process must be waited on, or zombie processes may be the result.
+            returncode = process.wait()
+            debug("process {} exited with code {}".format(pid, returncode))
+            if returncode != 0:
+                self.close()
+
+        threading.Thread(target=wait_for_exit).start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._flush_scheduled = False
+        while not self._closed:
+            buffers = self._next_buffers()
+            if not buffers:
+                break
+            try:
+                written = self._channel.writev(buffers)
+            except BlockingIOError:
+                break  # wait until the file descriptor is writable again
+            except OSError as err:
+                exception_log("Failure writing to server", err)
+                self.close()
+                return
+            while written and written >= len(self._outgoing[0]):
+                written -= len(self._outgoing.popleft())
+            if written:
+                self._outgoing[0] = memoryview(self._outgoing[0])[written:]
+                break  # the pipe or socket buffer is full
+        self._update_interest()
+
+    def _next_buffers(self) -> List[Any]:
+        """
+        Returns the buffers to write next. Messages only leave the queue once everything before them was written, so
+        that they can be superseded until then. A streaming body at the front gives one encoded chunk at a time.
+        """
+        if not self._outgoing:
+            for _ in range(MAX_COALESCED_MESSAGES):
+                try:
+                    message = self._queue.get_nowait()
+                except Empty:
+                    break
+                if message is None:
+                    break
+                header, body = message
+                self._outgoing.append(header)
+                self._outgoing.append(body.chunks() if isinstance(body, StreamingBody) else body)
+        while self._outgoing and not isinstance(self._outgoing[0], (bytes, memoryview)):
+            chunk = next(self._outgoing[0], None)
+            if chunk is None:
+                self._outgoing.popleft()
+            else:
+                self._outgoing.appendleft(chunk)
+        buffers = []  # type: List[Any]
+        for buffer in self._outgoing:
+            if len(buffers) == 2 * MAX_COALESCED_MESSAGES or not isinstance(buffer, (bytes, memoryview)):
+                break
+            buffers.append(buffer)
+        return buffers
+
+
+class StderrLogger(object):
+
+    def __init__(self, reactor: IOReactor, stream: IO[Any], log_callback: Callable[[str], None]) -> None:
+        self._reactor = reactor
+        self._stream = stream
+        self._fd = stream.fileno()
+        self._log_callback = log_callback
+        self._pending = b""
+        set_non_blocking(self._fd)
+
+    def start(self) -> None:
+        self._reactor.call_soon(lambda: self._reactor.set_interest(self._fd, READ_EVENT, self._on_events))
+
+    def _on_events(self, events: int) -> None:
+        try:
+            content = os.read(self._fd, STDERR_CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            exception_log("Failure reading stream", err)
+            content = b""
+        if not content:
+            self._reactor.set_interest(self._fd, 0, self._on_events)
+            if self._pending:
+                self._log_callback(self._pending.decode('UTF-8', 'replace').strip())
+            debug("LSP stream logger stopped.")
+            return
+        lines = (self._pending + content).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._log_callback(line.decode('UTF-8', 'replace').strip())
+
+
+def attach_logger(process: subprocess.Popen, stream: IO[Any], log_callback: Callable[[str], None]) -> None:
+    """
+    Same as process.attach_logger, but the stream is read by the I/O reactor instead of a thread of its own.
+    """
+    StderrLogger(get_reactor(), stream, log_callback).start()
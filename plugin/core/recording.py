@@ -0,0 +1,68 @@
+from .codec import format_request
+from .typing import Any, Callable, Dict, IO, List
+import json
+import threading
+import time
+
+
+OUTGOING = "out"
+INCOMING = "in"
+
+
+class TrafficRecorder(object):
+    """
+    Writes the messages that a client exchanges with its server to a JSONL trace, one frame per line:
+
+        {"t": 0.0123, "direction": "out", "message": {...}}
+
+    where t is the number of seconds since recording started, "out" is from the client to the server and "in" from
+    the server to the client. Incoming messages are written as the server sent them, without decoding them; line
+    breaks can only be whitespace outside of strings in JSON, so they're replaced by spaces.
+    """
+
+    def __init__(self, stream: IO[str], clock: Callable[[], float] = time.monotonic) -> None:
+        self._stream = stream
+        self._clock = clock
+        self._started = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str) -> 'TrafficRecorder':
+        return cls(open(path, "w", encoding="UTF-8"))
+
+    def outgoing(self, payload: Dict[str, Any]) -> None:
+        self._write(OUTGOING, format_request(payload))
+
+    def incoming(self, message: str) -> None:
+        self._write(INCOMING, message)
+
+    def _write(self, direction: str, message: str) -> None:
+        with self._lock:
+            if self._stream.closed:
+                return
+            self._stream.write('{{"t":{:.6f},"direction":"{}","message":{}}}\n'.format(
+                self._clock() - self._started, direction, message.strip().replace("\r", " ").replace("\n", " ")))
+
+    def close(self) -> None:
+        with self._lock:
+            self._stream.close()
+
+
+class Frame(object):
+
+    __slots__ = ('timestamp', 'direction', 'message')
+
+    def __init__(self, timestamp: float, direction: str, message: Dict[str, Any]) -> None:
+        self.timestamp = timestamp
+        self.direction = direction
+        self.message = message
+
+
+def load_trace(path: str) -> List[Frame]:
+    frames = []  # type: List[Frame]
+    with open(path, encoding="UTF-8") as stream:
+        for line in stream:
+            if line.strip():
+                frame = json.loads(line)
+                frames.append(Frame(frame["t"], frame["direction"], frame["message"]))
+    return frames
@@ -1,9 +1,14 @@
 import sublime
 import sublime_plugin
+import json
+import os
+import time
 from .clients import start_window_config
 from .configurations import ConfigManager, is_supported_syntax
 from .handlers import LanguageHandler
 from .logging import debug
+from .metrics import format_metrics_table
+from .recording import TrafficRecorder
 from .rpc import Client
 from .sessions import Session
 from .settings import settings, client_configs
@@ -152,3 +157,53 @@ class LspRestartClientCommand(sublime_plugin.TextCommand):
         window = self.view.window()
         if window:
             windows.lookup(window).restart_sessions()
+
+
+class LspDumpRpcMetricsCommand(sublime_plugin.WindowCommand):
+    """
+    Shows the message counters and latencies of the servers of the window in a new view, as a table or as JSON, along
+    with the number of requests that wait for a response and of messages that wait for their handlers.
+    """
+
+    def run(self, format: str = "table") -> None:
+        metrics = {}  # type: Dict[str, Any]
+        for session in windows.lookup(self.window).get_sessions():
+            if session.client:
+                metrics[session.config.name] = {
+                    "pending_requests": session.client.pending_requests(),
+                    "dispatch_depth": session.client.dispatch_depth(),
+                    "methods": session.client.metrics.to_dict()
+                }
+        if format == "json":
+            content = json.dumps(metrics, indent=2, sort_keys=True)
+        else:
+            content = format_metrics_table(metrics)
+        view = self.window.new_file()
+        view.set_name("LSP RPC Metrics")
+        view.set_scratch(True)
+        view.run_command("append", {"characters": content})
+
+
+class LspToggleTrafficRecordingCommand(sublime_plugin.WindowCommand):
+    """
+    Starts or stops recording the messages of the servers of the window, to a JSONL trace per server in the cache
+    directory. The traces can be replayed with tests/replay_trace.py.
+    """
+
+    def run(self) -> None:
+        clients = [session.client for session in windows.lookup(self.window).get_sessions() if session.client]
+        if any(client.recorder for client in clients):
+            for client in clients:
+                if client.recorder:
+                    client.recorder.close()
+                    client.recorder = None
+            self.window.status_message("Stopped recording LSP traffic")
+            return
+        directory = os.path.join(sublime.cache_path(), "LSP", "Traces")
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        for session in windows.lookup(self.window).get_sessions():
+            if session.client:
+                path = os.path.join(directory, "{}-{}.jsonl".format(session.config.name, stamp))
+                session.client.recorder = TrafficRecorder.open(path)
+        self.window.status_message("Recording LSP traffic to {}".format(directory))
@@ -1,21 +1,29 @@
+from .codec import decode, iter_array, peek_array_response, peek_message, peek_response_id
+from .dispatch import TaskQueue, shared_pool
 from .logging import debug, exception_log
+from .metrics import RpcMetrics
+from .promise import Promise
 from .protocol import Request, Notification, Response, Error, ErrorCode
-from .transports import StdioTransport, Transport
+from .recording import TrafficRecorder
+from .backends import create_stdio_transport
+from .transports import SendQueueFull, Transport, received_frame
 from .types import Settings
-from .typing import Any, Dict, Tuple, Callable, Optional, List
+from .typing import Any, Dict, Tuple, Callable, Optional, List, Set
 from abc import ABCMeta, abstractmethod
-from threading import Condition
 import json
 import subprocess
+import threading
+import time
 
 
 TCP_CONNECT_TIMEOUT = 5
 DEFAULT_SYNC_REQUEST_TIMEOUT = 1.0
-
-
-def format_request(payload: Dict[str, Any]) -> str:
-    """Converts the request into json"""
-    return json.dumps(payload, sort_keys=False, check_circular=False, separators=(',', ':'))
+# How often requests are checked for having missed their deadline, in seconds.
+DEADLINE_SWEEP_INTERVAL = 1.0
+# How long the response to a cancelled request is waited for, to drop it unread, in seconds.
+CANCELLED_RESPONSE_TIMEOUT = 60.0
+# How many elements of a streamed result are passed to its partial handler at once.
+STREAMED_BATCH_SIZE = 500
 
 
 def try_terminate_process(process: subprocess.Popen) -> None:
@@ -59,86 +67,68 @@ class Logger(metaclass=ABCMeta):
     def incoming_notification(self, method: str, params: Any, unhandled: bool) -> None:
         pass
 
+    def logs_payloads(self) -> bool:
+        """
+        Returns whether params are logged. When they're not, the params of unhandled messages aren't decoded at all.
+        """
+        return True
+
 
-class SyncRequestStatus:
+class RequestWaiter(object):
+    """
+    Lets a thread block until the response to its request arrives. Every blocking request has its own waiter.
+    """
 
-    __slots__ = ('__payload', '__error', '__request_id', '__response_id')
+    __slots__ = ('_event', 'result', 'error')
 
     def __init__(self) -> None:
-        self.__payload = None  # type: Any
-        self.__error = None  # type: Optional[Dict[str, Any]]
-        self.__request_id = -1
-        self.__response_id = -1
-
-    def prepare(self, request_id: int) -> None:
-        assert self.is_idle()
-        assert self.__payload is None
-        assert self.__error is None
-        self.__request_id = request_id
-
-    def request_id(self) -> int:
-        assert not self.is_idle()
-        return self.__request_id
-
-    def set(self, response_id: int, payload: Any) -> None:
-        assert self.is_requesting()
-        assert self.__request_id == response_id
-        self.__payload = payload
-        self.__response_id = response_id
-        assert self.is_ready()
-
-    def set_error(self, response_id: int, error: Dict[str, Any]) -> None:
-        assert self.is_requesting()
-        assert self.__request_id == response_id
-        self.__error = error
-        self.__response_id = response_id
-        assert self.is_ready()
-
-    def is_ready(self) -> bool:
-        return self.__request_id != -1 and self.__request_id == self.__response_id
-
-    def is_requesting(self) -> bool:
-        return self.__request_id != -1 and self.__response_id == -1
-
-    def is_idle(self) -> bool:
-        return self.__request_id == -1
-
-    def has_error(self) -> bool:
-        return self.__error is not None
-
-    def flush(self) -> Any:
-        assert not self.has_error()
-        assert self.is_ready()
-        result = self.__payload
-        self.reset()
-        return result
-
-    def flush_error(self) -> Dict[str, Any]:
-        assert self.__error is not None
-        assert self.is_ready()
-        result = self.__error
-        self.reset()
-        return result
-
-    def reset(self) -> None:
-        self.__payload = None
-        self.__request_id = -1
-        self.__response_id = -1
+        self._event = threading.Event()
+        self.result = None  # type: Any
+        self.error = None  # type: Optional[Dict[str, Any]]
+
+    def resolve(self, result: Any) -> None:
+        self.result = result
+        self._event.set()
+
+    def reject(self, error: Dict[str, Any]) -> None:
+        self.error = error
+        self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
 
 
 class Client(object):
-    def __init__(self, transport: Transport, settings: Settings) -> None:
+    """
+    Handlers of responses and of the messages of the server run on dispatch, by default a serial queue on the shared
+    dispatch pool, so that slow handlers don't hold up the thread that reads from the server. Handlers of a client run
+    one at a time, in the order the messages arrived. Responses to blocking requests are handled right away.
+    """
+
+    def __init__(self, transport: Transport, settings: Settings, dispatch: Optional[TaskQueue] = None) -> None:
+        self.dispatch = dispatch or shared_pool().serial()
         self.transport = transport  # type: Optional[Transport]
         self.transport.start(self.receive_payload, self.on_transport_closed)
         self.request_id = 0  # Our request IDs are always integers.
         self.logger = SublimeLogger(settings, "server", debug)  # type: Logger
-        self._response_handlers = {}  # type: Dict[int, Tuple[Optional[Callable], Optional[Callable[[Any], None]]]]
+        self._response_handlers = {}  # type: Dict[int, Tuple[Callable, Callable, Optional[RequestPromise]]]
         self._request_handlers = {}  # type: Dict[str, Callable]
         self._notification_handlers = {}  # type: Dict[str, Callable]
-        self._sync_request_result = SyncRequestStatus()
-        self._sync_request_cvar = Condition()
-        self._deferred_notifications = []  # type: List[Any]
-        self._deferred_responses = []  # type: List[Tuple[Optional[Callable], Any]]
+        self._view_requests = {}  # type: Dict[Tuple[int, str], RequestPromise]
+        self._request_views = {}  # type: Dict[int, List[Tuple[int, str]]]
+        self._cancelled_requests = {}  # type: Dict[int, float]
+        self._blocking_requests = set()  # type: Set[int]
+        self._deadlines = {}  # type: Dict[int, Tuple[float, str]]
+        self._shared_requests = {}  # type: Dict[Tuple[str, str, int], int]
+        self._shared_keys = {}  # type: Dict[int, Tuple[str, str, int]]
+        self._sharers = {}  # type: Dict[int, List[Tuple[Callable, Callable, RequestPromise]]]
+        self._partial_handlers = {}  # type: Dict[int, Callable[[List[Any]], None]]
+        self._sweep_timer = None  # type: Optional[threading.Timer]
+        self._transport_closed = False
+        self._in_flight = {}  # type: Dict[int, Tuple[str, float]]
+        self._response_lock = threading.Lock()
+        self.metrics = RpcMetrics()
+        self.recorder = None  # type: Optional[TrafficRecorder]
         self.exiting = False
         self._crash_handler = None  # type: Optional[Callable]
         self._transport_fail_handler = None  # type: Optional[Callable]
@@ -147,21 +137,246 @@ class Client(object):
     def send_request(
             self,
             request: Request,
-            handler: Callable[[Optional[Any]], None],
+            handler: Optional[Callable[[Optional[Any]], None]] = None,
             error_handler: Optional[Callable[[Any], None]] = None,
-    ) -> None:
+            view_id: Optional[int] = None,
+            timeout: Optional[float] = None,
+            document_version: Optional[int] = None,
+            partial_handler: Optional[Callable[[List[Any]], None]] = None,
+            view_key: Optional[str] = None
+    ) -> 'RequestPromise':
+        """
+        Sends a request without waiting for its response, returns a promise of its result.
+
+        The handlers are called before the promise is settled. Without an error handler, errors are displayed.
+
+        A request for a view supersedes the pending request with the same method for that view, which is cancelled.
+        Requests that can be pending for several places of a view at once pass a view_key instead of the method, and
+        only supersede the request with the same view_key.
+
+        A request with a timeout gets a Timeout error when the server doesn't answer within timeout seconds, and is
+        cancelled. Its handlers are freed then.
+
+        A request with a document_version shares the server round trip of an identical request, with the same method
+        and params for the same version of the document, that is still pending. Every party that shares it gets a
+        promise of its own: cancelling or superseding it only drops the handlers of that party, and the server is
+        only asked to cancel the request once no party is left.
+
+        A request with a partial_handler has a result that is an array streamed to it: the elements are decoded a
+        batch at a time, and every batch is passed to partial_handler as soon as it's decoded. The handler is called
+        with None once they're all passed, and the promise resolved with None. Results that aren't arrays go to the
+        handler as usual. Such requests aren't shared.
+        """
         if self.transport is not None:
-            with self._sync_request_cvar:
-                self.request_id += 1
-                request_id = self.request_id
-                self._response_handlers[request_id] = (handler, error_handler)
-            self.logger.outgoing_request(request_id, request.method, request.params, blocking=False)
-            self.send_payload(request.to_payload(request_id))
+            superseded = None  # type: Optional[RequestPromise]
+            with self._response_lock:
+                shared_key = None  # type: Optional[Tuple[str, str, int]]
+                shares = None  # type: Optional[List[Tuple[Callable, Callable, RequestPromise]]]
+                if document_version is not None and partial_handler is None:
+                    shared_key = (request.method, json.dumps(request.params, sort_keys=True), document_version)
+                    shared_id = self._shared_requests.get(shared_key)
+                    if shared_id is not None and shared_id in self._response_handlers:
+                        request_id = shared_id
+                        shares = self._sharers[shared_id]
+                joins = shares is not None
+                if not joins:
+                    self.request_id += 1
+                    request_id = self.request_id
+                promise = RequestPromise(self, request_id)
+                handlers = (
+                    self._settling(handler, promise.resolve),
+                    self._settling(error_handler or self._display_error, promise.reject),
+                    promise)
+                if view_id is not None:
+                    key = (view_id, view_key or request.method)
+                    superseded = self._view_requests.get(key)
+                    self._view_requests[key] = promise
+                    self._request_views.setdefault(request_id, []).append(key)
+                if shares is not None:
+                    # The round trip is under way already, this party only waits for its response too.
+                    shares.append(handlers)
+                elif shared_key is not None:
+                    shares = [handlers]
+                    self._response_handlers[request_id] = (
+                        self._fan_out(shares, False), self._fan_out(shares, True), None)
+                    self._shared_requests[shared_key] = request_id
+                    self._shared_keys[request_id] = shared_key
+                    self._sharers[request_id] = shares
+                else:
+                    self._response_handlers[request_id] = handlers
+                    if partial_handler is not None:
+                        self._partial_handlers[request_id] = partial_handler
+                if not joins:
+                    if timeout is not None:
+                        self._deadlines[request_id] = (time.monotonic() + timeout, request.method)
+                        self._schedule_sweep()
+                    self._in_flight[request_id] = (request.method, time.monotonic())
+            if superseded is not None:
+                superseded.cancel()
+            if not joins:
+                self.logger.outgoing_request(request_id, request.method, request.params, blocking=False)
+                self._send_request_payload(request, request_id)
+            return promise
         else:
             debug('unable to send', request.method)
             if error_handler is not None:
                 error_handler(None)
-            return None
+            promise = RequestPromise(self, None)
+            promise.reject({"code": ErrorCode.InternalError, "message": "unable to send {}".format(request.method)})
+            return promise
+
+    def _settling(self, handler: Optional[Callable[[Any], None]], settle: Callable[[Any], bool]) -> Callable:
+        def handle(result: Any) -> None:
+            try:
+                if handler:
+                    handler(result)
+            finally:
+                settle(result)
+
+        return handle
+
+    def _guarded(self, handler: Optional[Callable[[Any], None]]) -> Callable[[Any], None]:
+        def handle(result: Any) -> None:
+            if handler:
+                try:
+                    handler(result)
+                except Exception as err:
+                    exception_log("Error handling server payload", err)
+
+        return handle
+
+    def _fan_out(self, shares: List[Tuple[Callable, Callable, 'RequestPromise']],
+                 error: bool) -> Callable[[Any], None]:
+        """
+        Returns a handler that passes the response of a shared request on to the parties that still share it: to
+        their error handlers if error is True.
+        """
+        def handle(result: Any) -> None:
+            with self._response_lock:
+                parties = list(shares)
+            for handler, error_handler, _ in parties:
+                self._guarded(error_handler if error else handler)(result)
+
+        return handle
+
+    def _display_error(self, error: Any) -> None:
+        self._error_display_handler(error.get("message") if isinstance(error, dict) else error)
+
+    def cancel_request(self, request_id: int, promise: Optional['RequestPromise'] = None) -> None:
+        """
+        Asks the server to cancel a request. Its handlers are never called, and its response is dropped unread. The
+        promise of its result is rejected.
+
+        With the promise of one party that shares the request, only that party is dropped, unless it is the last one.
+        """
+        cancelled = {"code": ErrorCode.RequestCancelled, "message": "cancelled"}
+        dropped = None  # type: Optional[RequestPromise]
+        with self._response_lock:
+            shares = self._sharers.get(request_id)
+            if promise is not None and shares is not None:
+                party = next((party for party in shares if party[2] is promise), None)
+                if party is None:
+                    return  # dropped already
+                if len(shares) > 1:
+                    shares.remove(party)
+                    self._forget_view_request(request_id, promise)
+                    dropped = promise
+            if dropped is None:
+                pending = self._response_handlers.pop(request_id, None)
+                if pending is None:
+                    return  # answered already
+                self._forget_request(request_id)
+                self._drop_response(request_id)
+                rejected = [party[2] for party in shares] if shares is not None else [pending[2]]
+        if dropped is not None:
+            dropped.reject(cancelled)
+            return  # others still wait for the response
+        self.send_notification(Notification.cancelRequest({"id": request_id}))
+        for party_promise in rejected:
+            if party_promise is not None:
+                party_promise.reject(cancelled)
+
+    def cancel_view_requests(self, view_id: int) -> None:
+        """
+        Cancels the pending requests for a view, for when it closes, so that neither the server nor the handlers that
+        hold on to the view keep working for it.
+        """
+        with self._response_lock:
+            promises = [promise for (view, _), promise in self._view_requests.items() if view == view_id]
+        for promise in promises:
+            promise.cancel()
+
+    def pending_requests(self) -> int:
+        """
+        Returns the number of requests that wait for a response, and hold on to their handlers.
+        """
+        return len(self._response_handlers)
+
+    def _drop_response(self, request_id: int) -> None:
+        """
+        Remembers to drop the response to a cancelled request unread, until the sweep gives up waiting for it. Call
+        with the response lock held.
+        """
+        self._cancelled_requests[request_id] = time.monotonic() + CANCELLED_RESPONSE_TIMEOUT
+        self._schedule_sweep()
+
+    def _schedule_sweep(self) -> None:
+        """
+        Starts the sweep timer, unless it runs already or the transport closed. Call with the response lock held.
+        """
+        if self._sweep_timer is not None or self._transport_closed:
+            return
+        self._sweep_timer = threading.Timer(DEADLINE_SWEEP_INTERVAL, self.sweep_deadlines)
+        self._sweep_timer.daemon = True
+        self._sweep_timer.start()
+
+    def sweep_deadlines(self) -> None:
+        """
+        Fails the requests that missed their deadline with a Timeout error, and cancels them. Their error handlers
+        run on dispatch, like the handlers of responses. Stops waiting for the responses to cancelled requests that
+        the server never sent.
+        """
+        now = time.monotonic()
+        expired = []  # type: List[Tuple[int, str, Callable]]
+        with self._response_lock:
+            self._sweep_timer = None
+            for request_id, forget_at in list(self._cancelled_requests.items()):
+                if forget_at <= now:
+                    del self._cancelled_requests[request_id]
+            for request_id, (deadline, method) in list(self._deadlines.items()):
+                if deadline > now:
+                    continue
+                pending = self._response_handlers.pop(request_id, None)
+                self._forget_request(request_id)
+                if pending is not None:
+                    self._drop_response(request_id)
+                    expired.append((request_id, method, pending[1]))
+            if self._deadlines or self._cancelled_requests:
+                self._schedule_sweep()
+        for request_id, method, error_handler in expired:
+            self.metrics.timed_out(method)
+            self.send_notification(Notification.cancelRequest({"id": request_id}))
+            self._dispatch_error(error_handler, {"code": ErrorCode.Timeout, "message": "timeout on {}".format(method)},
+                                 method)
+
+    def _forget_request(self, request_id: int) -> None:
+        self._in_flight.pop(request_id, None)
+        self._partial_handlers.pop(request_id, None)
+        self._deadlines.pop(request_id, None)
+        self._sharers.pop(request_id, None)
+        shared_key = self._shared_keys.pop(request_id, None)
+        if shared_key is not None and self._shared_requests.get(shared_key) == request_id:
+            del self._shared_requests[shared_key]
+        for key in self._request_views.pop(request_id, []):
+            view_request = self._view_requests.get(key)
+            if view_request is not None and view_request.request_id == request_id:
+                del self._view_requests[key]
+
+    def _forget_view_request(self, request_id: int, promise: 'RequestPromise') -> None:
+        keys = self._request_views.get(request_id, [])
+        for key in [key for key in keys if self._view_requests.get(key) is promise]:
+            keys.remove(key)
+            del self._view_requests[key]
 
     def execute_request(
             self,
@@ -172,66 +387,76 @@ class Client(object):
     ) -> None:
         """
         Sends a request and waits for response up to timeout (default: 1 second), blocking the current thread.
+
+        Every blocking request waits on its own, so several threads can block at once, and other messages are handled
+        while they wait. A request that times out is cancelled.
         """
         if self.transport is None:
             debug('unable to send', request.method)
             return None
 
-        result = None  # type: Any
-        error = None  # type: Optional[Dict[str, Any]]
-        exception = None  # type: Optional[Exception]
-        with self._sync_request_cvar:
-            try:
-                self.request_id += 1
-                request_id = self.request_id
-                self.logger.outgoing_request(request_id, request.method, request.params, blocking=True)
-                self._sync_request_result.prepare(request_id)  # After this, is_requesting() returns True.
-                self.send_payload(request.to_payload(request_id))
-                # We go to sleep. We wake up once another thread calls .notify() on this condition variable.
-                if not self._sync_request_cvar.wait_for(self._sync_request_result.is_ready, timeout):
-                    error = {"code": ErrorCode.Timeout, "message": "timeout on {}".format(request.method)}
-                elif self._sync_request_result.has_error():
-                    error = self._sync_request_result.flush_error()
-                else:
-                    result = self._sync_request_result.flush()
-            except Exception as ex:
-                exception = ex
-            finally:
-                self._sync_request_result.reset()
-            self.flush_deferred_notifications()
-            self.flush_deferred_responses()
-        if exception is None:
-            if error is not None:
-                if error_handler is None:
-                    self._error_display_handler(error["message"])
-                else:
-                    error_handler(error)
+        waiter = RequestWaiter()
+        with self._response_lock:
+            self.request_id += 1
+            request_id = self.request_id
+            promise = RequestPromise(self, request_id)
+            promise.then(waiter.resolve, waiter.reject)
+            self._response_handlers[request_id] = (promise.resolve, promise.reject, promise)
+            self._blocking_requests.add(request_id)
+            self._in_flight[request_id] = (request.method, time.monotonic())
+        try:
+            self.logger.outgoing_request(request_id, request.method, request.params, blocking=True)
+            self._send_request_payload(request, request_id)
+            if waiter.wait(timeout):
+                error = waiter.error
             else:
-                handler(result)
+                promise.cancel()
+                self.metrics.timed_out(request.method)
+                error = {"code": ErrorCode.Timeout, "message": "timeout on {}".format(request.method)}
+        except Exception as ex:
+            exception_log("Error sending {}".format(request.method), ex)
+            return
+        finally:
+            with self._response_lock:
+                self._blocking_requests.discard(request_id)
+        if error is not None:
+            if error_handler is None:
+                self._error_display_handler(error["message"])
+            else:
+                error_handler(error)
+        else:
+            handler(waiter.result)
 
-    def flush_deferred_notifications(self) -> None:
-        for payload in self._deferred_notifications:
-            try:
-                handler = self._notification_handlers.get(payload["method"])
-                if handler:
-                    handler(payload["params"])
-            except Exception as err:
-                exception_log("Error handling server payload", err)
-        self._deferred_notifications.clear()
+    def _send_request_payload(self, request: Request, request_id: int) -> None:
+        """
+        Sends a request that has its handlers in place. When too many messages wait to be written to the server, the
+        request isn't sent, and fails with a ServerBusy error: on dispatch, or right away for a blocking request.
+        """
+        try:
+            self.metrics.sent(request.method, self.send_payload(request.to_payload(request_id)))
+            return
+        except SendQueueFull:
+            debug("too many messages queued, not sending", request.method)
+        with self._response_lock:
+            pending = self._response_handlers.pop(request_id, None)
+            self._forget_request(request_id)
+            blocking = request_id in self._blocking_requests
+        if pending is None:
+            return
+        error = {"code": ErrorCode.ServerBusy, "message": "too many messages queued for {}".format(request.method)}
+        if blocking:
+            self.handle_payload(pending[1], error, None, "response", request.method, time.monotonic())
+        else:
+            self._dispatch_error(pending[1], error, request.method)
 
-    def flush_deferred_responses(self) -> None:
-        for handler, result in self._deferred_responses:
-            if handler:
-                try:
-                    handler(result)
-                except Exception as err:
-                    exception_log("Error handling server payload", err)
-        self._deferred_responses.clear()
+    def _dispatch_error(self, error_handler: Callable, error: Dict[str, Any], method: str) -> None:
+        received = time.monotonic()
+        self.dispatch.submit(lambda: self.handle_payload(error_handler, error, None, "response", method, received))
 
     def send_notification(self, notification: Notification) -> None:
         if self.transport is not None:
             self.logger.outgoing_notification(notification.method, notification.params)
-            self.send_payload(notification.to_payload())
+            self.metrics.sent(notification.method, self.send_payload(notification.to_payload()))
         else:
             debug('unable to send', notification.method)
 
@@ -243,6 +468,18 @@ class Client(object):
         self.logger.outgoing_error_response(request_id, error)
         self.send_payload({'jsonrpc': '2.0', 'id': request_id, 'error': error.to_lsp()})
 
+    def queue_depth(self) -> int:
+        """
+        Returns the number of messages that wait to be written to the server.
+        """
+        return self.transport.queue_depth() if self.transport else 0
+
+    def dispatch_depth(self) -> int:
+        """
+        Returns the number of messages from the server that were read but wait to be handled.
+        """
+        return self.dispatch.qsize()
+
     def exit(self) -> None:
         self.exiting = True
         self.send_notification(Notification.exit())
@@ -264,18 +501,26 @@ class Client(object):
         if self._crash_handler is not None:
             self._crash_handler()
 
-    def send_payload(self, payload: Dict[str, Any]) -> None:
+    def send_payload(self, payload: Dict[str, Any]) -> int:
+        """
+        Sends payload and returns the size of its JSON, or 0 when it isn't sent or its size isn't known yet.
+        """
         if self.transport:
-            message = format_request(payload)
-            self.transport.send(message)
+            if self.recorder:
+                self.recorder.outgoing(payload)
+            return self.transport.send_payload(payload)
+        return 0
 
     def deduce_payload(
         self,
-        payload: Dict[str, Any]
+        payload: Dict[str, Any],
+        size: int = 0,
+        first_byte: Optional[float] = None
     ) -> Tuple[Optional[Callable], Any, Optional[int], Optional[str], Optional[str]]:
         if "method" in payload:
             method = payload["method"]
             result = payload.get("params")
+            self.metrics.received(method, size)
             if "id" in payload:
                 req_id = payload["id"]
                 handler = self._request_handlers.get(method)
@@ -286,17 +531,18 @@ class Client(object):
                     self.logger.incoming_request(req_id, method, result)
                     return tup
             else:
-                if self._sync_request_result.is_idle():
-                    res = (self._notification_handlers.get(method), result, None, "notification", method)
-                    self.logger.incoming_notification(method, result, res[0] is None)
-                    return res
-                else:
-                    self._deferred_notifications.append(payload)
+                res = (self._notification_handlers.get(method), result, None, "notification", method)
+                self.logger.incoming_notification(method, result, res[0] is None)
+                return res
         elif "id" in payload:
             response_id = int(payload["id"])
+            blocking = response_id in self._blocking_requests
+            sent = self._in_flight.get(response_id)
+            if sent is not None:
+                self.metrics.response(sent[0], time.monotonic() - sent[1], size, "error" in payload,
+                                      first_byte - sent[1] if first_byte is not None else None)
             handler, result = self.response_handler(response_id, payload)
-            response_tuple = (handler, result, None, None, None)
-            blocking = self._sync_request_result.is_ready()
+            response_tuple = (handler, result, None, "response", sent[0] if sent else None)
             self.logger.incoming_response(response_id, result, blocking)
             return response_tuple
         else:
@@ -304,43 +550,130 @@ class Client(object):
         return (None, None, None, None, None)
 
     def receive_payload(self, message: str) -> None:
-        payload = None
+        if self.recorder:
+            self.recorder.incoming(message)
+        if self._cancelled_requests:
+            response_id = peek_response_id(message)
+            if response_id is not None:
+                with self._response_lock:
+                    if self._cancelled_requests.pop(response_id, None) is not None:
+                        return
+        frame = received_frame()
+        first_byte, size = frame if frame else (None, len(message.encode("utf-8")))
+        if self._partial_handlers and self._stream_response(message, size, first_byte):
+            return
         try:
-            payload = json.loads(message)
-            # limit = min(len(message), 200)
-            # debug("got json: ", message[0:limit], "...")
-        except IOError as err:
+            peeked = peek_message(message)
+            if peeked is None:
+                payload = decode(message)
+            else:
+                payload = {"method": peeked.method}
+                if peeked.has_id:
+                    payload["id"] = peeked.id
+                handlers = self._request_handlers if peeked.has_id else self._notification_handlers
+                if peeked.method in handlers or self.logger.logs_payloads():
+                    payload["params"] = peeked.params()
+        except ValueError as err:
             exception_log("got a non-JSON payload: " + message, err)
             return
 
-        with self._sync_request_cvar:
-            handler, result, req_id, typestr, method = self.deduce_payload(payload)
+        with self._response_lock:
+            blocking = "method" not in payload and payload.get("id") in self._blocking_requests
+            handler, result, req_id, typestr, method = self.deduce_payload(payload, size, first_byte)
 
         if handler:
+            if blocking:
+                self.handle_payload(handler, result, req_id, typestr, method, time.monotonic())
+            else:
+                received = time.monotonic()
+                self.dispatch.submit(lambda: self.handle_payload(handler, result, req_id, typestr, method, received))
+
+    def _stream_response(self, message: str, size: int, first_byte: Optional[float]) -> bool:
+        """
+        Hands the response in message to its partial handler if it has one and its result is an array, and returns
+        whether it did. The elements are decoded on dispatch, not on the thread that reads from the server.
+        """
+        streamed = peek_array_response(message)
+        if streamed is None:
+            return False
+        response_id, position = streamed
+        received = time.monotonic()
+        with self._response_lock:
+            partial_handler = self._partial_handlers.get(response_id)
+            if partial_handler is None:
+                return False
+            sent = self._in_flight.get(response_id)
+            if sent is not None:
+                self.metrics.response(sent[0], received - sent[1], size, False,
+                                      first_byte - sent[1] if first_byte is not None else None)
+            self._forget_request(response_id)
+            handler, error_handler, _ = self._response_handlers.pop(response_id)
+        self.logger.incoming_response(response_id, "(streamed)", False)
+
+        def stream(_: Any) -> None:
+            batch = []  # type: List[Any]
             try:
-                if req_id is None:
-                    # notification or response
-                    handler(result)
-                else:
-                    # request
-                    try:
-                        handler(result, req_id)
-                    except Error as err:
-                        self.send_error_response(req_id, err)
-                    except Exception as ex:
-                        self.send_error_response(req_id, Error.from_exception(ex))
-                        raise
+                for element in iter_array(message, position):
+                    batch.append(element)
+                    if len(batch) == STREAMED_BATCH_SIZE:
+                        partial_handler(batch)
+                        batch = []
+                if batch:
+                    partial_handler(batch)
+            except ValueError as err:
+                error_handler({"code": ErrorCode.ParseError, "message": str(err)})
             except Exception as err:
-                exception_log("Error handling {}".format(typestr), err)
+                exception_log("Error handling streamed response", err)
+                error_handler({"code": ErrorCode.InternalError, "message": str(err)})
+            else:
+                handler(None)
+
+        method = sent[0] if sent else None
+        self.dispatch.submit(lambda: self.handle_payload(stream, None, None, "response", method, received))
+        return True
+
+    def handle_payload(self, handler: Callable, result: Any, req_id: Optional[int], typestr: Optional[str],
+                       method: Optional[str], received: float) -> None:
+        started = time.monotonic()
+        if method is not None:
+            self.metrics.waited(method, started - received)
+        try:
+            if req_id is None:
+                # notification or response
+                handler(result)
+            else:
+                # request
+                try:
+                    handler(result, req_id)
+                except Error as err:
+                    self.send_error_response(req_id, err)
+                except Exception as ex:
+                    self.send_error_response(req_id, Error.from_exception(ex))
+                    raise
+        except Exception as err:
+            exception_log("Error handling {}".format(typestr), err)
+        if method is not None:
+            self.metrics.handled(method, time.monotonic() - started)
 
     def on_transport_closed(self) -> None:
+        with self._response_lock:
+            self._transport_closed = True
+            if self._sweep_timer is not None:
+                self._sweep_timer.cancel()
+                self._sweep_timer = None
+            self._cancelled_requests.clear()
+        if self.recorder:
+            self.recorder.close()
         self._error_display_handler("Communication to server closed, exiting")
         # Differentiate between normal exit and server crash?
         if not self.exiting:
             self.handle_transport_failure()
 
     def response_handler(self, response_id: int, response: Dict[str, Any]) -> Tuple[Optional[Callable], Any]:
-        handler, error_handler = self._response_handlers.pop(response_id, (None, None))
+        if self._cancelled_requests.pop(response_id, None) is not None:
+            return (None, None)
+        self._forget_request(response_id)
+        handler, error_handler, _ = self._response_handlers.pop(response_id, (None, None, None))
         if "result" in response and "error" not in response:
             return self.handle_response(response_id, handler, response["result"], False)
         elif "result" not in response and "error" in response:
@@ -351,21 +684,6 @@ class Client(object):
 
     def handle_response(self, response_id: int, handler: Optional[Callable],
                         result: Any, is_error: bool) -> Tuple[Optional[Callable], Any]:
-        if self._sync_request_result.is_idle():
-            pass
-        elif self._sync_request_result.is_requesting():
-            if self._sync_request_result.request_id() == response_id:
-                if is_error:
-                    self._sync_request_result.set_error(response_id, result)
-                else:
-                    self._sync_request_result.set(response_id, result)
-                self._sync_request_cvar.notify()
-            else:
-                self._deferred_responses.append((handler, result))
-            return (None, result)
-        else:  # self._sync_request_result.is_ready()
-            self._deferred_responses.append((handler, result))
-            return (None, None)
         if handler:
             return (handler, result)
         elif is_error:
@@ -381,9 +699,25 @@ class Client(object):
         self._notification_handlers[notification_method] = handler
 
 
+class RequestPromise(Promise):
+    """
+    The promise of the result of a request, which can cancel the request.
+    """
+
+    __slots__ = ('request_id', '_client')
+
+    def __init__(self, client: Client, request_id: Optional[int]) -> None:
+        super().__init__()
+        self.request_id = request_id
+        self._client = client
+
+    def cancel(self) -> None:
+        if self.request_id is not None:
+            self._client.cancel_request(self.request_id, self)
+
+
 def attach_stdio_client(process: subprocess.Popen, settings: Settings) -> Client:
-    transport = StdioTransport(process)
-    client = Client(transport, settings)
+    client = Client(create_stdio_transport(process, settings), settings)
     client.set_transport_failure_handler(lambda: try_terminate_process(process))
     return client
 
@@ -453,6 +787,9 @@ class SublimeLogger(Logger):
             return
         self.log(self.format_request("<--", method, request_id), params, self.settings.log_payloads)
 
+    def logs_payloads(self) -> bool:
+        return bool(self.settings.log_debug and self.settings.log_payloads)
+
     def incoming_notification(self, method: str, params: Any, unhandled: bool) -> None:
         if not self.settings.log_debug or method == "window/logMessage":
             return
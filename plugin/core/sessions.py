@@ -1,14 +1,19 @@
 from .. import __version__
+from .backends import create_socket_transport, stderr_logger
 from .logging import debug
+from .pool import servers
 from .process import start_server
 from .protocol import completion_item_kinds, symbol_kinds, WorkspaceFolder, Request, Notification
 from .protocol import TextDocumentSyncKindNone, TextDocumentSyncKindIncremental
-from .rpc import Client, attach_stdio_client, Response
-from .transports import start_tcp_transport, start_tcp_listener, TCPTransport, Transport
+from .rpc import Client, attach_stdio_client, Response, try_terminate_process
+from .transports import accept_connection, connect_tcp, connect_unix, create_unix_socket_path, start_tcp_listener
+from .transports import ConnectingTransport, Transport
 from .types import ClientConfig, ClientStates, Settings
 from .typing import Callable, Dict, Any, Optional, List, Tuple
 from .workspace import is_subpath_of
+from functools import partial
 import os
+import threading
 
 
 def get_initialize_params(workspace_folders: List[WorkspaceFolder], config: ClientConfig) -> dict:
@@ -223,7 +228,23 @@ def clear_dotted_value(current: dict, dotted: str) -> None:
     current.pop(keys[-1], None)
 
 
+def index_capabilities(index: Dict[str, Any], dotted: str, value: Any) -> None:
+    """
+    Adds value to index under the dotted path, and every value nested in it under its own dotted path.
+    """
+    index[dotted] = value
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            index_capabilities(index, dotted + '.' + key, nested)
+
+
 class Session(object):
+    """
+    The capabilities of the server are kept in a flat index from dotted paths to values, so that looking one up takes
+    a single dict lookup. capabilities_version changes whenever they do, for callers that cache what they derive from
+    them.
+    """
+
     def __init__(self,
                  config: ClientConfig,
                  workspace_folders: List[WorkspaceFolder],
@@ -236,6 +257,11 @@ class Session(object):
         self._on_post_initialize = on_post_initialize
         self._on_post_exit = on_post_exit
         self.capabilities = dict()  # type: Dict[str, Any]
+        self.capabilities_version = 0
+        self._capability_index = dict()  # type: Dict[str, Any]
+        self._text_sync_kind = TextDocumentSyncKindNone
+        self._open_documents = dict()  # type: Dict[str, List[Any]]
+        self._documents_lock = threading.Lock()
         self.client = client
         self._workspace_folders = workspace_folders
         if on_pre_initialize:
@@ -247,7 +273,25 @@ class Session(object):
         return value is not False and value is not None
 
     def get_capability(self, capability: str) -> Optional[Any]:
-        return get_dotted_value(self.capabilities, capability)
+        return self._capability_index.get(capability)
+
+    def _index_capabilities(self, dotted: Optional[str] = None) -> None:
+        """
+        Updates the index of the capabilities after those under dotted changed, or all of them when it's None.
+        """
+        if dotted is None:
+            self._capability_index.clear()
+            for key, value in self.capabilities.items():
+                index_capabilities(self._capability_index, key, value)
+        else:
+            top = dotted.split('.', 1)[0]
+            nested = top + '.'
+            for key in [key for key in self._capability_index if key == top or key.startswith(nested)]:
+                del self._capability_index[key]
+            if top in self.capabilities:
+                index_capabilities(self._capability_index, top, self.capabilities[top])
+        self._text_sync_kind = self._get_text_sync_kind()
+        self.capabilities_version += 1
 
     def should_notify_did_open(self) -> bool:
         if self.has_capability('textDocumentSync.openClose'):
@@ -256,7 +300,10 @@ class Session(object):
         return isinstance(textsync, int) and textsync > TextDocumentSyncKindNone
 
     def text_sync_kind(self) -> int:
-        textsync = self.capabilities.get('textDocumentSync')
+        return self._text_sync_kind
+
+    def _get_text_sync_kind(self) -> int:
+        textsync = self.get_capability('textDocumentSync')
         if isinstance(textsync, dict):
             change = textsync.get('change', TextDocumentSyncKindNone)
             if isinstance(change, dict):
@@ -274,7 +321,7 @@ class Session(object):
         return self.has_capability('textDocumentSync.willSave')
 
     def should_notify_did_save(self) -> Tuple[bool, bool]:
-        textsync = self.capabilities.get('textDocumentSync')
+        textsync = self.get_capability('textDocumentSync')
         if isinstance(textsync, dict):
             options = textsync.get('save')
             if isinstance(options, dict):
@@ -286,6 +333,42 @@ class Session(object):
     def should_notify_did_close(self) -> bool:
         return self.should_notify_did_open()
 
+    def open_document(self, file_name: str, owner: Any) -> bool:
+        """
+        Notes that the window of owner opens file_name, as windows can share a session. Returns whether it is the
+        first one, that tells the server and owns the document.
+
+        The server sees the document as its owner has it: the views of other windows have their own versions, so
+        only the owner sends changes.
+        """
+        with self._documents_lock:
+            owners = self._open_documents.setdefault(file_name, [])
+            if owner in owners:
+                return False
+            owners.append(owner)
+            return len(owners) == 1
+
+    def owns_document(self, file_name: str, owner: Any) -> bool:
+        with self._documents_lock:
+            owners = self._open_documents.get(file_name, [])
+            return bool(owners) and owners[0] is owner
+
+    def close_document(self, file_name: str, owner: Any) -> Tuple[bool, Optional[Any]]:
+        """
+        Notes that the window of owner closes file_name. Returns whether it owned the document, and so tells the
+        server it is closed, and the window that owns it from now on, that opens it again with the text of its view.
+        """
+        with self._documents_lock:
+            owners = self._open_documents.get(file_name, [])
+            if owner not in owners:
+                return False, None
+            owned = owners[0] is owner
+            owners.remove(owner)
+            if not owners:
+                del self._open_documents[file_name]
+                return owned, None
+            return owned, owners[0] if owned else None
+
     def should_notify_did_change_workspace_folders(self) -> bool:
         return self.has_capability("workspace.workspaceFolders.changeNotifications")
 
@@ -341,6 +424,7 @@ class Session(object):
 
     def _handle_initialize_result(self, result: Any) -> None:
         self.capabilities.update(result.get('capabilities', dict()))
+        self._index_capabilities()
 
         # only keep supported amount of folders
         if self._workspace_folders:
@@ -393,6 +477,8 @@ class Session(object):
             debug("{}: registering capability:".format(self.config.name), capability_path)
             set_dotted_value(self.capabilities, capability_path, registration.get("registerOptions", {}))
             set_dotted_value(self.capabilities, registration_path, registration["id"])
+            self._index_capabilities(capability_path)
+            self._index_capabilities(registration_path)
         self.client.send_response(Response(request_id, None))
 
     def _handle_unregister_capability(self, params: Any, request_id: Any) -> None:
@@ -402,6 +488,8 @@ class Session(object):
             debug("{}: unregistering capability:".format(self.config.name), capability_path)
             clear_dotted_value(self.capabilities, capability_path)
             clear_dotted_value(self.capabilities, registration_path)
+            self._index_capabilities(capability_path)
+            self._index_capabilities(registration_path)
         self.client.send_response(Response(request_id, None))
 
     def end(self) -> None:
@@ -415,6 +503,7 @@ class Session(object):
         self.client.exit()
         self.client = None  # type: ignore
         self.capabilities.clear()
+        self._index_capabilities()
         if self._on_post_exit:
             self._on_post_exit(self.config.name)
 
@@ -438,38 +527,46 @@ def create_session(config: ClientConfig,
             on_post_initialize=on_post_initialize,
             on_post_exit=on_post_exit)
 
+    def socket_transport(sock: Any) -> Transport:
+        return create_socket_transport(sock, settings)
+
     session = None
     if config.binary_args:
         tcp_port = config.tcp_port
         server_args = config.binary_args
 
         if config.tcp_mode == "host":
-            socket = start_tcp_listener(tcp_port or 0)
-            tcp_port = socket.getsockname()[1]
+            listener = start_tcp_listener(tcp_port or 0)
+            tcp_port = listener.getsockname()[1]
             server_args = list(s.replace("{port}", str(tcp_port)) for s in config.binary_args)
+        elif config.tcp_mode == "unix":
+            socket_path = create_unix_socket_path()
+            server_args = list(s.replace("{socket}", socket_path) for s in config.binary_args)
 
         working_dir = workspace_folders[0].path if workspace_folders else None
-        process = start_server(server_args, working_dir, env, on_stderr_log)
+        if not settings.server_pool_size or config.tcp_mode or tcp_port:
+            process = start_server(server_args, working_dir, env, on_stderr_log, stderr_logger(settings))
+        else:
+            process = servers.start(server_args, working_dir, env, on_stderr_log, stderr_logger(settings),
+                                    settings.server_pool_size, settings.server_pool_idle_timeout)
         if process:
+            # The server may take a while to connect or to listen, that happens in the background.
+            connect = None  # type: Optional[Callable[[], Any]]
             if config.tcp_mode == "host":
-                client_socket, address = socket.accept()
-                transport = TCPTransport(client_socket)  # type: Transport
-                session = with_client(Client(transport, settings))
+                connect = partial(accept_connection, listener)
+            elif config.tcp_mode == "unix":
+                connect = partial(connect_unix, socket_path)
             elif tcp_port:
-                transport = start_tcp_transport(tcp_port, config.tcp_host)
-                if transport:
-                    session = with_client(Client(transport, settings))
-                else:
-                    # try to terminate the process
-                    try:
-                        process.terminate()
-                    except Exception:
-                        pass
+                connect = partial(connect_tcp, tcp_port, config.tcp_host)
+            if connect:
+                client = Client(ConnectingTransport(connect, socket_transport), settings)
+                client.set_transport_failure_handler(partial(try_terminate_process, process))
+                session = with_client(client)
             else:
                 session = with_client(attach_stdio_client(process, settings))
     else:
         if config.tcp_port:
-            transport = start_tcp_transport(config.tcp_port)
+            transport = ConnectingTransport(partial(connect_tcp, config.tcp_port), socket_transport)
             session = with_client(Client(transport, settings))
         elif bootstrap_client:
             session = with_client(bootstrap_client)
@@ -83,6 +83,11 @@ def update_settings(settings: Settings, settings_obj: sublime.Settings) -> None:
     settings.log_server = read_bool_setting(settings_obj, "log_server", True)
     settings.log_stderr = read_bool_setting(settings_obj, "log_stderr", False)
     settings.log_payloads = read_bool_setting(settings_obj, "log_payloads", False)
+    settings.io_backend = read_str_setting(settings_obj, "io_backend", "threads")
+    settings.server_pool_size = read_int_setting(settings_obj, "server_pool_size", 0)
+    settings.server_pool_idle_timeout = read_int_setting(settings_obj, "server_pool_idle_timeout", 600)
+    settings.share_sessions_between_windows = read_bool_setting(settings_obj, "share_sessions_between_windows", False)
+    settings.feature_request_timeout = read_int_setting(settings_obj, "feature_request_timeout", 10)
 
 
 class ClientConfigs(object):
@@ -0,0 +1,119 @@
+from .protocol import WorkspaceFolder
+from .sessions import Session
+from .types import ClientConfig
+from .typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import threading
+
+
+# Windows share the session of a configuration when they resolve it the same, project overrides included, and have
+# the same workspace folders.
+SessionKey = Tuple[str, str, Tuple[str, ...]]
+
+
+def session_key(config: ClientConfig, workspace_folders: List[WorkspaceFolder]) -> SessionKey:
+    resolved = json.dumps(vars(config), sort_keys=True, default=vars)
+    return (config.name, hashlib.sha1(resolved.encode("utf-8")).hexdigest(),
+            tuple(sorted(folder.path for folder in workspace_folders)))
+
+
+class SharedSession(object):
+    """
+    A session and the windows attached to it, in the order they attached. The first one is the primary window, that
+    shows what the server says about no file in particular.
+    """
+
+    def __init__(self, key: SessionKey) -> None:
+        self.key = key
+        self.session = None  # type: Optional[Session]
+        self.windows = []  # type: List[Any]
+        self.initialized = False
+        self.started = threading.Event()
+
+
+class SessionRegistry(object):
+    """
+    Sessions that windows with the same workspace folders share, so that they talk to one server instead of starting
+    one each. The session ends when the last window detaches from it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._shared = {}  # type: Dict[SessionKey, SharedSession]
+
+    def attach(self, key: SessionKey, window: Any,
+               start: Callable[[SharedSession], Optional[Session]]) -> Tuple[Optional[SharedSession], bool]:
+        """
+        Attaches window to the session for key, and starts one with start if there is none. Returns the shared
+        session, or None if it couldn't start, and whether the session was already initialized: otherwise,
+        initialized returns the window once it is.
+
+        The session starts outside of the lock, so that windows don't wait for servers of other keys to spawn.
+        Windows that attach meanwhile wait for it to start.
+        """
+        with self._lock:
+            shared = self._shared.get(key)
+            starting = shared is None
+            if shared is None:
+                shared = self._shared[key] = SharedSession(key)
+            if window not in shared.windows:
+                shared.windows.append(window)
+        if starting:
+            try:
+                shared.session = start(shared)
+            finally:
+                if shared.session is None:
+                    self.forget(shared)
+                shared.started.set()
+        else:
+            shared.started.wait()
+        if shared.session is None:
+            return None, False
+        with self._lock:
+            return shared, shared.initialized
+
+    def detach(self, shared: SharedSession, window: Any) -> bool:
+        """
+        Detaches window from shared. Returns True when it is the last window: the caller then ends the session, and
+        stays attached until ended returns it.
+        """
+        with self._lock:
+            if len(shared.windows) > 1 and window in shared.windows:
+                shared.windows.remove(window)
+                return False
+            self.forget(shared)
+            return True
+
+    def forget(self, shared: SharedSession) -> None:
+        """
+        Makes windows that attach from now on start a new session instead of attaching to shared.
+        """
+        with self._lock:
+            if self._shared.get(shared.key) is shared:
+                del self._shared[shared.key]
+
+    def windows(self, shared: SharedSession) -> List[Any]:
+        with self._lock:
+            return list(shared.windows)
+
+    def initialized(self, shared: SharedSession) -> List[Any]:
+        """
+        Returns the windows that attached to shared before it was initialized, and that are to use it now.
+        """
+        with self._lock:
+            shared.initialized = True
+            return list(shared.windows)
+
+    def ended(self, shared: SharedSession) -> List[Any]:
+        """
+        Returns the windows that were still attached to shared when its server exited, and forgets it.
+        """
+        with self._lock:
+            self.forget(shared)
+            windows = shared.windows
+            shared.windows = []
+            return windows
+
+
+shared_sessions = SessionRegistry()
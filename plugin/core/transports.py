@@ -1,14 +1,20 @@
 from abc import ABCMeta, abstractmethod
+import os
+import shutil
+import tempfile
 import threading
 import time
 import socket
-from queue import Queue
+from collections import deque
+from queue import Empty
 import subprocess
+from .codec import StreamingBody, encode_payload, format_request
 from .logging import exception_log, debug
+from .protocol import ErrorCode
 
 try:
-    from typing import Callable, Dict, Any, Optional, IO
-    assert Callable and Dict and Any and Optional and subprocess and IO
+    from typing import Callable, Dict, Any, Optional, IO, List, Tuple
+    assert Callable and Dict and Any and Optional and subprocess and IO and List and Tuple
 except ImportError:
     pass
 
@@ -16,6 +22,29 @@ except ImportError:
 ContentLengthHeader = b"Content-Length: "
 ContentLengthHeader_len = len(ContentLengthHeader)
 TCP_CONNECT_TIMEOUT = 5
+CONNECT_RETRY_DELAY = 0.01
+CONNECT_MAX_RETRY_DELAY = 0.5
+UNIX_SOCKET_BUFFER_SIZE = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+MAX_IDLE_BUFFER_SIZE = 1024 * 1024
+# Every message is written as two buffers, this keeps a single writev call well below IOV_MAX.
+MAX_COALESCED_MESSAGES = 64
+# Requests are refused once this many messages wait for a server that doesn't keep up. Notifications and responses
+# are always queued: see SendQueue.
+MAX_QUEUED_MESSAGES = 1024
+
+# Priority classes of outgoing messages, the writer takes them in this order.
+PRIORITY_SYNC = 0  # notifications like didChange, and $/cancelRequest
+PRIORITY_INTERACTIVE = 1  # requests that someone waits for, like hover and completion
+PRIORITY_BACKGROUND = 2  # bulk requests
+LIFECYCLE_METHODS = ("initialize", "shutdown")
+BACKGROUND_METHODS = (
+    "workspace/executeCommand",
+    "workspace/symbol",
+    "textDocument/documentColor",
+    "textDocument/documentSymbol",
+    "textDocument/codeLens",
+)
 
 try:
     from typing import Any, Dict, Callable
@@ -28,6 +57,19 @@ class UnexpectedProcessExitError(Exception):
     pass
 
 
+# What the framers of this thread know about the message they hand to on_receive, see received_frame.
+_receiving = threading.local()
+
+
+def received_frame() -> 'Optional[Tuple[float, int]]':
+    """
+    Returns when the first byte of the message that on_receive is handling on this thread arrived, as a
+    time.monotonic() timestamp, and the size of its body in bytes. Returns None when the message didn't come from a
+    ContentLengthFramer.
+    """
+    return getattr(_receiving, "frame", None)
+
+
 class Transport(object, metaclass=ABCMeta):
     @abstractmethod
     def __init__(self) -> None:
@@ -41,22 +83,138 @@ class Transport(object, metaclass=ABCMeta):
     def send(self, message: str) -> None:
         pass
 
+    def send_payload(self, payload: 'Dict[str, Any]') -> int:
+        """
+        Sends the JSON of payload and returns the size of its body, or 0 when that isn't known yet. Transports that
+        write bytes override this to stream large payloads.
+        """
+        message = format_request(payload)
+        self.send(message)
+        return len(message)
+
+    def queue_depth(self) -> int:
+        """
+        Returns the number of messages that were sent but not written yet.
+        """
+        return 0
+
     @abstractmethod
     def close(self) -> None:
         pass
 
 
-STATE_HEADERS = 0
-STATE_CONTENT = 1
-STATE_EOF = 2
+class ContentLengthFramer(object):
+    """
+    Splits a byte stream into Content-Length delimited message bodies.
 
-StateStrings = {STATE_HEADERS: 'STATE_HEADERS',
-                STATE_CONTENT: 'STATE_CONTENT',
-                STATE_EOF:     'STATE_EOF'}
+    Incoming bytes are read straight into one reusable buffer. Bodies are decoded from a memoryview of that buffer,
+    so a message is never copied before it is handed to on_receive, no matter how many reads it took to arrive.
+    While on_receive runs, received_frame tells when the message started to arrive and how many bytes it took.
+    """
 
+    __slots__ = ('_on_receive', '_chunk_size', '_buffer', '_start', '_end', '_content_length', '_read_at',
+                 '_first_byte_at')
 
-def state_to_string(state: int) -> str:
-    return StateStrings.get(state, '<unknown state: {}>'.format(state))
+    def __init__(self, on_receive: 'Callable[[str], None]', chunk_size: int = READ_CHUNK_SIZE) -> None:
+        self._on_receive = on_receive
+        self._chunk_size = chunk_size
+        self._buffer = bytearray(chunk_size)
+        self._start = 0  # offset of the first byte that was not consumed yet
+        self._end = 0  # offset one past the last byte that was received
+        self._content_length = -1  # size of the body being received, -1 while reading headers
+        self._read_at = 0.0  # when the last bytes were received
+        self._first_byte_at = 0.0  # when the first byte of the message being received arrived
+
+    def read_from(self, readinto: 'Callable[[memoryview], Optional[int]]') -> int:
+        """
+        Reads the next chunk of the stream into the buffer, returns the number of bytes read (0 means EOF).
+        """
+        if self._content_length < 0:
+            self._reserve(self._chunk_size)
+        else:
+            # Make room for the rest of the body at once, so that it arrives in as few reads as possible.
+            self._reserve(max(self._chunk_size, self._start + self._content_length - self._end))
+        view = memoryview(self._buffer)[self._end:]
+        try:
+            count = readinto(view) or 0
+        finally:
+            view.release()
+        self._received(count)
+        return count
+
+    def feed(self, data: bytes) -> None:
+        """
+        Appends data to the buffer and dispatches the messages that are complete.
+        """
+        self._reserve(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._received(len(data))
+        self.process()
+
+    def _received(self, count: int) -> None:
+        if not count:
+            return
+        self._read_at = time.monotonic()
+        if self._start == self._end and self._content_length < 0:
+            self._first_byte_at = self._read_at
+        self._end += count
+
+    def process(self) -> None:
+        """
+        Dispatches every complete message in the buffer to on_receive.
+        """
+        while True:
+            if self._content_length < 0:
+                headers_end = self._buffer.find(b"\r\n\r\n", self._start, self._end)
+                if headers_end < 0:
+                    break
+                self._content_length = parse_content_length(self._buffer[self._start:headers_end])
+                self._start = headers_end + 4
+            body_end = self._start + self._content_length
+            if body_end > self._end:
+                break
+            content = None  # type: Optional[str]
+            if self._content_length > 0:
+                view = memoryview(self._buffer)[self._start:body_end]
+                try:
+                    content = str(view, "UTF-8")
+                finally:
+                    view.release()
+            frame = (self._first_byte_at, self._content_length)
+            self._start = body_end
+            self._content_length = -1
+            # Any bytes left over arrived with the read that completed this message.
+            self._first_byte_at = self._read_at
+            if content is not None:
+                _receiving.frame = frame
+                try:
+                    self._on_receive(content)
+                finally:
+                    _receiving.frame = None
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buffer) > MAX_IDLE_BUFFER_SIZE:
+                # Don't hold on to the memory of a burst of huge messages.
+                self._buffer = bytearray(self._chunk_size)
+
+    def _reserve(self, size: int) -> None:
+        if len(self._buffer) - self._end >= size:
+            return
+        if self._start > 0:
+            # Move the partially received message to the front, this only ever copies an incomplete message.
+            del self._buffer[:self._start]
+            self._end -= self._start
+            self._start = 0
+        missing = size - (len(self._buffer) - self._end)
+        if missing > 0:
+            self._buffer.extend(bytes(missing))
+
+
+def parse_content_length(headers: bytearray) -> int:
+    for header in headers.split(b"\r\n"):
+        if header.startswith(ContentLengthHeader):
+            return int(header[ContentLengthHeader_len:])
+    return 0
 
 
 def start_tcp_listener(tcp_port: int) -> socket.socket:
@@ -69,31 +227,297 @@ def start_tcp_listener(tcp_port: int) -> socket.socket:
     return sock
 
 
-def start_tcp_transport(port: int, host: 'Optional[str]' = None) -> 'Transport':
-    start_time = time.time()
-    debug('connecting to {}:{}'.format(host or "localhost", port))
+def accept_connection(listener: socket.socket) -> socket.socket:
+    """
+    Waits up to TCP_CONNECT_TIMEOUT for the server to connect to listener, and closes listener.
+    """
+    try:
+        sock, address = listener.accept()
+    except socket.timeout:
+        raise Exception("Timeout waiting for the server to connect")
+    finally:
+        listener.close()
+    debug('accepted connection from {}'.format(address))
+    sock.settimeout(None)
+    return sock
+
 
-    while time.time() - start_time < TCP_CONNECT_TIMEOUT:
+def connect_with_backoff(connect: 'Callable[[], socket.socket]') -> socket.socket:
+    """
+    Calls connect until the server accepts the connection, waiting longer after every attempt that was refused.
+    """
+    start_time = time.time()
+    delay = CONNECT_RETRY_DELAY
+    while True:
         try:
-            sock = socket.create_connection((host or "localhost", port))
-            return TCPTransport(sock)
-        except ConnectionRefusedError:
-            pass
+            return connect()
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The server didn't start listening yet.
+            if time.time() - start_time + delay > TCP_CONNECT_TIMEOUT:
+                raise Exception("Timeout connecting to socket")
+            time.sleep(delay)
+            delay = min(delay * 2, CONNECT_MAX_RETRY_DELAY)
 
-    # process.kill()
-    raise Exception("Timeout connecting to socket")
 
+def connect_tcp(port: int, host: 'Optional[str]' = None) -> socket.socket:
+    debug('connecting to {}:{}'.format(host or "localhost", port))
+    return connect_with_backoff(lambda: socket.create_connection((host or "localhost", port)))
+
+
+def create_unix_socket_path() -> str:
+    """
+    Returns a path for the Unix domain socket of a server, in a new directory that only the user can access.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise Exception('tcp_mode "unix" is not supported on this platform')
+    return os.path.join(tempfile.mkdtemp(prefix="lsp-"), "server.sock")
+
+
+def connect_unix(path: str) -> socket.socket:
+    """
+    Connects to the server listening on the Unix domain socket at path, and removes the socket's directory once
+    connected.
+    """
+    debug('connecting to {}'.format(path))
+
+    def connect() -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Large buffers let a big message (like a didOpen of a large file) go out in one write.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UNIX_SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UNIX_SOCKET_BUFFER_SIZE)
+        try:
+            sock.connect(path)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    try:
+        return connect_with_backoff(connect)
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def encode_message(content: str) -> 'Tuple[bytes, bytes]':
+    body = content.encode("UTF-8")
+    header = "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii")
+    return header, body
+
+
+def document_uri(payload: 'Dict[str, Any]') -> 'Optional[str]':
+    """
+    Returns the URI of the text document that a request or notification is about, if any.
+    """
+    params = payload.get("params")
+    if isinstance(params, dict):
+        text_document = params.get("textDocument")
+        if isinstance(text_document, dict):
+            return text_document.get("uri")
+    return None
+
+
+def is_full_did_change(payload: 'Dict[str, Any]') -> bool:
+    """
+    Returns whether payload is a didChange notification that replaces the entire content of its document.
+    """
+    if payload.get("method") != "textDocument/didChange":
+        return False
+    changes = payload["params"].get("contentChanges")
+    return bool(changes) and all("range" not in change for change in changes)
+
+
+def message_priority(payload: 'Dict[str, Any]') -> int:
+    """
+    Returns the priority class of an outgoing request, notification or response.
+    """
+    method = payload.get("method")
+    if method is None:
+        return PRIORITY_INTERACTIVE  # a response, that the server waits for
+    if "id" not in payload or method in LIFECYCLE_METHODS:
+        return PRIORITY_SYNC
+    if method in BACKGROUND_METHODS:
+        return PRIORITY_BACKGROUND
+    return PRIORITY_INTERACTIVE
+
+
+def is_refusable(request_id: 'Any', priority: int) -> bool:
+    """
+    Returns whether a message may be refused when too many messages are queued: requests, but not initialize and
+    shutdown.
+    """
+    return request_id is not None and priority != PRIORITY_SYNC
+
+
+class SendQueueFull(Exception):
+    """
+    Raised when a request is put in a send queue that is full. The request isn't queued.
+    """
+
+
+class SendQueue(object):
+    """
+    A bounded queue of outgoing messages, shared by a transport's sender threads and its writer.
+
+    Messages are taken by priority class, and in order within a class. A message never overtakes an earlier one
+    about the same document, and a $/cancelRequest never overtakes the request it cancels: such a message is queued
+    in the class of the earlier message instead.
+
+    Messages that a server hasn't read yet may be superseded: a full content didChange replaces a didChange for the
+    same document that is still queued, provided that no message about that document was queued in between. Without
+    that, a stalled server would collect a copy of the document for every edit.
+
+    put never blocks, as it is called from the UI thread and from the threads that answer the server. While the
+    queue is full, requests are refused with SendQueueFull, except for initialize and shutdown. Notifications and
+    responses are queued even then: without them, the server would have the wrong content of a document, or wait for
+    an answer that never comes. So they aren't bounded here. What keeps them in check is that full didChanges
+    supersede each other, that didChanges are held back while a server is backlogged (see DID_CHANGE_MAX_BACKLOG in
+    windows.py), and that responses only answer requests of the server.
+    """
+
+    def __init__(self, maxsize: int = MAX_QUEUED_MESSAGES) -> None:
+        self._maxsize = maxsize
+        # Entries are (sequence, message, uri, supersedes, request_id) tuples.
+        self._classes = [deque() for _ in range(PRIORITY_BACKGROUND + 1)]  # type: List[deque]
+        self._size = 0
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, message: 'Optional[Tuple[bytes, Any]]', uri: 'Optional[str]' = None,
+            supersedes: bool = False, priority: int = PRIORITY_INTERACTIVE, request_id: 'Any' = None,
+            cancels: 'Any' = None) -> None:
+        """
+        Queues message, which is about the document at uri. Supersedes is whether message makes an earlier, unwritten
+        didChange for that document redundant. request_id is the ID of a request, and cancels the ID of the request
+        that a $/cancelRequest cancels. None tells the writer to stop once everything before it is written.
+        """
+        with self._condition:
+            if message is None:
+                self._closed = True
+                self._append(PRIORITY_BACKGROUND, None, None, False, None)
+            elif self._closed:
+                return
+            else:
+                if not (supersedes and self._supersede(uri)):
+                    if is_refusable(request_id, priority) and self._size >= self._maxsize:
+                        raise SendQueueFull()
+                self._append(self._placement(priority, uri, cancels), message, uri, supersedes, request_id)
+            self._condition.notify_all()
 
-def build_message(content: str) -> str:
-    content_length = len(content)
-    result = "Content-Length: {}\r\n\r\n{}".format(content_length, content)
-    return result
+    def put_payload(self, payload: 'Dict[str, Any]') -> int:
+        """
+        Queues the message for payload and returns the size of its body in bytes.
+        """
+        request_id = payload.get("id") if "method" in payload else None
+        cancels = payload["params"].get("id") if payload.get("method") == "$/cancelRequest" else None
+        message = encode_payload(payload)
+        self.put(message, document_uri(payload), is_full_did_change(payload), message_priority(payload), request_id,
+                 cancels)
+        return len(message[1])
+
+    def get(self, block: bool = True) -> 'Optional[Tuple[bytes, Any]]':
+        with self._condition:
+            while not self._size:
+                if not block:
+                    raise Empty()
+                self._condition.wait()
+            for entries in self._classes:
+                if entries:
+                    message = entries.popleft()[1]
+                    break
+            self._size -= 1
+            self._condition.notify_all()
+            return message
+
+    def get_nowait(self) -> 'Optional[Tuple[bytes, Any]]':
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        with self._condition:
+            return self._size
+
+    def _append(self, priority: int, message: 'Optional[Tuple[bytes, Any]]', uri: 'Optional[str]',
+                supersedes: bool, request_id: 'Any') -> None:
+        self._sequence += 1
+        self._classes[priority].append((self._sequence, message, uri, supersedes, request_id))
+        self._size += 1
+
+    def _placement(self, priority: int, uri: 'Optional[str]', cancels: 'Any') -> int:
+        """
+        Returns the lowest priority class, but not above priority, that has a message that must be written first.
+        """
+        for lower in range(len(self._classes) - 1, priority, -1):
+            for entry in self._classes[lower]:
+                if entry[1] is None:
+                    continue
+                if (uri is not None and entry[2] == uri) or (cancels is not None and entry[4] == cancels):
+                    return lower
+        return priority
+
+    def _supersede(self, uri: 'Optional[str]') -> bool:
+        """
+        Removes the last queued message about the document at uri, if it is a didChange that may be superseded.
+        """
+        latest = None  # type: Optional[Tuple[deque, Any]]
+        for entries in self._classes:
+            for entry in entries:
+                if entry[1] is not None and entry[2] == uri and (latest is None or entry[0] > latest[1][0]):
+                    latest = (entries, entry)
+        if latest is None or not latest[1][3]:
+            return False
+        # The newer message takes the place at the end of the queue, after everything queued before it.
+        latest[0].remove(latest[1])
+        self._size -= 1
+        return True
+
+
+def collect_pending(send_queue: SendQueue, message: 'Tuple[bytes, Any]') -> 'Tuple[List[Any], bool]':
+    """
+    Returns the buffers of message and of every message that is already waiting in the queue, and whether the queue
+    was asked to stop.
+    """
+    buffers = list(message)  # type: List[Any]
+    for _ in range(1, MAX_COALESCED_MESSAGES):
+        try:
+            pending = send_queue.get_nowait()
+        except Empty:
+            break
+        if pending is None:
+            return buffers, True
+        buffers.extend(pending)
+    return buffers, False
+
+
+def write_vectored(writev: 'Callable[[List[Any]], int]', buffers: 'List[Any]') -> None:
+    """
+    Writes all buffers with as few writev calls as possible, resuming after a partial write.
+
+    A StreamingBody among the buffers is encoded and written one chunk at a time.
+    """
+    start = 0
+    for index, buffer in enumerate(buffers):
+        if isinstance(buffer, StreamingBody):
+            write_all(writev, buffers[start:index])
+            for chunk in buffer.chunks():
+                write_all(writev, [chunk])
+            start = index + 1
+    write_all(writev, buffers[start:])
+
+
+def write_all(writev: 'Callable[[List[Any]], int]', buffers: 'List[Any]') -> None:
+    while buffers:
+        written = writev(buffers)
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers[0])
+            del buffers[0]
+        if written:
+            buffers[0] = memoryview(buffers[0])[written:]
 
 
 class TCPTransport(Transport):
     def __init__(self, socket: 'Any') -> None:
         self.socket = socket  # type: 'Optional[Any]'
-        self.send_queue = Queue()  # type: Queue[Optional[str]]
+        self.send_queue = SendQueue()
 
     def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
         self.on_receive = on_receive
@@ -109,72 +533,58 @@ class TCPTransport(Transport):
         self.on_closed()
 
     def read_socket(self) -> None:
-        remaining_data = b""
-        is_incomplete = False
-        read_state = STATE_HEADERS
-        content_length = 0
+        framer = ContentLengthFramer(self.on_receive)
         while self.socket:
-            is_incomplete = False
             try:
-                received_data = self.socket.recv(4096)
+                received = framer.read_from(self.socket.recv_into)
             except Exception as err:
                 exception_log("Failure reading from socket", err)
                 self.close()
                 break
 
-            if not received_data:
+            if not received:
                 debug("no data received, closing")
                 self.close()
                 break
 
-            data = remaining_data + received_data
-            remaining_data = b""
-
-            while len(data) > 0 and not is_incomplete:
-                if read_state == STATE_HEADERS:
-                    headers, _sep, rest = data.partition(b"\r\n\r\n")
-                    if len(_sep) < 1:
-                        is_incomplete = True
-                        remaining_data = data
-                    else:
-                        for header in headers.split(b"\r\n"):
-                            if header.startswith(ContentLengthHeader):
-                                header_value = header[ContentLengthHeader_len:]
-                                content_length = int(header_value)
-                                read_state = STATE_CONTENT
-                        data = rest
-
-                if read_state == STATE_CONTENT:
-                    # read content bytes
-                    if len(data) >= content_length:
-                        content = data[:content_length]
-                        self.on_receive(content.decode("UTF-8"))
-                        data = data[content_length:]
-                        read_state = STATE_HEADERS
-                    else:
-                        is_incomplete = True
-                        remaining_data = data
+            framer.process()
 
     def send(self, content: str) -> None:
-        self.send_queue.put(build_message(content))
+        self.send_queue.put(encode_message(content))
+
+    def send_payload(self, payload: 'Dict[str, Any]') -> int:
+        return self.send_queue.put_payload(payload)
+
+    def queue_depth(self) -> int:
+        return self.send_queue.qsize()
 
     def write_socket(self) -> None:
         while self.socket:
             message = self.send_queue.get()
             if message is None:
                 break
-            else:
-                try:
-                    self.socket.sendall(bytes(message, 'UTF-8'))
-                except Exception as err:
-                    exception_log("Failure writing to socket", err)
-                    self.close()
+            buffers, stop = collect_pending(self.send_queue, message)
+            try:
+                write_vectored(self._send_buffers, buffers)
+            except Exception as err:
+                exception_log("Failure writing to socket", err)
+                self.close()
+            if stop:
+                break
+
+    def _send_buffers(self, buffers: 'List[Any]') -> int:
+        sock = self.socket  # type: Any
+        if hasattr(sock, "sendmsg"):
+            return sock.sendmsg(buffers)
+        data = b"".join(buffers)
+        sock.sendall(data)
+        return len(data)
 
 
 class StdioTransport(Transport):
     def __init__(self, process: 'subprocess.Popen') -> None:
         self.process = process  # type: Optional[subprocess.Popen]
-        self.send_queue = Queue()  # type: Queue[Optional[str]]
+        self.send_queue = SendQueue()
 
     def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
         self.on_receive = on_receive
@@ -195,49 +605,34 @@ class StdioTransport(Transport):
         else:
             raise UnexpectedProcessExitError()
 
+    def _checked_stdin(self) -> 'IO[Any]':
+        if self.process and self.process.stdin:
+            return self.process.stdin
+        else:
+            raise UnexpectedProcessExitError()
+
     def read_stdout(self) -> None:
         """
         Reads JSON responses from process and dispatch them to response_handler
         """
-        running = True
         pid = self.process.pid if self.process else "???"
-        state = STATE_HEADERS
-        content_length = 0
-        while running and self.process and state != STATE_EOF:
-            running = self.process.poll() is None
+        framer = ContentLengthFramer(self.on_receive)
+        while self.process:
             try:
-                # debug("read_stdout: state = {}".format(state_to_string(state)))
-                if state == STATE_HEADERS:
-                    header = self._checked_stdout().readline()
-                    # debug('read_stdout reads: {}'.format(header))
-                    if not header:
-                        # Truly, this is the EOF on the stream
-                        state = STATE_EOF
-                        break
-
-                    header = header.strip()
-                    if not header:
-                        # Not EOF, blank line -> content follows
-                        state = STATE_CONTENT
-                    elif header.startswith(ContentLengthHeader):
-                        content_length = int(header[ContentLengthHeader_len:])
-                elif state == STATE_CONTENT:
-                    if content_length > 0:
-                        content = self._checked_stdout().read(content_length)
-                        self.on_receive(content.decode("UTF-8"))
-                        # debug("read_stdout: read and received {} byte message".format(content_length))
-                        content_length = 0
-                    state = STATE_HEADERS
-
+                stdout = self._checked_stdout()
+                # Read from the raw stream: BufferedReader.readinto blocks until the entire buffer is filled.
+                raw = getattr(stdout, "raw", stdout)  # type: Any
+                if not framer.read_from(raw.readinto):
+                    # Truly, this is the EOF on the stream
+                    break
+                framer.process()
             except (AttributeError, IOError) as err:
                 self.close()
                 exception_log("Failure reading stdout", err)
-                state = STATE_EOF
                 break
             except UnexpectedProcessExitError:
                 self.close()
                 debug("process became None")
-                state = STATE_EOF
                 break
         debug("process {} stdout ended {}".format(pid, "(still alive)" if self.process else "(terminated)"))
         if self.process:
@@ -249,21 +644,130 @@ class StdioTransport(Transport):
         self.send_queue.put(None)
 
     def send(self, content: str) -> None:
-        self.send_queue.put(build_message(content))
+        self.send_queue.put(encode_message(content))
+
+    def send_payload(self, payload: 'Dict[str, Any]') -> int:
+        return self.send_queue.put_payload(payload)
+
+    def queue_depth(self) -> int:
+        return self.send_queue.qsize()
 
     def write_stdin(self) -> None:
         while self.process:
             message = self.send_queue.get()
             if message is None:
                 break
-            else:
+            buffers, stop = collect_pending(self.send_queue, message)
+            try:
+                write_vectored(self._write_buffers, buffers)
+            except UnexpectedProcessExitError:
+                return
+            except (BrokenPipeError, OSError) as err:
+                exception_log("Failure writing to stdout", err)
+                self.close()
+            if stop:
+                break
+
+    def _write_buffers(self, buffers: 'List[Any]') -> int:
+        stdin = self._checked_stdin()
+        if hasattr(os, "writev"):
+            # The buffered stdin object is never written to, so writing to its file descriptor directly is safe.
+            return os.writev(stdin.fileno(), buffers)
+        data = b"".join(buffers)
+        stdin.write(data)
+        stdin.flush()
+        return len(data)
+
+
+class ConnectingTransport(Transport):
+    """
+    The transport of a server that may not accept connections yet.
+
+    It connects on a thread of its own, and then hands over to the transport that transport_factory makes for the
+    socket. Messages that are sent in the meantime are queued, so sessions can start without waiting for the server.
+    That queue is bounded like a SendQueue. A queued request that the transport refuses once connected gets a
+    ServerBusy error response, as if the server had sent it.
+    """
+
+    def __init__(self, connect: 'Callable[[], Any]', transport_factory: 'Callable[[Any], Transport]') -> None:
+        self._connect = connect
+        self._transport_factory = transport_factory
+        self._transport = None  # type: Optional[Transport]
+        # Entries are (send, payload) tuples, payload is None for messages that are sent as text.
+        self._pending = []  # type: List[Tuple[Callable[[Transport], Any], Optional[Dict[str, Any]]]]
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
+        self.on_receive = on_receive
+        self.on_closed = on_closed
+        self.connect_thread = threading.Thread(target=self._run, name="LSP connect")
+        self.connect_thread.daemon = True
+        self.connect_thread.start()
+
+    def send(self, content: str) -> None:
+        self._forward(lambda transport: transport.send(content), None)
+
+    def send_payload(self, payload: 'Dict[str, Any]') -> int:
+        return self._forward(lambda transport: transport.send_payload(payload), payload) or 0
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            transport = self._transport
+            if transport is None:
+                return len(self._pending)
+        return transport.queue_depth()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            transport = self._transport
+        if transport:
+            transport.close()  # which calls on_closed
+        else:
+            self.on_closed()
+
+    def _forward(self, send: 'Callable[[Transport], Any]', payload: 'Optional[Dict[str, Any]]') -> 'Any':
+        with self._lock:
+            transport = self._transport
+            if transport is None:
+                if payload is not None and len(self._pending) >= MAX_QUEUED_MESSAGES and is_refusable(
+                        payload.get("id") if "method" in payload else None, message_priority(payload)):
+                    raise SendQueueFull()
+                self._pending.append((send, payload))
+                return None
+        return send(transport)
+
+    def _run(self) -> None:
+        try:
+            sock = self._connect()
+        except Exception as err:
+            exception_log("Failure connecting to server", err)
+            self.close()
+            return
+        transport = self._transport_factory(sock)
+        with self._lock:
+            if self._closed:
+                sock.close()
+                return
+            transport.start(self.on_receive, self.on_closed)
+            # Senders wait for the lock, so the queued messages go out before anything that is sent from now on.
+            refused = []  # type: List[Dict[str, Any]]
+            for send, payload in self._pending:
                 try:
-                    msgbytes = bytes(message, 'UTF-8')
-                    try:
-                        self.process.stdin.write(msgbytes)
-                    except AttributeError:
-                        return
-                    self.process.stdin.flush()
-                except (BrokenPipeError, OSError) as err:
-                    exception_log("Failure writing to stdout", err)
-                    self.close()
+                    send(transport)
+                except SendQueueFull:
+                    if payload is not None:
+                        refused.append(payload)
+            self._pending = []
+            self._transport = transport
+        for payload in refused:
+            self._refuse(payload)
+
+    def _refuse(self, payload: 'Dict[str, Any]') -> None:
+        method = payload.get("method")
+        debug("too many messages queued, not sending", method)
+        error = {"code": ErrorCode.ServerBusy, "message": "too many messages queued for {}".format(method)}
+        self.on_receive(format_request({"jsonrpc": "2.0", "id": payload.get("id"), "error": error}))
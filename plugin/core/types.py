@@ -30,6 +30,11 @@ class Settings(object):
         self.log_server = True
         self.log_stderr = False
         self.log_payloads = False
+        self.io_backend = "threads"
+        self.server_pool_size = 0
+        self.server_pool_idle_timeout = 600
+        self.share_sessions_between_windows = False
+        self.feature_request_timeout = 10
 
 
 class ClientStates(object):
@@ -1,10 +1,12 @@
 from .diagnostics import DiagnosticsStorage
 from .edit import parse_workspace_edit
+from .log_buffer import LogBuffer
 from .logging import debug
 from .message_request_handler import MessageRequestHandler
-from .protocol import Notification, Response
+from .protocol import Notification, Response, WorkspaceFolder
 from .rpc import Client, SublimeLogger
 from .sessions import Session
+from .shared_sessions import session_key, SessionRegistry, shared_sessions, SharedSession
 from .types import ClientConfig
 from .types import ClientStates
 from .types import config_supports_syntax
@@ -14,8 +16,9 @@ from .types import LanguageConfig
 from .types import Settings
 from .types import ViewLike
 from .types import WindowLike
-from .typing import Optional, List, Callable, Dict, Any, Protocol, Set
-from .views import did_change, did_close, did_open, did_save, will_save
+from .typing import Optional, List, Callable, Dict, Any, Protocol, Set, Tuple
+from .url import filename_to_uri
+from .views import did_change, did_open, did_save, will_save
 from .workspace import disable_in_project
 from .workspace import enable_in_project
 from .workspace import get_workspace_folders
@@ -26,6 +29,10 @@ from weakref import ref
 import threading
 
 
+# A debounced didChange waits while a server has more messages than this to catch up on.
+DID_CHANGE_MAX_BACKLOG = 16
+
+
 class SublimeLike(Protocol):
 
     def set_timeout_async(self, f: Callable, timeout_ms: int = 0) -> None:
@@ -112,6 +119,9 @@ class WindowDocumentHandler(object):
         self._configs = configs
         self._window = window
         self._document_states = set()  # type: Set[str]
+        # The sessions that this window opened each document in. Sessions shared with other windows know which windows
+        # have a document open, and only the one that owns it syncs it with the server.
+        self._opened_documents = dict()  # type: Dict[str, List[Session]]
         self._pending_buffer_changes = dict()  # type: Dict[int, Dict]
         self._sessions = dict()  # type: Dict[str, List[Session]]
         self._workspace = workspace
@@ -123,8 +133,32 @@ class WindowDocumentHandler(object):
         self._notify_open_documents(session)
 
     def remove_session(self, config_name: str) -> None:
-        if config_name in self._sessions:
-            del self._sessions[config_name]
+        for session in self._sessions.pop(config_name, []):
+            self._close_documents(session)
+
+    def _close_documents(self, session: Session) -> None:
+        for file_name, sessions in list(self._opened_documents.items()):
+            if session in sessions:
+                sessions.remove(session)
+                if not sessions:
+                    del self._opened_documents[file_name]
+                self._close_document(file_name, session)
+
+    def _close_document(self, file_name: str, session: Session) -> None:
+        owned, successor = session.close_document(file_name, self)
+        if owned and session.client and session.should_notify_did_close():
+            session.client.send_notification(
+                Notification.didClose({"textDocument": {"uri": filename_to_uri(file_name)}}))
+            if successor:
+                successor._reopen_document(file_name, session)
+
+    def _reopen_document(self, file_name: str, session: Session) -> None:
+        """
+        Opens file_name with the server again, with the text of the view of this window, which now owns it.
+        """
+        view = self._window.find_open_file(file_name)
+        if view:
+            self._notify_did_open(view, session)
 
     def reset(self) -> None:
         for view in self._window.views():
@@ -157,8 +191,7 @@ class WindowDocumentHandler(object):
                         sessions = self._get_applicable_sessions(view)
                         self._attach_view(view, sessions)
                         for session in sessions:
-                            if session.should_notify_did_open():
-                                self._notify_did_open(view, session)
+                            self._open_document(view, session)
 
     def _is_supported_view(self, view: ViewLike) -> bool:
         return self._configs.syntax_supported(view)
@@ -199,8 +232,16 @@ class WindowDocumentHandler(object):
                 sessions = self._get_applicable_sessions(view)
                 self._attach_view(view, sessions)
                 for session in sessions:
-                    if session.should_notify_did_open():
-                        self._notify_did_open(view, session)
+                    self._open_document(view, session)
+
+    def _open_document(self, view: ViewLike, session: Session) -> None:
+        file_name = view.file_name() or ""
+        sessions = self._opened_documents.setdefault(file_name, [])
+        if session in sessions:
+            return
+        sessions.append(session)
+        if session.open_document(file_name, self) and session.should_notify_did_open():
+            self._notify_did_open(view, session)
 
     def _notify_did_open(self, view: ViewLike, session: Session) -> None:
         language_id = self._view_language(view, session.config.name)
@@ -214,11 +255,8 @@ class WindowDocumentHandler(object):
             self._document_states.remove(file_name)
         except KeyError:
             return
-        # mypy: expected sublime.View, got ViewLike
-        notification = did_close(view)  # type: ignore
-        for session in self._get_applicable_sessions(view):
-            if session.client and session.should_notify_did_close():
-                session.client.send_notification(notification)
+        for session in self._opened_documents.pop(file_name, []):
+            self._close_document(file_name, session)
 
     def handle_will_save(self, view: ViewLike, reason: int) -> None:
         file_name = view.file_name()
@@ -262,9 +300,19 @@ class WindowDocumentHandler(object):
 
         if pending_buffer:
             if buffer_version is None or buffer_version == pending_buffer["version"]:
+                if buffer_version is not None and self._is_backlogged(pending_buffer["view"]):
+                    # Don't add the content of the document to the queue of a busy server yet, try again later.
+                    self._sublime.set_timeout_async(lambda: self.purge_did_change(buffer_id, buffer_version), 500)
+                    return
                 self.notify_did_change(pending_buffer["view"])
                 self.changed()
 
+    def _is_backlogged(self, view: ViewLike) -> bool:
+        for session in self._get_applicable_sessions(view):
+            if session.client and session.client.queue_depth() > DID_CHANGE_MAX_BACKLOG:
+                return True
+        return False
+
     def notify_did_change(self, view: ViewLike) -> None:
         file_name = view.file_name()
         if file_name and view.window() == self._window:
@@ -277,7 +325,8 @@ class WindowDocumentHandler(object):
                 # mypy: expected sublime.View, got ViewLike
                 notification = did_change(view)  # type: ignore
                 for session in self._get_applicable_sessions(view):
-                    if session.client and file_name in self._document_states and session.should_notify_did_change():
+                    if (session.client and file_name in self._document_states and session.should_notify_did_change()
+                            and session.owns_document(file_name, self)):
                         session.client.send_notification(notification)
 
 
@@ -297,7 +346,8 @@ class WindowManager(object):
         session_starter: Callable,
         sublime: Any,
         handler_dispatcher: LanguageHandlerListener,
-        server_panel_factory: Optional[Callable] = None
+        server_panel_factory: Optional[Callable] = None,
+        session_registry: Optional[SessionRegistry] = None
     ) -> None:
         self._window = window
         self._settings = settings
@@ -305,7 +355,10 @@ class WindowManager(object):
         self.diagnostics = diagnostics
         self.documents = documents
         self.server_panel_factory = server_panel_factory
+        self._log_buffers = {}  # type: Dict[str, LogBuffer]
         self._sessions = dict()  # type: Dict[str, List[Session]]
+        self._session_registry = session_registry
+        self._shared_sessions = dict()  # type: Dict[Session, SharedSession]
         self._next_initialize_views = list()  # type: List[ViewLike]
         self._start_session = session_starter
         self._sublime = sublime
@@ -347,6 +400,9 @@ class WindowManager(object):
     def get_session(self, config_name: str, file_path: str) -> Optional[Session]:
         return self._find_session(config_name, file_path)
 
+    def get_sessions(self) -> List[Session]:
+        return [session for config_sessions in self._sessions.values() for session in config_sessions]
+
     def _is_session_ready(self, config_name: str, file_path: str) -> bool:
         maybe_session = self._find_session(config_name, file_path)
         return maybe_session is not None and maybe_session.state == ClientStates.READY
@@ -453,16 +509,17 @@ class WindowManager(object):
 
         self._window.status_message("Starting " + config.name + "...")
         session = None  # type: Optional[Session]
+        shared = None  # type: Optional[SharedSession]
+        initialized = False
         workspace_folders = sorted_workspace_folders(self._workspace.folders, file_path)
         try:
-            session = self._start_session(
-                self._window,                  # window
-                workspace_folders,             # workspace_folders
-                config,                        # config
-                self._handle_pre_initialize,   # on_pre_initialize
-                self._handle_post_initialize,  # on_post_initialize
-                self._handle_post_exit,        # on_post_exit
-                lambda msg: self._handle_stderr_log(config.name, msg))  # on_stderr_log
+            if self._session_registry and self._settings.share_sessions_between_windows:
+                shared, initialized = self._session_registry.attach(
+                    session_key(config, workspace_folders), self,
+                    lambda shared: self._start_window_session(config, workspace_folders, shared))
+                session = shared.session if shared else None
+            else:
+                session = self._start_window_session(config, workspace_folders, None)
         except Exception as e:
             message = "\n\n".join([
                 "Could not start {}",
@@ -476,6 +533,32 @@ class WindowManager(object):
         if session:
             debug("window {} added session {}".format(self._window.id(), config.name))
             self._sessions.setdefault(config.name, []).append(session)
+            if shared:
+                self._shared_sessions[session] = shared
+                if initialized:
+                    self._attach_session(session)
+
+    def _start_window_session(self, config: ClientConfig, workspace_folders: List[WorkspaceFolder],
+                              shared: Optional[SharedSession]) -> Optional[Session]:
+        return self._start_session(
+            self._window,                                                       # window
+            workspace_folders,                                                  # workspace_folders
+            config,                                                             # config
+            lambda session: self._handle_pre_initialize(session, shared),       # on_pre_initialize
+            lambda session: self._handle_post_initialize(session, shared),      # on_post_initialize
+            lambda config_name: self._handle_session_exit(config_name, shared),  # on_post_exit
+            lambda msg: self._primary(shared)._handle_stderr_log(config.name, msg))  # on_stderr_log
+
+    def _attached(self, shared: Optional[SharedSession]) -> 'List[WindowManager]':
+        """
+        The windows that use the session of shared, or this window for a session of its own.
+        """
+        if shared and self._session_registry:
+            return self._session_registry.windows(shared) or [self]
+        return [self]
+
+    def _primary(self, shared: Optional[SharedSession]) -> 'WindowManager':
+        return self._attached(shared)[0]
 
     def _handle_message_request(self, params: dict, source: str, client: Client, request_id: Any) -> None:
         handler = MessageRequestHandler(self._window.active_view(), client, request_id, params, source)  # type: ignore
@@ -493,6 +576,11 @@ class WindowManager(object):
     def end_config_sessions(self, config_name: str) -> None:
         config_sessions = self._sessions.pop(config_name, [])
         for session in config_sessions:
+            shared = self._shared_sessions.pop(session, None)
+            if shared and self._session_registry and not self._session_registry.detach(shared, self):
+                debug("window {} detached from session {}".format(self._window.id(), config_name))
+                self._handle_post_exit(config_name)
+                continue
             debug("unloading session", config_name)
             session.end()
 
@@ -504,69 +592,101 @@ class WindowManager(object):
                     candidate = folder
         return candidate
 
-    def _apply_workspace_edit(self, params: Dict[str, Any], client: Client, request_id: int) -> None:
+    def _apply_workspace_edit(self, params: Dict[str, Any], client: Client, request_id: int,
+                              shared: Optional[SharedSession] = None) -> None:
         edit = params.get('edit', dict())
         changes = parse_workspace_edit(edit)
-        self._window.run_command('lsp_apply_workspace_edit', {'changes': changes})
+        self._editing_window(shared, list(changes)).run_command('lsp_apply_workspace_edit', {'changes': changes})
         # TODO: We should ideally wait for all changes to have been applied.
         # This however seems overly complicated, because we have to bring along a string representation of the
         # client through the sublime-command invocations (as well as the request ID, but that is easy), and then
         # reconstruct/get the actual Client object back. Maybe we can (ab)use our homebrew event system for this?
         client.send_response(Response(request_id, {"applied": True}))
 
+    def _editing_window(self, shared: Optional[SharedSession], file_names: List[str]) -> WindowLike:
+        """
+        The window to apply an edit of these files in: the first one that has one of them open, or the primary one.
+        """
+        attached = self._attached(shared)
+        for manager in attached:
+            if any(manager._window.find_open_file(file_name) for file_name in file_names):
+                return manager._window
+        return attached[0]._window
+
     def _payload_log_sink(self, message: str) -> None:
-        self._sublime.set_timeout_async(lambda: self._handle_server_message(":", message), 0)
+        self._handle_server_message(":", message)
 
-    def _handle_pre_initialize(self, session: Session) -> None:
+    def _handle_pre_initialize(self, session: Session, shared: Optional[SharedSession] = None) -> None:
         client = session.client
-        client.set_crash_handler(lambda: self._handle_server_crash(session.config))
-        client.set_error_display_handler(self._window.status_message)
+        client.set_crash_handler(lambda: self._handle_server_crash(session.config, shared))
+        client.set_error_display_handler(lambda message: self._primary(shared)._window.status_message(message))
 
         if self.server_panel_factory and isinstance(client.logger, SublimeLogger):
             client.logger.server_name = session.config.name
-            client.logger.sink = self._payload_log_sink
+            client.logger.sink = lambda message: self._primary(shared)._payload_log_sink(message)
 
         client.on_request(
             "window/showMessageRequest",
-            lambda params, request_id: self._handle_message_request(params, session.config.name, client, request_id))
+            lambda params, request_id: self._primary(shared)._handle_message_request(
+                params, session.config.name, client, request_id))
 
         client.on_notification(
             "window/showMessage",
-            lambda params: self._handle_show_message(session.config.name, params))
+            lambda params: self._primary(shared)._handle_show_message(session.config.name, params))
 
-        client.on_notification(
-            "window/logMessage",
-            lambda params: self._handle_log_message(session.config.name, params))
+        if self._settings.log_server:
+            client.on_notification(
+                "window/logMessage",
+                lambda params: self._primary(shared)._handle_log_message(session.config.name, params))
 
-    def _handle_post_initialize(self, session: Session) -> None:
+    def _handle_post_initialize(self, session: Session, shared: Optional[SharedSession] = None) -> None:
 
         # handle server requests and notifications
         session.on_request(
             "workspace/applyEdit",
-            lambda params, request_id: self._apply_workspace_edit(params, session.client, request_id))
+            lambda params, request_id: self._apply_workspace_edit(params, session.client, request_id, shared))
 
         session.on_request(
             "window/workDoneProgress/create",
-            lambda params, request_id: self._receive_progress_token(params, session.client, request_id))
+            lambda params, request_id: self._primary(shared)._receive_progress_token(
+                params, session.client, request_id))
 
         session.on_notification(
             "textDocument/publishDiagnostics",
-            lambda params: self.diagnostics.receive(session.config.name, params))
+            lambda params: self._receive_diagnostics(session.config.name, params, shared))
 
         session.on_notification(
             "$/progress",
-            lambda params: self._handle_progress_notification(params))
-
-        self._handlers.on_initialized(session.config.name, self._window, session.client)
+            lambda params: self._primary(shared)._handle_progress_notification(params))
 
         session.client.send_notification(Notification.initialized())
 
+        if shared and self._session_registry:
+            for manager in self._session_registry.initialized(shared):
+                manager._attach_session(session)
+        else:
+            self._attach_session(session)
+
+    def _attach_session(self, session: Session) -> None:
+        self._handlers.on_initialized(session.config.name, self._window, session.client)
+
         if session.has_capability("textDocumentSync"):
             self.documents.add_session(session)
         self._window.status_message("{} initialized".format(session.config.name))
 
         self._open_pending_views()
 
+    def _receive_diagnostics(self, config_name: str, params: Dict[str, Any],
+                             shared: Optional[SharedSession] = None) -> None:
+        # Every window that shares a session has the same workspace folders, and so the same diagnostics.
+        for manager in self._attached(shared):
+            manager.diagnostics.receive(config_name, params)
+
+    def cancel_view_requests(self, view: ViewLike) -> None:
+        for session in self.get_sessions():
+            if session.client:
+                session.client.cancel_view_requests(view.id())
+
     def handle_view_closed(self, view: ViewLike) -> None:
         if view.file_name():
             if not self._is_closing:
@@ -628,8 +748,17 @@ class WindowManager(object):
             debug('window {} sessions unloaded - restarting'.format(self._window.id()))
             self.start_active_views()
 
+    def _handle_session_exit(self, config_name: str, shared: Optional[SharedSession]) -> None:
+        if shared and self._session_registry:
+            for manager in self._session_registry.ended(shared):
+                manager._handle_post_exit(config_name)
+        else:
+            self._handle_post_exit(config_name)
+
     def _handle_post_exit(self, config_name: str) -> None:
         self.documents.remove_session(config_name)
+        # A flush that is already scheduled still shows the last lines of the server.
+        self._log_buffers.pop(config_name, None)
         for view in self._window.views():
             file_name = view.file_name()
             if file_name:
@@ -639,19 +768,32 @@ class WindowManager(object):
         if not self._sessions:
             self._handle_all_sessions_ended()
 
-    def _handle_server_crash(self, config: ClientConfig) -> None:
+    def _handle_server_crash(self, config: ClientConfig, shared: Optional[SharedSession] = None) -> None:
+        if shared and self._session_registry:
+            # The windows that restart attach to a new session.
+            self._session_registry.forget(shared)
         msg = "Language server {} has crashed, do you want to restart it?".format(config.name)
         result = self._sublime.ok_cancel_dialog(msg, ok_title="Restart")
         if result == self._sublime.DIALOG_YES:
-            self.restart_sessions()
+            for manager in self._attached(shared):
+                manager.restart_sessions()
 
     def _handle_server_message(self, name: str, message: str) -> None:
+        if not self.server_panel_factory:
+            return
+        log_buffer = self._log_buffers.get(name)
+        if log_buffer is None:
+            log_buffer = self._log_buffers.setdefault(
+                name, LogBuffer(self._update_server_panel, self._sublime.set_timeout_async))
+        log_buffer.append(name, message)
+
+    def _update_server_panel(self, messages: List[Tuple[str, str]]) -> None:
         if not self.server_panel_factory:
             return
         panel = self.server_panel_factory(self._window)
         if not panel:
             return debug("no server panel for window", self._window.id())
-        panel.run_command("lsp_update_server_panel", {"prefix": name, "message": message})
+        panel.run_command("lsp_update_server_panel", {"messages": messages})
 
     def _handle_log_message(self, name: str, params: Any) -> None:
         self._handle_server_message(name, extract_message(params))
@@ -706,6 +848,7 @@ class WindowRegistry(object):
                 session_starter=self._session_starter,
                 sublime=self._sublime,
                 handler_dispatcher=self._handler_dispatcher,
-                server_panel_factory=self._server_panel_factory)
+                server_panel_factory=self._server_panel_factory,
+                session_registry=shared_sessions)
             self._windows[window.id()] = state
         return state
@@ -86,7 +86,9 @@ class DocumentHighlightListener(sublime_plugin.ViewEventListener):
             if client:
                 params = text_document_position_params(self.view, point)
                 request = Request.documentHighlight(params)
-                client.send_request(request, self._handle_response)
+                client.send_request(request, self._handle_response, view_id=self.view.id(),
+                                    timeout=settings.feature_request_timeout or None,
+                                    document_version=self.view.change_count())
 
     def _handle_response(self, response: Optional[List]) -> None:
         if not response:
@@ -103,7 +103,10 @@ class LspHoverCommand(LspTextCommand):
             if session.client:
                 session.client.send_request(
                     Request.hover(document_position),
-                    lambda response: self.handle_response(response, point))
+                    lambda response: self.handle_response(response, point),
+                    view_id=self.view.id(),
+                    timeout=settings.feature_request_timeout or None,
+                    document_version=self.view.change_count())
 
     def request_code_actions(self, point: int) -> None:
         actions_manager.request(self.view, point, lambda response: self.handle_code_actions(response, point))
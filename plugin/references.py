@@ -6,6 +6,7 @@ from .core.documents import is_at_word, get_position
 from .core.panels import ensure_panel
 from .core.protocol import Request, Point
 from .core.registry import LspTextCommand, windows
+from .core.rpc import RequestPromise
 from .core.settings import PLUGIN_NAME, settings
 from .core.typing import List, Dict, Optional, Tuple, TypedDict
 from .core.url import uri_to_filename
@@ -14,11 +15,84 @@ from .core.views import get_line, text_document_position_params
 ReferenceDict = TypedDict('ReferenceDict', {'uri': str, 'range': dict})
 
 
+# The search that fills the references panel of a window, by window id.
+panel_streams = {}  # type: Dict[int, ReferencesPanelStream]
+
+
 def ensure_references_panel(window: sublime.Window) -> 'Optional[sublime.View]':
     return ensure_panel(window, "references", r"^\s*\S\s+(\S.*):$", r"^\s+([0-9]+):?([0-9]+).*$",
                         "Packages/" + PLUGIN_NAME + "/Syntaxes/References.sublime-syntax")
 
 
+class ReferencesPanelStream(object):
+    """
+    Shows the references that one request finds in the references panel while they are decoded, a batch at a time.
+    Every request streams into a new one, so that a search started meanwhile doesn't mix its counts into this one.
+    """
+
+    def __init__(self, command: 'LspSymbolReferencesCommand', word: str, base_dir: Optional[str]) -> None:
+        self.command = command
+        self.word = word
+        self.base_dir = base_dir
+        self.references_count = 0
+        self.last_file = None  # type: Optional[str]
+        self.promise = None  # type: Optional[RequestPromise]
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Stops the search, and the batches that were decoded already, when another one takes over the panel.
+        """
+        self.cancelled = True
+        if self.promise:
+            self.promise.cancel()
+
+    def get_relative_path(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.base_dir) if self.base_dir else file_path
+
+    def append_references(self, references: List[ReferenceDict]) -> None:
+        window = self.command.view.window()
+        if not window or self.cancelled:
+            return
+        panel = ensure_references_panel(window)
+        if not panel:
+            return
+        text = ''
+        if not self.references_count:
+            base_dir = windows.lookup(window).get_project_path(self.command.view.file_name() or "")
+            panel.settings().set("result_base_dir", base_dir)
+            panel.run_command("lsp_clear_panel")
+            window.run_command("show_panel", {"panel": "output.references"})
+            text += "References for '{}'\n\n".format(self.word)
+        for file, file_references in self.command._group_references_by_file(references).items():
+            if file != self.last_file:
+                if self.last_file is not None:
+                    text += '\n'
+                text += '◌ {}:\n'.format(self.get_relative_path(file))
+                self.last_file = file
+            for point, line in file_references:
+                self.references_count += 1
+                text += '\t{:>8}:{:<4} {}\n'.format(point.row + 1, point.col + 1, line)
+        panel.run_command('append', {'characters': text, 'force': True, 'scroll_to_end': False})
+
+    def finish_references_panel(self, response: Optional[List[ReferenceDict]]) -> None:
+        if response:
+            self.append_references(response)
+        window = self.command.view.window()
+        if not window or self.cancelled:
+            return
+        if not self.references_count:
+            window.run_command("hide_panel", {"panel": "output.references"})
+            window.status_message("No references found")
+            return
+        window.status_message("{} references for '{}'".format(self.references_count, self.word))
+        panel = ensure_references_panel(window)
+        if panel:
+            # highlight all word occurrences
+            regions = panel.find_all(r"\b{}\b".format(self.word))
+            panel.add_regions('ReferenceHighlight', regions, 'comment', flags=sublime.DRAW_OUTLINED)
+
+
 class LspSymbolReferencesCommand(LspTextCommand):
     def __init__(self, view: sublime.View) -> None:
         super().__init__(view)
@@ -50,7 +124,17 @@ class LspSymbolReferencesCommand(LspTextCommand):
             document_position = text_document_position_params(self.view, pos)
             document_position['context'] = {"includeDeclaration": False}
             request = Request.references(document_position)
-            client.send_request(request, lambda response: self.handle_response(response, pos))
+            if settings.show_references_in_quick_panel:
+                client.send_request(request, lambda response: self.handle_response(response, pos))
+            elif window:
+                # The panel shows the references while they are decoded, a batch at a time. A new search replaces the
+                # one that is still filling the panel.
+                previous = panel_streams.pop(window.id(), None)
+                if previous:
+                    previous.cancel()
+                stream = panel_streams[window.id()] = ReferencesPanelStream(self, self.word, self.base_dir)
+                stream.promise = client.send_request(
+                    request, stream.finish_references_panel, partial_handler=stream.append_references)
 
     def handle_response(self, response: Optional[List[ReferenceDict]], pos: int) -> None:
         window = self.view.window()
@@ -66,12 +150,7 @@ class LspSymbolReferencesCommand(LspTextCommand):
                 window.status_message("No references found")
                 return
 
-            references_by_file = self._group_references_by_file(response)
-
-            if settings.show_references_in_quick_panel:
-                self.show_quick_panel(references_by_file)
-            else:
-                self.show_references_panel(references_by_file)
+            self.show_quick_panel(self._group_references_by_file(response))
 
     def show_quick_panel(self, references_by_file: Dict[str, List[Tuple[Point, str]]]) -> None:
         selected_index = -1
@@ -111,39 +190,6 @@ class LspSymbolReferencesCommand(LspTextCommand):
             if window:
                 window.open_file(self.get_selected_file_path(index), flags)
 
-    def show_references_panel(self, references_by_file: Dict[str, List[Tuple[Point, str]]]) -> None:
-        window = self.view.window()
-        if window:
-            panel = ensure_references_panel(window)
-            if not panel:
-                return
-
-            text = ''
-            references_count = 0
-            for file, references in references_by_file.items():
-                text += '◌ {}:\n'.format(self.get_relative_path(file))
-                for reference in references:
-                    references_count += 1
-                    point, line = reference
-                    text += '\t{:>8}:{:<4} {}\n'.format(point.row + 1, point.col + 1, line)
-                # append a new line after each file name
-                text += '\n'
-
-            base_dir = windows.lookup(window).get_project_path(self.view.file_name() or "")
-            panel.settings().set("result_base_dir", base_dir)
-
-            panel.run_command("lsp_clear_panel")
-            window.run_command("show_panel", {"panel": "output.references"})
-            panel.run_command('append', {
-                'characters': "{} references for '{}'\n\n{}".format(references_count, self.word, text),
-                'force': True,
-                'scroll_to_end': False
-            })
-
-            # highlight all word occurrences
-            regions = panel.find_all(r"\b{}\b".format(self.word))
-            panel.add_regions('ReferenceHighlight', regions, 'comment', flags=sublime.DRAW_OUTLINED)
-
     def get_selected_file_path(self, index: int) -> str:
         return self.get_full_path(self.reflist[index][0])
 
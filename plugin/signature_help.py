@@ -100,7 +100,8 @@ class SignatureHelpListener(LSPViewEventListener):
             document_position = text_document_position_params(self.view, point)
             client.send_request(
                 Request.signatureHelp(document_position),
-                lambda response: self.handle_response(response, point))
+                lambda response: self.handle_response(response, point),
+                view_id=self.view.id())
 
     def handle_response(self, response: Optional[Dict], point: int) -> None:
         if self.view.sel()[0].begin() == self.requested_position:
@@ -0,0 +1,293 @@
+"""
+Throughput benchmark for the stdio and TCP transports.
+
+Drives StdioTransport and TCPTransport against a stand-in server that runs in a subprocess, and sweeps message sizes,
+message rates and the fragmentation of the byte stream. Every case reports messages per second, MB per second, the
+p50 and p99 latency from the server writing a message until on_receive gets it, and the peak RSS of the client.
+
+Every case runs in a fresh client process, so that the peak RSS of one case doesn't hide the next one. TCP cases only
+use the loopback interface.
+
+Run it from the Packages directory (the parent directory of the LSP package), with the Python version that Sublime
+Text uses or newer:
+
+    python3 LSP/tests/benchmark_transports.py
+    python3 LSP/tests/benchmark_transports.py --sizes 100 1000000 --chunks 0 4096 --transports stdio
+
+Direction "read" has the server write messages for the client to read (exercising framing), "write" has the client
+send messages to the server (exercising the writer and its queue). In direction "read" the server only starts writing
+once the client tells it to go, and the clock of the client starts then.
+"""
+from argparse import ArgumentParser
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from LSP.plugin.core.transports import StdioTransport  # noqa: E402
+from LSP.plugin.core.transports import TCPTransport  # noqa: E402
+
+try:
+    from typing import Any, Dict, List, Optional
+    assert Any and Dict and List and Optional
+except ImportError:
+    pass
+
+
+DEFAULT_SIZES = [100, 10 * 1000, 1000 * 1000, 50 * 1000 * 1000]
+DEFAULT_RATES = [0, 1000]
+DEFAULT_CHUNKS = [0, 4096, 7]
+# Cases move at most this many bytes, and at most MAX_MESSAGES messages.
+DEFAULT_BUDGET = 200 * 1000 * 1000
+MAX_MESSAGES = 20000
+CASE_TIMEOUT = 300
+
+
+# -- The stand-in server -------------------------------------------------------------------------------------------
+
+
+def read_message(stream: 'Any') -> 'Optional[bytes]':
+    """
+    Reads one Content-Length framed message, the way tests/server.py does: header lines, then the body.
+    """
+    content_length = 0
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        if line == b"\r\n":
+            break
+        if line.startswith(b"Content-Length: "):
+            content_length = int(line[len(b"Content-Length: "):])
+    return stream.read(content_length)
+
+
+def frame(body: bytes) -> bytes:
+    return "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii") + body
+
+
+def make_body(size: int) -> bytes:
+    """
+    Returns a message of size bytes, with room for a timestamp at the start.
+    """
+    template = '{{"t":{:020.6f},"pad":"{}"}}'
+    padding = max(0, size - len(template.format(0.0, "")))
+    return template.format(0.0, "x" * padding).encode("ascii")
+
+
+def stamp(body: bytes) -> bytes:
+    # Overwrite the timestamp in place, so that messages of 50 MB aren't formatted anew for every send.
+    timestamp = "{:020.6f}".format(time.time()).encode("ascii")
+    return body[:5] + timestamp + body[25:]
+
+
+def serve(args: 'Any') -> None:
+    if args.transport == "tcp":
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        sys.stdout.write("{}\n".format(listener.getsockname()[1]))
+        sys.stdout.flush()
+        connection, _ = listener.accept()
+        reader = connection.makefile("rb")
+        writer = connection.makefile("wb")
+    else:
+        reader = sys.stdin.buffer
+        writer = sys.stdout.buffer
+    if args.direction == "read":
+        body = make_body(args.size)
+        # Wait for the client to start its clock, so that it doesn't find messages queued up in the pipe already.
+        read_message(reader)
+        interval = 1.0 / args.rate if args.rate else 0.0
+        started = time.time()
+        for i in range(args.count):
+            if interval:
+                delay = started + i * interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            message = frame(stamp(body))
+            if args.chunk:
+                for start in range(0, len(message), args.chunk):
+                    writer.write(message[start:start + args.chunk])
+                    writer.flush()
+            else:
+                writer.write(message)
+                writer.flush()
+        # Wait for the client to hang up.
+        read_message(reader)
+    else:
+        received = 0
+        for _ in range(args.count):
+            body = read_message(reader)
+            if body is None:
+                break
+            received += len(body)
+        writer.write(frame(json.dumps({"received": received}).encode("ascii")))
+        writer.flush()
+
+
+# -- The client ----------------------------------------------------------------------------------------------------
+
+
+def peak_rss_mb() -> 'Optional[float]':
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(values: 'List[float]', fraction: float) -> 'Optional[float]':
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_case(case: 'Dict[str, Any]') -> 'Dict[str, Any]':
+    server_args = [sys.executable, os.path.abspath(__file__), "--serve",
+                   "--transport", case["transport"], "--direction", case["direction"], "--size", str(case["size"]),
+                   "--count", str(case["count"]), "--rate", str(case["rate"]), "--chunk", str(case["chunk"])]
+    process = subprocess.Popen(server_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    if case["transport"] == "tcp":
+        port = int(process.stdout.readline())
+        transport = TCPTransport(socket.create_connection(("127.0.0.1", port)))  # type: Any
+    else:
+        transport = StdioTransport(process)
+
+    latencies = []  # type: List[float]
+    received = [0, 0]  # messages, bytes
+    done = threading.Event()
+
+    def on_receive(message: str) -> None:
+        now = time.time()
+        if case["direction"] == "read":
+            latencies.append(now - float(message[5:25]))
+            received[0] += 1
+            received[1] += len(message)
+            if received[0] == case["count"]:
+                done.set()
+        else:
+            received[0] = case["count"]
+            received[1] = json.loads(message)["received"]
+            done.set()
+
+    transport.start(on_receive, done.set)
+    started = time.time()
+    if case["direction"] == "read":
+        transport.send("go")
+    else:
+        body = make_body(case["size"]).decode("ascii")
+        interval = 1.0 / case["rate"] if case["rate"] else 0.0
+        for i in range(case["count"]):
+            if interval:
+                delay = started + i * interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            transport.send(body)
+    done.wait(CASE_TIMEOUT)
+    elapsed = time.time() - started
+    if case["direction"] == "read":
+        transport.send("bye")
+        time.sleep(0.05)
+    transport.close()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+    p50 = percentile(latencies, 0.50)
+    p99 = percentile(latencies, 0.99)
+    result = dict(case)
+    result.update({
+        "complete": received[0] == case["count"],
+        "msgs_per_s": received[0] / elapsed if elapsed else 0.0,
+        "mb_per_s": received[1] / elapsed / 1e6 if elapsed else 0.0,
+        "p50_ms": p50 * 1000 if p50 is not None else None,
+        "p99_ms": p99 * 1000 if p99 is not None else None,
+        "peak_rss_mb": peak_rss_mb()
+    })
+    return result
+
+
+# -- The sweep -----------------------------------------------------------------------------------------------------
+
+
+def cases(args: 'Any') -> 'List[Dict[str, Any]]':
+    result = []
+    for transport, direction, size, rate, chunk in itertools.product(
+            args.transports, args.directions, args.sizes, args.rates, args.chunks):
+        if direction == "write" and chunk:
+            continue  # the client decides how its writes are fragmented
+        if chunk and size // chunk > 1000 * 1000:
+            continue  # millions of tiny writes measure the server more than the client
+        count = max(1, min(MAX_MESSAGES, args.budget // size))
+        if rate:
+            count = max(1, min(count, int(rate * args.duration)))
+        result.append({"transport": transport, "direction": direction, "size": size, "rate": rate, "chunk": chunk,
+                       "count": count})
+    return result
+
+
+def format_number(value: 'Optional[float]', digits: int = 1) -> str:
+    return "-" if value is None else "{:.{}f}".format(value, digits)
+
+
+def sweep(args: 'Any') -> None:
+    columns = "{:<10}{:<10}{:>12}{:>8}{:>8}{:>8}{:>12}{:>10}{:>10}{:>10}{:>10}"
+    print(columns.format("transport", "direction", "size", "rate", "chunk", "count", "msgs/s", "MB/s", "p50 ms",
+                         "p99 ms", "RSS MB"))
+    for case in cases(args):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)])
+        # The last line is the result, anything before it was logged.
+        result = json.loads(output.decode("UTF-8").strip().splitlines()[-1])
+        print(columns.format(
+            result["transport"], result["direction"], result["size"], result["rate"] or "max", result["chunk"] or "-",
+            result["count"] if result["complete"] else "TIMEOUT", format_number(result["msgs_per_s"], 0),
+            format_number(result["mb_per_s"]), format_number(result["p50_ms"], 2), format_number(result["p99_ms"], 2),
+            format_number(result["peak_rss_mb"])))
+        sys.stdout.flush()
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--transports", nargs="+", choices=["stdio", "tcp"], default=["stdio", "tcp"])
+    parser.add_argument("--directions", nargs="+", choices=["read", "write"], default=["read", "write"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="message sizes in bytes")
+    parser.add_argument("--rates", nargs="+", type=int, default=DEFAULT_RATES,
+                        help="messages per second, 0 sends as fast as possible")
+    parser.add_argument("--chunks", nargs="+", type=int, default=DEFAULT_CHUNKS,
+                        help="bytes per write of the server, 0 writes every message at once")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="bytes to move per case")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds that rate limited cases run")
+    # Used internally, to run a single case or the stand-in server in a process of its own.
+    parser.add_argument("--case")
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--transport")
+    parser.add_argument("--direction")
+    parser.add_argument("--size", type=int)
+    parser.add_argument("--count", type=int)
+    parser.add_argument("--rate", type=int)
+    parser.add_argument("--chunk", type=int)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+    elif args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+    else:
+        sweep(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Replays a recorded session against the client, without the language server that took part in it.
+
+Record a trace with "LSP: Toggle Traffic Recording", then replay it with a Session of this checkout in a stand-in for
+the server: outgoing requests and notifications are sent through its client, the recorded messages of the server are
+fed to it, in the recorded order. The replay runs with the original timing, faster or slower with --speed, or as fast
+as possible with --speed 0, and reports how long it took and the metrics of the client.
+
+The Session answers the requests of the server that it handles itself, like workspace/configuration. The handlers that
+the windows of the plugin add, like workspace/applyEdit, need Sublime Text: the recorded responses stand in for them.
+
+Run it from the Packages directory (the parent directory of the LSP package):
+
+    python3 LSP/tests/replay_trace.py trace.jsonl
+    python3 LSP/tests/replay_trace.py trace.jsonl --speed 0 --repeat 10 --json
+"""
+from argparse import ArgumentParser
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from LSP.plugin.core.codec import format_request  # noqa: E402
+from LSP.plugin.core.dispatch import InlineQueue  # noqa: E402
+from LSP.plugin.core.metrics import format_metrics_table  # noqa: E402
+from LSP.plugin.core.protocol import Error, ErrorCode, Notification, Request  # noqa: E402
+from LSP.plugin.core.recording import INCOMING, OUTGOING, Frame, load_trace  # noqa: E402
+from LSP.plugin.core.rpc import Client  # noqa: E402
+from LSP.plugin.core.sessions import Session  # noqa: E402
+from LSP.plugin.core.transports import Transport  # noqa: E402
+from LSP.plugin.core.types import ClientConfig, Settings  # noqa: E402
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Set
+    assert Any and Callable and Dict and List and Optional and Set
+except ImportError:
+    pass
+
+
+class ReplayTransport(Transport):
+    """
+    Stands in for the server of a recorded session: it keeps what the client writes, and replay feeds the client
+    what the server wrote.
+    """
+
+    def __init__(self) -> None:
+        self.messages = []  # type: List[str]
+        self.on_receive = None  # type: Optional[Callable[[str], None]]
+        self.on_closed = None  # type: Optional[Callable[[], None]]
+
+    def start(self, on_receive: 'Callable[[str], None]', on_closed: 'Callable[[], None]') -> None:
+        self.on_receive = on_receive
+        self.on_closed = on_closed
+
+    def send(self, message: str) -> None:
+        self.messages.append(message)
+
+    def receive(self, message: str) -> None:
+        if self.on_receive:
+            self.on_receive(message)
+
+    def close(self) -> None:
+        if self.on_closed:
+            self.on_closed()
+
+
+def start_session(name: str, transport: ReplayTransport) -> Session:
+    """
+    Starts a session on transport the way the plugin does, with a client that handles messages on the calling thread.
+    It sends its initialize request right away.
+    """
+    return Session(ClientConfig(name, [], None), [], Client(transport, Settings(), InlineQueue()))
+
+
+def answer_with_recording(frames: 'List[Frame]', session: Session) -> None:
+    """
+    Answers the requests of the server that session doesn't handle with the responses in frames. The handlers of the
+    session replace these once it is initialized.
+    """
+    responses = {}  # type: Dict[Any, Dict[str, Any]]
+    methods = set()  # type: Set[str]
+    for frame in frames:
+        message = frame.message
+        if frame.direction == OUTGOING and "method" not in message and "id" in message:
+            responses[message["id"]] = message
+        elif frame.direction == INCOMING and "method" in message and "id" in message:
+            methods.add(message["method"])
+
+    def answer(params: 'Any', request_id: 'Any') -> None:
+        response = responses.get(request_id)
+        if response is None:
+            raise Error(ErrorCode.MethodNotFound, "no recorded response to {}".format(request_id))
+        session.client.send_payload(response)
+
+    for method in methods:
+        session.on_request(method, answer)
+
+
+def replay(frames: 'List[Frame]', session: Session, transport: ReplayTransport, speed: float = 1.0) -> float:
+    """
+    Plays frames against session, a Session on transport from start_session, and returns how many seconds that took.
+
+    Everything happens on the calling thread in the recorded order, so that the outcome doesn't depend on thread
+    scheduling. With a speed, every frame waits until its recorded time divided by speed; with 0, frames play as fast
+    as possible. Outgoing responses aren't replayed: the handlers of session answer the requests of the server, see
+    answer_with_recording. The recorded initialize request stands for the one that session sent when it started;
+    a trace that was recorded after its session started has none, and the session stays uninitialized.
+    Recorded request IDs are mapped to the ones the client picks, and blocking requests are replayed as ordinary ones.
+    """
+    client = session.client
+    request_ids = {}  # type: Dict[Any, Any]
+    initialize_id = client.request_id
+    answer_with_recording(frames, session)
+    started = time.monotonic()
+    for frame in frames:
+        if speed:
+            delay = started + frame.timestamp / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        message = frame.message
+        if frame.direction == OUTGOING:
+            method = message.get("method")
+            if method is None:
+                continue
+            elif method == "initialize":
+                request_ids[message["id"]] = initialize_id
+            elif method == "$/cancelRequest":
+                live_id = request_ids.get(message["params"].get("id"))
+                if live_id is not None:
+                    client.cancel_request(live_id)
+            elif "id" in message:
+                promise = client.send_request(Request(method, message.get("params")), error_handler=lambda error: None)
+                request_ids[message["id"]] = promise.request_id
+            else:
+                client.send_notification(Notification(method, message.get("params")))
+        else:
+            if "method" not in message and message.get("id") in request_ids:
+                message = dict(message, id=request_ids[message["id"]])
+            transport.receive(format_request(message))
+    return time.monotonic() - started
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("trace", help="a JSONL trace recorded with LSP: Toggle Traffic Recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="0 plays as fast as possible")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    frames = load_trace(args.trace)
+    durations = []  # type: List[float]
+    client = None  # type: Optional[Client]
+    for _ in range(args.repeat):
+        transport = ReplayTransport()
+        session = start_session(os.path.basename(args.trace), transport)
+        durations.append(replay(frames, session, transport, args.speed))
+        client = session.client
+    assert client is not None
+    metrics = {"pending_requests": client.pending_requests(), "methods": client.metrics.to_dict()}
+    if args.json:
+        print(json.dumps({"frames": len(frames), "seconds": durations, "metrics": metrics}))
+    else:
+        print("{} frames, {} runs: best {:.4f}s, worst {:.4f}s".format(
+            len(frames), len(durations), min(durations), max(durations)))
+        print(format_metrics_table({os.path.basename(args.trace): metrics}))
+
+
+if __name__ == "__main__":
+    main()
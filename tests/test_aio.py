@@ -0,0 +1,141 @@
+from LSP.plugin.core.aio import asyncio_available
+from LSP.plugin.core.aio import asyncio_pipes_available
+from LSP.plugin.core.aio import AsyncioTransport
+from LSP.plugin.core.aio import send_request_async
+from LSP.plugin.core.protocol import Error
+from LSP.plugin.core.protocol import ErrorCode
+from LSP.plugin.core.protocol import Notification
+from LSP.plugin.core.protocol import Request
+from LSP.plugin.core.rpc import RequestPromise
+from test_reactor import receive_exactly
+from test_reactor import wait_for
+from test_transports import json_rpc_message
+import json
+import socket
+import subprocess
+import sys
+import unittest
+
+try:
+    from typing import Any, Dict, List
+    assert Any and Dict and List
+except ImportError:
+    pass
+
+
+ECHO_SERVER = "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read(int(sys.argv[1]))); sys.stdout.flush()"
+
+
+@unittest.skipUnless(asyncio_available(), "needs the asyncio module")
+class AsyncioSocketTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client_socket, self.server_socket = socket.socketpair()
+        self.received = []  # type: List[str]
+        self.closed = []  # type: List[bool]
+        self.transport = AsyncioTransport.for_socket(self.client_socket)
+        self.transport.start(self.received.append, lambda: self.closed.append(True))
+
+    def tearDown(self):
+        self.transport.close()
+        self.server_socket.close()
+
+    def test_read_messages(self):
+        self.server_socket.sendall(json_rpc_message("hello") + json_rpc_message("world"))
+        self.assertTrue(wait_for(lambda: len(self.received) == 2))
+        self.assertEqual(self.received, ["hello", "world"])
+
+    def test_write_messages(self):
+        self.transport.send("hello")
+        self.transport.send("world")
+        expected = json_rpc_message("hello") + json_rpc_message("world")
+        written = b""
+        while len(written) < len(expected):
+            written += self.server_socket.recv(len(expected))
+        self.assertEqual(written, expected)
+
+    def test_write_streaming_payload(self):
+        payload = {"method": "textDocument/didOpen", "params": {"text": "h\u00e9llo\n" * 400000}}
+        self.transport.send_payload(payload)
+        expected = json_rpc_message(json.dumps(payload, separators=(',', ':')))
+        self.assertEqual(receive_exactly(self.server_socket, len(expected)), expected)
+
+    def test_closes_on_eof(self):
+        self.server_socket.shutdown(socket.SHUT_WR)
+        self.assertTrue(wait_for(lambda: self.closed))
+        self.assertEqual(self.closed, [True])
+
+
+@unittest.skipUnless(asyncio_pipes_available(), "needs the asyncio module and a platform that can select on pipes")
+class AsyncioStdioTransportTests(unittest.TestCase):
+
+    def test_echo(self):
+        expected = json_rpc_message("hello") + json_rpc_message("world")
+        process = subprocess.Popen([sys.executable, "-c", ECHO_SERVER, str(len(expected))],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        received = []  # type: List[str]
+        transport = AsyncioTransport.for_process(process)
+        transport.start(received.append, lambda: None)
+        transport.send("hello")
+        transport.send("world")
+        self.assertTrue(wait_for(lambda: len(received) == 2, timeout=5.0))
+        self.assertEqual(received, ["hello", "world"])
+        self.assertEqual(process.wait(5), 0)
+        transport.close()
+
+
+class FakeClient(object):
+
+    def __init__(self) -> None:
+        self.request_id = 0
+        self.promises = {}  # type: Dict[int, Any]
+        self.notifications = []  # type: List[Any]
+
+    def send_request(self, request, handler=None, error_handler=None):
+        self.request_id += 1
+        self.promises[self.request_id] = RequestPromise(self, self.request_id)
+        return self.promises[self.request_id]
+
+    def send_notification(self, notification):
+        self.notifications.append((notification.method, notification.params))
+
+    def cancel_request(self, request_id, promise=None):
+        self.send_notification(Notification.cancelRequest({"id": request_id}))
+
+
+@unittest.skipUnless(asyncio_available(), "needs the asyncio module")
+class SendRequestAsyncTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+
+    def wait(self, future):
+        self.assertTrue(wait_for(future.done))
+        return future
+
+    def test_result(self):
+        future = send_request_async(self.client, Request.shutdown())
+        self.client.promises[1].resolve({"answer": 42})
+        self.assertEqual(self.wait(future).result(), {"answer": 42})
+
+    def test_error(self):
+        future = send_request_async(self.client, Request.shutdown())
+        self.client.promises[1].reject({"code": ErrorCode.InvalidParams, "message": "oops"})
+        with self.assertRaises(Error) as cm:
+            self.wait(future).result()
+        self.assertEqual(cm.exception.code, ErrorCode.InvalidParams)
+
+    def test_timeout_cancels_request(self):
+        future = send_request_async(self.client, Request.shutdown(), timeout=0.01)
+        with self.assertRaises(Error) as cm:
+            self.wait(future).result()
+        self.assertEqual(cm.exception.code, ErrorCode.Timeout)
+        self.assertEqual(self.client.notifications, [("$/cancelRequest", {"id": 1})])
+        # A late response is ignored.
+        self.client.promises[1].resolve({})
+
+    def test_cancel_cancels_request(self):
+        future = send_request_async(self.client, Request.shutdown())
+        future.get_loop().call_soon_threadsafe(future.cancel)
+        self.assertTrue(wait_for(lambda: self.client.notifications))
+        self.assertEqual(self.client.notifications, [("$/cancelRequest", {"id": 1})])
@@ -1,10 +1,12 @@
-from LSP.plugin.core.protocol import Point, Range
+from LSP.plugin.core.promise import Promise
+from LSP.plugin.core.protocol import ErrorCode, Point, Range
 from LSP.plugin.core.typing import Dict, Generator, List, Tuple
 from LSP.plugin.core.url import filename_to_uri
 from LSP.plugin.core.views import entire_content
-from LSP.plugin.code_actions import run_code_action_or_command
+from LSP.plugin.code_actions import CodeActionsAtLocation, CodeActionsByConfigName, run_code_action_or_command
 from setup import TextDocumentTestCase
 from test_single_document import TEST_FILE_PATH
+import unittest
 
 TEST_FILE_URI = filename_to_uri(TEST_FILE_PATH)
 
@@ -53,3 +55,25 @@ class CodeActionsTestCase(TextDocumentTestCase):
         ])
         run_code_action_or_command(self.view, self.config.name, code_actions)
         self.assertEquals(entire_content(self.view), initial_content)
+
+
+class CodeActionsAtLocationTests(unittest.TestCase):
+
+    def test_completes_with_the_actions_that_arrived(self) -> None:
+        completed = []  # type: List[CodeActionsByConfigName]
+        actions = CodeActionsAtLocation(completed.append)
+        actions.collect("a", Promise.resolved([{"title": "Fix"}]))
+        actions.collect("b", Promise.rejected({"code": ErrorCode.Timeout, "message": "timeout"}))
+        actions.complete()
+        self.assertTrue(actions.completed)
+        self.assertEqual(completed, [{"a": [{"title": "Fix"}]}])
+
+    def test_cancelled_actions_are_not_handled(self) -> None:
+        completed = []  # type: List[CodeActionsByConfigName]
+        actions = CodeActionsAtLocation(completed.append)
+        actions.collect("a", Promise.resolved([{"title": "Fix"}]))
+        actions.collect("b", Promise.rejected({"code": ErrorCode.RequestCancelled, "message": "cancelled"}))
+        actions.complete()
+        self.assertTrue(actions.cancelled)
+        self.assertFalse(actions.completed)
+        self.assertEqual(completed, [])
@@ -0,0 +1,114 @@
+from LSP.plugin.core.codec import decode
+from LSP.plugin.core.codec import encode_payload
+from LSP.plugin.core.codec import format_request
+from LSP.plugin.core.codec import iter_array
+from LSP.plugin.core.codec import peek_array_response
+from LSP.plugin.core.codec import peek_message
+from LSP.plugin.core.codec import peek_response_id
+from LSP.plugin.core.codec import STREAMING_THRESHOLD
+from LSP.plugin.core.codec import StreamingBody
+import json
+import types
+import unittest
+
+
+def did_change_payload(text: str) -> dict:
+    return {
+        "jsonrpc": "2.0",
+        "method": "textDocument/didChange",
+        "params": {
+            "textDocument": {"uri": "file:///big.txt", "version": 2},
+            "contentChanges": [{"text": text}]
+        }
+    }
+
+
+class EncodePayloadTests(unittest.TestCase):
+
+    def test_small_payload_is_encoded_at_once(self):
+        payload = did_change_payload("hello")
+        header, body = encode_payload(payload)
+        self.assertEqual(body, format_request(payload).encode("UTF-8"))
+        self.assertEqual(header, "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii"))
+
+    def test_large_payload_is_streamed(self):
+        text = 'line with "quotes", \\backslashes\\, tabs\t and héllo w\U0001f30drld\n' * 10000
+        self.assertGreater(len(text), STREAMING_THRESHOLD)
+        payload = did_change_payload(text)
+        header, body = encode_payload(payload)
+        self.assertIsInstance(body, StreamingBody)
+        assert isinstance(body, StreamingBody)
+        chunks = list(body.chunks())
+        self.assertGreater(len(chunks), 1)
+        encoded = b"".join(chunks)
+        self.assertEqual(encoded, format_request(payload).encode("UTF-8"))
+        self.assertEqual(len(body), len(encoded))
+        self.assertEqual(list(body.chunks()), chunks)
+        # The chunks are encoded again while they are written, not kept.
+        self.assertIsInstance(body.chunks(), types.GeneratorType)
+        self.assertEqual(header, "Content-Length: {}\r\n\r\n".format(len(encoded)).encode("ascii"))
+        self.assertEqual(json.loads(encoded.decode("UTF-8")), payload)
+
+    def test_streams_large_strings_in_lists(self):
+        payload = {"id": 1, "params": ["x" * (STREAMING_THRESHOLD + 1), None, True, 1.5, {"a": []}]}
+        header, body = encode_payload(payload)
+        self.assertIsInstance(body, StreamingBody)
+        assert isinstance(body, StreamingBody)
+        self.assertEqual(b"".join(body.chunks()), format_request(payload).encode("UTF-8"))
+
+
+class PeekMessageTests(unittest.TestCase):
+
+    def test_notification(self):
+        peeked = peek_message('{"jsonrpc":"2.0","method":"window/logMessage","params":{"type":4,"message":"hi"}}')
+        self.assertIsNotNone(peeked)
+        self.assertFalse(peeked.has_id)
+        self.assertEqual(peeked.method, "window/logMessage")
+        self.assertEqual(peeked.params(), {"type": 4, "message": "hi"})
+
+    def test_request(self):
+        peeked = peek_message('{ "jsonrpc" : "2.0", "id" : "a", "method" : "m", "params" : [1, {"id": 2}] }\n')
+        self.assertTrue(peeked.has_id)
+        self.assertEqual(peeked.id, "a")
+        self.assertEqual(peeked.method, "m")
+        self.assertEqual(peeked.params(), [1, {"id": 2}])
+
+    def test_without_params(self):
+        peeked = peek_message('{"jsonrpc":"2.0","id":3,"method":"shutdown"}')
+        self.assertEqual((peeked.has_id, peeked.id, peeked.method), (True, 3, "shutdown"))
+        self.assertIsNone(peeked.params())
+
+    def test_params_before_other_members_are_not_peeked(self):
+        self.assertIsNone(peek_message('{"method":"m","params":{"method":"x"},"id":1}'))
+        self.assertIsNone(peek_message('{"params":{},"method":"m"}'))
+
+    def test_responses_are_not_peeked(self):
+        self.assertIsNone(peek_message('{"jsonrpc":"2.0","id":1,"result":{"method":"m"}}'))
+
+    def test_decode(self):
+        self.assertEqual(decode('{"a":[1,"\\u00e9"]}'), {"a": [1, "é"]})
+        self.assertRaises(ValueError, decode, '{"a":')
+
+    def test_peek_response_id(self):
+        self.assertEqual(peek_response_id('{"jsonrpc":"2.0","id":12,"result":{"id":3}}'), 12)
+        self.assertEqual(peek_response_id('{ "id" : 4, "error" : {} }'), 4)
+        self.assertIsNone(peek_response_id('{"jsonrpc":"2.0","id":4,"method":"m"}'))
+        self.assertIsNone(peek_response_id('{"jsonrpc":"2.0","id":"4","result":null}'))
+
+    def test_peek_array_response(self):
+        message = '{"id":3,"jsonrpc":"2.0","result": [1]}'
+        self.assertEqual(peek_array_response(message), (3, message.index("[")))
+        self.assertIsNone(peek_array_response('{"jsonrpc":"2.0","id":3,"result":null}'))
+        self.assertIsNone(peek_array_response('{"jsonrpc":"2.0","id":3,"error":[]}'))
+
+    def test_iter_array(self):
+        text = '{"result": [ 1 , {"a": [2, "]"]},"x" ]}'
+        self.assertEqual(list(iter_array(text, text.index("["))), [1, {"a": [2, "]"]}, "x"])
+        self.assertEqual(list(iter_array("[ ]", 0)), [])
+
+    def test_iter_array_yields_elements_before_malformed_json(self):
+        elements = iter_array("[1, 2 3]", 0)
+        self.assertEqual(next(elements), 1)
+        self.assertEqual(next(elements), 2)
+        self.assertRaises(ValueError, next, elements)
+        self.assertRaises(ValueError, list, iter_array("{}", 0))
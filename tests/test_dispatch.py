@@ -0,0 +1,40 @@
+from LSP.plugin.core.dispatch import DispatchPool, InlineQueue
+from test_reactor import wait_for
+import threading
+import unittest
+
+
+class DispatchPoolTests(unittest.TestCase):
+
+    def test_serial_queue_keeps_order(self):
+        queue = DispatchPool(workers=3).serial()
+        done = []
+        for i in range(100):
+            queue.submit(lambda i=i: done.append(i))
+        self.assertTrue(wait_for(lambda: len(done) == 100))
+        self.assertEqual(done, list(range(100)))
+
+    def test_queues_run_in_parallel(self):
+        pool = DispatchPool(workers=2)
+        blocked, unblocked = pool.serial(), pool.serial()
+        release = threading.Event()
+        done = []
+        blocked.submit(lambda: release.wait(5))
+        blocked.submit(lambda: done.append("blocked"))
+        unblocked.submit(lambda: done.append("unblocked"))
+        self.assertTrue(wait_for(lambda: done == ["unblocked"]))
+        self.assertEqual(blocked.qsize(), 1)
+        release.set()
+        self.assertTrue(wait_for(lambda: len(done) == 2))
+
+    def test_failing_task_does_not_stop_the_queue(self):
+        queue = DispatchPool(workers=1).serial()
+        done = []
+        queue.submit(lambda: 1 / 0)
+        queue.submit(lambda: done.append(True))
+        self.assertTrue(wait_for(lambda: done))
+
+    def test_inline_queue(self):
+        done = []
+        InlineQueue().submit(lambda: done.append(threading.current_thread()))
+        self.assertEqual(done, [threading.current_thread()])
@@ -135,3 +135,70 @@ class WindowDocumentHandlerTests(unittest.TestCase):
             status_configs = status_string.split(", ")
             self.assertIn("test", status_configs)
             self.assertIn("test2", status_configs)
+
+    def test_shared_session_opens_and_closes_document_once(self):
+        folders = [WorkspaceFolder.from_path("/")]
+        client = MockClient()
+        session = self.assert_if_none(
+            create_session(TEST_CONFIG, folders, dict(), MockSettings(), bootstrap_client=client))
+        handlers = []
+        views = []
+        for _ in range(3):
+            view = MockView(__file__)
+            window = MockWindow([[view]])
+            window.find_open_file = lambda path, view=view: view if path == __file__ else None
+            view.set_window(window)
+            handler = WindowDocumentHandler(test_sublime, MockSettings(), window, ProjectFolders(window), MockConfigs())
+            handler.add_session(session)
+            handler.handle_did_open(view)
+            handlers.append(handler)
+            views.append(view)
+        self.assertEqual([n.method for n in client._notifications], ["textDocument/didOpen"])
+
+        # A window that closes the document or detaches from the session leaves it open for the others.
+        handlers[1].handle_did_close(views[1])
+        self.assertEqual(len(client._notifications), 1)
+        handlers[0].remove_session(TEST_CONFIG.name)
+        self.assertEqual([n.method for n in client._notifications[1:]],
+                         ["textDocument/didClose", "textDocument/didOpen"])
+
+        handlers[2].remove_session(TEST_CONFIG.name)
+        self.assertEqual(client._notifications[-1].method, "textDocument/didClose")
+        self.assertEqual(len(client._notifications), 4)
+        self.assertIn(basename(__file__), client._notifications[-1].params["textDocument"]["uri"])
+
+    def test_only_the_window_that_owns_a_shared_document_syncs_it(self):
+        folders = [WorkspaceFolder.from_path("/")]
+        client = MockClient()
+        session = self.assert_if_none(
+            create_session(TEST_CONFIG, folders, dict(), MockSettings(), bootstrap_client=client))
+        handlers = []
+        views = []
+        for text in ("first", "second"):
+            view = MockView(__file__)
+            view._text = text
+            window = MockWindow([[view]])
+            window.find_open_file = lambda path, view=view: view if path == __file__ else None
+            view.set_window(window)
+            handler = WindowDocumentHandler(test_sublime, MockSettings(), window, ProjectFolders(window), MockConfigs())
+            handler.add_session(session)
+            handler.handle_did_open(view)
+            handlers.append(handler)
+            views.append(view)
+
+        # The views have versions of their own, the server only gets the changes of the view it has the text of.
+        handlers[1].handle_did_change(views[1])
+        handlers[1].purge_changes(views[1])
+        handlers[0].handle_did_change(views[0])
+        handlers[0].purge_changes(views[0])
+        self.assertEqual([n.method for n in client._notifications], ["textDocument/didOpen", "textDocument/didChange"])
+        self.assertEqual(client._notifications[1].params["contentChanges"][0]["text"], "first")
+
+        # The next window takes over, with the text of its view.
+        handlers[0].handle_did_close(views[0])
+        self.assertEqual([n.method for n in client._notifications[2:]],
+                         ["textDocument/didClose", "textDocument/didOpen"])
+        self.assertEqual(client._notifications[3].params["textDocument"]["text"], "second")
+        handlers[1].handle_did_change(views[1])
+        handlers[1].purge_changes(views[1])
+        self.assertEqual(client._notifications[-1].method, "textDocument/didChange")
@@ -0,0 +1,51 @@
+from LSP.plugin.core.log_buffer import LogBuffer
+import unittest
+
+try:
+    from typing import Any, Callable, List, Tuple
+    assert Any and Callable and List and Tuple
+except ImportError:
+    pass
+
+
+class LogBufferTests(unittest.TestCase):
+
+    def setUp(self):
+        self.batches = []  # type: List[List[Tuple[str, str]]]
+        self.scheduled = []  # type: List[Callable[[], None]]
+
+    def make_buffer(self, **kwargs: Any) -> LogBuffer:
+        return LogBuffer(self.batches.append, lambda f, timeout_ms: self.scheduled.append(f), **kwargs)
+
+    def test_flushes_lines_in_one_batch(self):
+        log_buffer = self.make_buffer()
+        log_buffer.append("server", "one")
+        log_buffer.append("server", "two")
+        self.assertEqual(len(self.scheduled), 1)
+        self.assertEqual(self.batches, [])
+        self.scheduled.pop()()
+        self.assertEqual(self.batches, [[("server", "one"), ("server", "two")]])
+        log_buffer.append("server", "three")
+        self.assertEqual(len(self.scheduled), 1)
+
+    def test_keeps_the_newest_lines_when_full(self):
+        log_buffer = self.make_buffer(capacity=2, rate_limit=1000)
+        for message in ("one", "two", "three"):
+            log_buffer.append("server", message)
+        self.scheduled.pop()()
+        self.assertEqual(log_buffer.overflowed, 1)
+        self.assertEqual(self.batches, [[("server", "two"), ("server", "three"),
+                                         ("server", "(1 log lines were dropped)")]])
+
+    def test_drops_lines_beyond_the_rate_limit(self):
+        log_buffer = self.make_buffer(rate_limit=3)
+        for i in range(5):
+            log_buffer.append("server", str(i))
+        self.scheduled.pop()()
+        self.assertEqual(log_buffer.rate_limited, 2)
+        self.assertEqual(self.batches, [[("server", "0"), ("server", "1"), ("server", "2"),
+                                         ("server", "(2 log lines were dropped)")]])
+        # Counted drops are only reported once.
+        log_buffer.append("server", "5")
+        self.scheduled.pop()()
+        self.assertEqual(self.batches[1], [("server", "(1 log lines were dropped)")])
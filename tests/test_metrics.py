@@ -0,0 +1,61 @@
+from LSP.plugin.core.metrics import Histogram, RpcMetrics, format_metrics_table
+import unittest
+
+
+class HistogramTests(unittest.TestCase):
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(0.5))
+        self.assertEqual(histogram.to_dict()["count"], 0)
+        self.assertIsNone(histogram.to_dict()["mean_ms"])
+
+    def test_percentiles_are_bucket_bounds(self):
+        histogram = Histogram()
+        for milliseconds in (0.5, 3, 3, 4, 150):
+            histogram.record(milliseconds)
+        self.assertEqual(histogram.percentile(0.2), 1.0)
+        self.assertEqual(histogram.percentile(0.5), 5.0)
+        self.assertEqual(histogram.percentile(0.99), 200.0)
+        self.assertEqual(histogram.maximum, 150)
+
+    def test_slower_than_every_bucket(self):
+        histogram = Histogram()
+        histogram.record(60000)
+        self.assertEqual(histogram.percentile(0.5), 60000)
+        self.assertEqual(histogram.to_dict()["buckets_ms"]["inf"], 1)
+
+
+class RpcMetricsTests(unittest.TestCase):
+
+    def test_counts_per_method(self):
+        metrics = RpcMetrics()
+        metrics.sent("textDocument/hover", 100)
+        metrics.sent("textDocument/hover", 50)
+        metrics.response("textDocument/hover", 0.004, 300, False)
+        metrics.response("textDocument/hover", 0.004, 30, True)
+        metrics.timed_out("textDocument/hover")
+        metrics.received("window/logMessage", 80)
+        metrics.waited("window/logMessage", 0.002)
+        metrics.handled("window/logMessage", 0.0001)
+        result = metrics.to_dict()
+        self.assertEqual(list(result), ["textDocument/hover", "window/logMessage"])
+        hover = result["textDocument/hover"]
+        self.assertEqual((hover["sent"], hover["responses"], hover["errors"], hover["timeouts"]), (2, 2, 1, 1))
+        self.assertEqual((hover["bytes_out"], hover["bytes_in"]), (150, 330))
+        self.assertEqual(hover["time_to_response"]["p50_ms"], 5.0)
+        log = result["window/logMessage"]
+        self.assertEqual((log["received"], log["bytes_in"]), (1, 80))
+        self.assertEqual(log["dispatch_wait"]["p50_ms"], 2.0)
+        self.assertEqual(log["handler_time"]["count"], 1)
+
+    def test_table(self):
+        metrics = RpcMetrics()
+        metrics.sent("initialize", 10)
+        metrics.response("initialize", 0.015, 20, False, 0.004)
+        lines = format_metrics_table(
+            {"pyls": {"pending_requests": 2, "dispatch_depth": 0, "methods": metrics.to_dict()}}).splitlines()
+        self.assertEqual(lines[0], "pyls (dispatch depth: 0, pending requests: 2)")
+        self.assertTrue(lines[1].startswith("method"))
+        self.assertEqual(lines[2].split(),
+                         ["initialize", "1", "0", "1", "0", "0", "10", "20", "5", "20", "20", "-", "-", "-"])
@@ -1,4 +1,5 @@
 from LSP.plugin.core.logging import debug
+from LSP.plugin.core.promise import Promise
 from LSP.plugin.core.protocol import Notification
 from LSP.plugin.core.protocol import Request
 from LSP.plugin.core.protocol import Response
@@ -70,6 +71,9 @@ class MockView(object):
         self.commands = []  # type: List[Tuple[str, Dict[str, Any]]]
         self.change_counter = 0
 
+    def id(self) -> int:
+        return 0
+
     def change_count(self) -> int:
         retval = self.change_counter
         self.change_counter += 1
@@ -294,21 +298,42 @@ class MockClient(object):
         self.responses = basic_responses
         self._notifications = []  # type: List[Notification]
         self._async_response_callback = async_response
+        self.cancelled_views = []  # type: List[int]
 
-    def send_request(self, request: Request, on_success: Callable, on_error: Callable = None) -> None:
+    def send_request(self, request: Request, on_success: Callable = None, on_error: Callable = None,
+                     view_id: Optional[int] = None, timeout: Optional[float] = None,
+                     document_version: Optional[int] = None, partial_handler: Optional[Callable] = None) -> Promise:
         response = self.responses.get(request.method)
         debug("TEST: responding to", request.method, "with", response)
+        promise = Promise()
+
+        def respond() -> None:
+            nonlocal response
+            if partial_handler and isinstance(response, list):
+                partial_handler(response)
+                response = None
+            if on_success:
+                on_success(response)
+            promise.resolve(response)
+
         if self._async_response_callback:
-            self._async_response_callback(lambda: on_success(response))
+            self._async_response_callback(respond)
         else:
-            on_success(response)
+            respond()
+        return promise
 
     def execute_request(self, request: Request) -> Any:
         return self.responses.get(request.method)
 
+    def cancel_view_requests(self, view_id: int) -> None:
+        self.cancelled_views.append(view_id)
+
     def send_notification(self, notification: Notification) -> None:
         self._notifications.append(notification)
 
+    def queue_depth(self) -> int:
+        return 0
+
     def on_notification(self, name, handler: Callable) -> None:
         pass
 
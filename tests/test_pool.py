@@ -0,0 +1,71 @@
+from LSP.plugin.core.pool import ServerPool
+from test_reactor import wait_for
+import unittest
+
+
+class FakeProcess(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.stderr = None
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -15
+
+
+class ServerPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.spawned = []
+        self.pool = ServerPool(self.spawn, lambda: self.now)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def spawn(self, args, working_dir, env, pipe_stderr):
+        process = FakeProcess(args)
+        self.spawned.append(process)
+        return process
+
+    def start(self, args=["server"], working_dir="/project", size=1):
+        return self.pool.start(args, working_dir, {"A": "1"}, None, None, size, 60)
+
+    def test_claims_spawned_process_and_refills(self):
+        first = self.start()
+        self.assertTrue(wait_for(lambda: self.pool.idle_count() == 1))
+        second = self.start()
+        self.assertIs(second, self.spawned[1])
+        self.assertIsNot(second, first)
+        self.assertTrue(wait_for(lambda: len(self.spawned) == 3))
+
+    def test_processes_are_only_claimed_by_same_command(self):
+        self.start()
+        self.assertTrue(wait_for(lambda: self.pool.idle_count() == 1))
+        other = self.start(working_dir="/elsewhere")
+        self.assertEqual(other.args, ["server"])
+        self.assertIs(other, self.spawned[2])
+
+    def test_idle_processes_expire(self):
+        self.start()
+        self.assertTrue(wait_for(lambda: self.pool.idle_count() == 1))
+        self.now = 61
+        self.pool.sweep(60)
+        self.assertEqual(self.pool.idle_count(), 0)
+        self.assertEqual(self.spawned[1].returncode, -15)
+        self.assertIsNone(self.spawned[0].returncode)
+
+    def test_disabled(self):
+        self.start(size=0)
+        self.assertEqual(len(self.spawned), 1)
+        self.assertEqual(self.pool.idle_count(), 0)
+
+    def test_close_terminates_idle_processes(self):
+        self.start()
+        self.assertTrue(wait_for(lambda: self.pool.idle_count() == 1))
+        self.pool.close()
+        self.assertEqual(self.spawned[1].returncode, -15)
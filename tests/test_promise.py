@@ -0,0 +1,98 @@
+from LSP.plugin.core.promise import Promise
+from LSP.plugin.core.protocol import ErrorCode
+from test_reactor import wait_for
+import threading
+import unittest
+
+
+class PromiseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.errors = []
+
+    def watch(self, promise):
+        promise.then(self.results.append, self.errors.append)
+
+    def test_then_runs_once_settled(self):
+        promise = Promise()
+        self.watch(promise)
+        self.assertEqual(self.results, [])
+        self.assertTrue(promise.resolve(1))
+        self.assertFalse(promise.resolve(2))
+        self.assertFalse(promise.reject("late"))
+        self.assertEqual(self.results, [1])
+        self.assertEqual(self.errors, [])
+
+    def test_then_on_settled_promise_runs_right_away(self):
+        self.watch(Promise.rejected("oops"))
+        self.assertEqual(self.errors, ["oops"])
+
+    def test_then_chains(self):
+        promise = Promise()
+        self.watch(promise.then(lambda x: x + 1).then(lambda x: Promise.resolved(x * 10)))
+        promise.resolve(1)
+        self.assertEqual(self.results, [20])
+
+    def test_rejection_skips_resolved_callbacks(self):
+        promise = Promise()
+        self.watch(promise.then(lambda x: x + 1).then(None, lambda error: "recovered from " + error))
+        promise.reject("oops")
+        self.assertEqual(self.results, ["recovered from oops"])
+
+    def test_exception_in_callback_rejects(self):
+        error = ValueError("oops")
+
+        def fail(_):
+            raise error
+
+        self.watch(Promise.resolved(1).then(fail))
+        self.assertEqual(self.errors, [error])
+
+    def test_all(self):
+        first, second = Promise(), Promise()
+        self.watch(Promise.all([first, second]))
+        second.resolve("b")
+        self.assertEqual(self.results, [])
+        first.resolve("a")
+        self.assertEqual(self.results, [["a", "b"]])
+
+    def test_all_rejects_with_first_rejection(self):
+        first, second = Promise(), Promise()
+        self.watch(Promise.all([first, second]))
+        second.reject("oops")
+        first.resolve("a")
+        self.assertEqual(self.errors, ["oops"])
+        self.assertEqual(self.results, [])
+
+    def test_all_of_nothing(self):
+        self.watch(Promise.all([]))
+        self.assertEqual(self.results, [[]])
+
+    def test_any(self):
+        first, second = Promise(), Promise()
+        self.watch(Promise.any([first, second]))
+        first.reject("oops")
+        second.resolve("b")
+        self.assertEqual(self.results, ["b"])
+
+    def test_any_rejects_when_all_reject(self):
+        first, second = Promise(), Promise()
+        self.watch(Promise.any([first, second]))
+        first.reject("oops")
+        second.reject("again")
+        self.assertEqual(self.errors, ["again"])
+
+    def test_with_timeout(self):
+        promise = Promise()
+        self.watch(promise.with_timeout(0.01))
+        self.assertTrue(wait_for(lambda: self.errors))
+        self.assertEqual(self.errors[0]["code"], ErrorCode.Timeout)
+        self.assertFalse(promise.done())
+
+    def test_with_timeout_settled_in_time(self):
+        promise = Promise()
+        self.watch(promise.with_timeout(10))
+        threading.Thread(target=lambda: promise.resolve(1)).start()
+        self.assertTrue(wait_for(lambda: self.results))
+        self.assertEqual(self.results, [1])
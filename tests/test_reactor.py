@@ -0,0 +1,108 @@
+from LSP.plugin.core.reactor import attach_logger
+from LSP.plugin.core.reactor import reactor_available
+from LSP.plugin.core.reactor import ReactorTransport
+from test_transports import json_rpc_message
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import unittest
+
+try:
+    from typing import List
+    assert List
+except ImportError:
+    pass
+
+
+def wait_for(condition, timeout=1.0):
+    event = threading.Event()
+    while not condition() and timeout > 0:
+        event.wait(0.01)
+        timeout -= 0.01
+    return condition()
+
+
+def receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+@unittest.skipUnless(reactor_available(), "the I/O reactor needs the selectors and fcntl modules")
+class ReactorTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client_socket, self.server_socket = socket.socketpair()
+        self.received = []  # type: List[str]
+        self.closed = []  # type: List[bool]
+        self.transport = ReactorTransport.for_socket(self.client_socket)
+        self.transport.start(self.received.append, lambda: self.closed.append(True))
+
+    def tearDown(self):
+        self.transport.close()
+        self.client_socket.close()
+        self.server_socket.close()
+
+    def test_read_messages(self):
+        self.server_socket.sendall(json_rpc_message("hello") + json_rpc_message("world"))
+        self.assertTrue(wait_for(lambda: len(self.received) == 2))
+        self.assertEqual(self.received, ["hello", "world"])
+
+    def test_write_messages(self):
+        self.transport.send("hello")
+        self.transport.send("world")
+        expected = json_rpc_message("hello") + json_rpc_message("world")
+        written = b""
+        while len(written) < len(expected):
+            written += self.server_socket.recv(len(expected))
+        self.assertEqual(written, expected)
+
+    def test_write_large_message(self):
+        payload = "x" * (4 * 1024 * 1024)
+        self.transport.send(payload)
+        expected = json_rpc_message(payload)
+        self.assertEqual(receive_exactly(self.server_socket, len(expected)), expected)
+
+    def test_write_streaming_payload(self):
+        payload = {"method": "textDocument/didOpen", "params": {"text": "h\u00e9llo\n" * 400000}}
+        self.transport.send_payload(payload)
+        expected = json_rpc_message(json.dumps(payload, separators=(',', ':')))
+        self.assertEqual(receive_exactly(self.server_socket, len(expected)), expected)
+
+    def test_closes_on_eof(self):
+        self.server_socket.shutdown(socket.SHUT_WR)
+        self.assertTrue(wait_for(lambda: self.closed))
+
+    def test_close_releases_socket(self):
+        self.transport.close()
+        self.assertTrue(wait_for(lambda: self.client_socket.fileno() == -1))
+
+    def test_close_releases_pipes(self):
+        process = subprocess.Popen([sys.executable, "-c", "import sys; sys.stdin.read()"],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        transport = ReactorTransport.for_process(process)
+        transport.start(self.received.append, lambda: None)
+        transport.close()
+        self.assertTrue(wait_for(lambda: process.stdin.closed and process.stdout.closed))
+        self.assertEqual(process.wait(5), 0)
+
+
+@unittest.skipUnless(reactor_available(), "the I/O reactor needs the selectors and fcntl modules")
+class StderrLoggerTests(unittest.TestCase):
+
+    def test_logs_lines(self):
+        read_fd, write_fd = os.pipe()
+        lines = []  # type: List[str]
+        with open(read_fd, "rb") as stream:
+            attach_logger(None, stream, lines.append)  # type: ignore
+            os.write(write_fd, "first\nsec".encode("UTF-8"))
+            os.write(write_fd, "ond\n\U00010000".encode("UTF-8"))
+            os.close(write_fd)
+            self.assertTrue(wait_for(lambda: len(lines) == 3))
+        self.assertEqual(lines, ["first", "second", "\U00010000"])
@@ -0,0 +1,70 @@
+from LSP.plugin.core.dispatch import InlineQueue
+from LSP.plugin.core.protocol import Request
+from LSP.plugin.core.recording import TrafficRecorder, load_trace
+from LSP.plugin.core.rpc import Client
+from LSP.plugin.core.types import Settings
+from replay_trace import ReplayTransport, replay, start_session
+import json
+import os
+import tempfile
+import unittest
+
+
+class TrafficRecorderTests(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        ticks = iter([10.0, 10.5, 11.25])
+        recorder = TrafficRecorder(open(self.path, "w", encoding="UTF-8"), lambda: next(ticks))
+        recorder.outgoing({"jsonrpc": "2.0", "id": 1, "method": "shutdown", "params": None})
+        recorder.incoming('{"jsonrpc": "2.0",\r\n "id": 1, "result": "a\\nb"}')
+        recorder.close()
+        recorder.incoming('{"ignored": true}')
+        frames = load_trace(self.path)
+        self.assertEqual([(f.timestamp, f.direction) for f in frames], [(0.5, "out"), (1.25, "in")])
+        self.assertEqual(frames[0].message["method"], "shutdown")
+        self.assertEqual(frames[1].message, {"jsonrpc": "2.0", "id": 1, "result": "a\nb"})
+
+    def test_replays_recorded_session(self):
+        transport = ReplayTransport()
+        client = Client(transport, Settings(), InlineQueue())
+        client.recorder = TrafficRecorder.open(self.path)
+        results = []
+        client.send_request(Request.hover({"x": 1}), results.append)
+        transport.receive('{"jsonrpc": "2.0", "id": 1, "result": "a"}')
+        client.recorder.close()
+
+        transport = ReplayTransport()
+        session = start_session("test", transport)
+        session.client.request_id = 41
+        replay(load_trace(self.path), session, transport, speed=0)
+        self.assertEqual(json.loads(transport.messages[-1])["id"], 42)
+        self.assertEqual(session.client.metrics.to_dict()["textDocument/hover"]["responses"], 1)
+        self.assertEqual(results, ["a"])
+
+    def test_replay_answers_the_server_like_the_plugin(self):
+        recorder = TrafficRecorder.open(self.path)
+        recorder.outgoing({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
+        recorder.incoming('{"jsonrpc": "2.0", "id": 1, "result": {"capabilities": {}}}')
+        recorder.outgoing({"jsonrpc": "2.0", "method": "initialized", "params": {}})
+        recorder.incoming('{"jsonrpc": "2.0", "id": "c", "method": "workspace/configuration", '
+                          '"params": {"items": [{}]}}')
+        recorder.outgoing({"jsonrpc": "2.0", "id": "c", "result": ["recorded"]})
+        recorder.incoming('{"jsonrpc": "2.0", "id": "e", "method": "workspace/applyEdit", "params": {"edit": {}}}')
+        recorder.outgoing({"jsonrpc": "2.0", "id": "e", "result": {"applied": True}})
+        recorder.close()
+
+        transport = ReplayTransport()
+        session = start_session("test", transport)
+        replay(load_trace(self.path), session, transport, speed=0)
+        sent = [json.loads(message) for message in transport.messages]
+        self.assertEqual([message.get("method") for message in sent], ["initialize", "initialized", None, None])
+        self.assertEqual(sent[2], {"jsonrpc": "2.0", "id": "c", "result": [{}]})
+        self.assertEqual(sent[3], {"jsonrpc": "2.0", "id": "e", "result": {"applied": True}})
+        self.assertEqual(session.client.pending_requests(), 0)
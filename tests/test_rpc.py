@@ -1,17 +1,26 @@
+from LSP.plugin.core.codec import format_request
+from LSP.plugin.core.dispatch import InlineQueue
+from LSP.plugin.core.dispatch import TaskQueue
 from LSP.plugin.core.logging import set_exception_logging
 from LSP.plugin.core.protocol import Error
 from LSP.plugin.core.protocol import ErrorCode
 from LSP.plugin.core.protocol import Notification
 from LSP.plugin.core.protocol import Request
 from LSP.plugin.core.rpc import Client
-from LSP.plugin.core.rpc import format_request
-from LSP.plugin.core.rpc import SyncRequestStatus
+from LSP.plugin.core.rpc import RequestWaiter
+from LSP.plugin.core.rpc import STREAMED_BATCH_SIZE
+from LSP.plugin.core.transports import ContentLengthFramer
+from LSP.plugin.core.transports import SendQueueFull
 from LSP.plugin.core.transports import Transport
 from LSP.plugin.core.types import Settings
-from LSP.plugin.core.typing import Any, List, Dict, Tuple
+from LSP.plugin.core.typing import Any, Callable, List, Dict, Tuple
 from test_mocks import MockSettings
+from test_reactor import wait_for
 import json
+import threading
+import time
 import unittest
+import unittest.mock
 
 
 def return_empty_dict_result(message):
@@ -59,85 +68,61 @@ class MockTransport(Transport):
         self.on_closed()
 
 
+class DeferredQueue(TaskQueue):
+    def __init__(self):
+        self.tasks = []  # type: List[Callable[[], None]]
+
+    def submit(self, task):
+        self.tasks.append(task)
+
+    def qsize(self):
+        return len(self.tasks)
+
+    def run(self):
+        while self.tasks:
+            self.tasks.pop(0)()
+
+
+class FullTransport(MockTransport):
+    def send(self, message):
+        raise SendQueueFull()
+
+
 class FormatTests(unittest.TestCase):
 
     def test_converts_payload_to_string(self):
         self.assertEqual("{}", format_request(dict()))
 
 
-class SyncRequestStatusTest(unittest.TestCase):
-
-    def test_tiny_state_machine(self):
-        sync = SyncRequestStatus()
-        self.assertTrue(sync.is_idle())
-        self.assertFalse(sync.is_requesting())
-        self.assertFalse(sync.is_ready())
-
-        sync.prepare(1)
-        self.assertFalse(sync.is_idle())
-        self.assertTrue(sync.is_requesting())
-        self.assertFalse(sync.is_ready())
-
-        sync.set(1, {"foo": "bar"})
-        self.assertFalse(sync.is_idle())
-        self.assertFalse(sync.is_requesting())
-        self.assertTrue(sync.is_ready())
-        self.assertFalse(sync.has_error())
-
-        payload = sync.flush()
-        self.assertTrue(sync.is_idle())
-        self.assertFalse(sync.is_requesting())
-        self.assertFalse(sync.is_ready())
-        self.assertDictEqual(payload, {"foo": "bar"})
-
-    def test_error_response(self):
-        sync = SyncRequestStatus()
-        sync.prepare(1)
-
-        sync.set_error(1, {"code": 1243, "message": "everything is broken!"})
-        self.assertFalse(sync.is_idle())
-        self.assertFalse(sync.is_requesting())
-        self.assertTrue(sync.is_ready())
-        self.assertTrue(sync.has_error())
-
-        error = sync.flush_error()
-        self.assertTrue(sync.is_idle())
-        self.assertFalse(sync.is_requesting())
-        self.assertFalse(sync.is_ready())
-        self.assertDictEqual(error, {"code": 1243, "message": "everything is broken!"})
-
-    def test_exception_during_requesting(self):
-        sync = SyncRequestStatus()
-        sync.prepare(1)
-        try:
-            raise RuntimeError("oops")
-            sync.set(1234, {"foo": "bar"})  # never reached
-        except Exception:
-            sync.reset()
-        # sync should be usable again
-        self.assertTrue(sync.is_idle())
-        self.assertFalse(sync.is_requesting())
-        self.assertFalse(sync.is_ready())
-
-    def test_assertion_error(self):
-        sync = SyncRequestStatus()
-        sync.prepare(4321)
-        with self.assertRaises(AssertionError):
-            sync.set(4322, {"foo": "bar"})
+class RequestWaiterTest(unittest.TestCase):
+
+    def test_resolve(self):
+        waiter = RequestWaiter()
+        self.assertFalse(waiter.wait(0))
+        waiter.resolve({"foo": "bar"})
+        self.assertTrue(waiter.wait(0))
+        self.assertDictEqual(waiter.result, {"foo": "bar"})
+        self.assertIsNone(waiter.error)
+
+    def test_reject(self):
+        waiter = RequestWaiter()
+        waiter.reject({"code": 1243, "message": "everything is broken!"})
+        self.assertTrue(waiter.wait(0))
+        self.assertDictEqual(waiter.error, {"code": 1243, "message": "everything is broken!"})
 
 
 class ClientTest(unittest.TestCase):
 
     def test_can_create_client(self):
         transport = MockTransport()
-        client = Client(transport, Settings())
+        client = Client(transport, Settings(), InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
 
     def do_client_request_response(self, method):
         transport = MockTransport(return_empty_dict_result)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         req = Request.initialize(dict())
@@ -157,7 +142,7 @@ class ClientTest(unittest.TestCase):
     def do_client_request_with_none_response(self, method):
         transport = MockTransport(return_null_result)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         req = Request.shutdown()
@@ -178,7 +163,7 @@ class ClientTest(unittest.TestCase):
     def do_client_should_reject_response_when_both_result_and_error_are_present(self, method):
         transport = MockTransport(lambda x: '{"id": 1, "result": {"key": "value"}, "error": {"message": "oops"}}')
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         req = Request.initialize(dict())
         responses = []
         errors = []
@@ -197,7 +182,7 @@ class ClientTest(unittest.TestCase):
     def do_client_should_reject_response_when_both_result_and_error_keys_are_not_present(self, method):
         transport = MockTransport(lambda x: '{"id": 1}')
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         req = Request.initialize(dict())
         responses = []
         errors = []
@@ -216,7 +201,7 @@ class ClientTest(unittest.TestCase):
     def test_client_notification(self):
         transport = MockTransport(notify_pong)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         pongs = []
@@ -228,10 +213,306 @@ class ClientTest(unittest.TestCase):
         self.assertGreater(len(transport.messages), 0)
         self.assertEqual(len(pongs), 1)
 
+    def test_unhandled_notification_params_are_not_decoded(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        decoded = []
+        client.logger.logs_payloads = lambda: False  # type: ignore
+        client.on_notification("pong", decoded.append)
+        transport.receive('{"jsonrpc": "2.0", "method": "ping", "params": {"not": json}}')
+        transport.receive('{"jsonrpc": "2.0", "method": "pong", "params": {"is": "json"}}')
+        self.assertEqual(decoded, [{"is": "json"}])
+
+    def test_request_for_view_supersedes_previous_request(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        responses = []  # type: List[Tuple[int, Any]]
+        errors = []  # type: List[Any]
+        first = client.send_request(Request.hover({}), lambda r: responses.append((1, r)), errors.append, view_id=1)
+        other_view = client.send_request(Request.hover({}), lambda r: responses.append((2, r)), view_id=2)
+        second = client.send_request(Request.hover({}), lambda r: responses.append((3, r)), view_id=1)
+        self.assertEqual(json.loads(transport.messages[2]),
+                         {"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": first.request_id}})
+        transport.receive('{"jsonrpc": "2.0", "id": %d, "error": {"code": -32800, "message": "cancelled"}}'
+                          % first.request_id)
+        transport.receive('{"jsonrpc": "2.0", "id": %d, "result": "a"}' % other_view.request_id)
+        transport.receive('{"jsonrpc": "2.0", "id": %d, "result": "b"}' % second.request_id)
+        self.assertEqual(responses, [(2, "a"), (3, "b")])
+        self.assertEqual(errors, [])
+
+    def test_send_request_returns_promise(self):
+        transport = MockTransport(return_empty_dict_result)
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        results = []  # type: List[Any]
+        client.send_request(Request.shutdown()).then(results.append)
+        self.assertEqual(results, [{}])
+
+    def test_cancelled_request_rejects_promise(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        errors = []  # type: List[Any]
+        promise = client.send_request(Request.shutdown())
+        promise.then(None, errors.append)
+        promise.cancel()
+        self.assertEqual(errors, [{"code": ErrorCode.RequestCancelled, "message": "cancelled"}])
+
+    def test_concurrent_blocking_requests(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        notifications = []  # type: List[Any]
+        client.on_notification("pong", notifications.append)
+        results = {}  # type: Dict[str, Any]
+
+        def execute(name):
+            client.execute_request(Request.shutdown(), lambda result: results.__setitem__(name, result), timeout=5)
+
+        threads = [threading.Thread(target=execute, args=(name,)) for name in ("first", "second")]
+        for thread in threads:
+            thread.start()
+        while len(transport.messages) < 2:
+            time.sleep(0.01)
+        # Notifications are handled while requests block.
+        transport.receive('{"jsonrpc": "2.0", "method": "pong", "params": 1}')
+        self.assertEqual(notifications, [1])
+        ids = [json.loads(message)["id"] for message in transport.messages]
+        transport.receive('{"jsonrpc": "2.0", "id": %d, "result": "two"}' % ids[1])
+        transport.receive('{"jsonrpc": "2.0", "id": %d, "result": "one"}' % ids[0])
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(results.values()), ["one", "two"])
+
+    def test_request_for_view_key_supersedes_only_the_same_key(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        errors = []  # type: List[Any]
+        client.send_request(Request.codeAction({}), lambda r: None, errors.append, view_id=1, view_key="a")
+        client.send_request(Request.codeAction({}), lambda r: None, errors.append, view_id=1, view_key="b")
+        self.assertEqual(client.pending_requests(), 2)
+        client.send_request(Request.codeAction({}), lambda r: None, errors.append, view_id=1, view_key="a")
+        self.assertEqual(client.pending_requests(), 2)
+        self.assertEqual(json.loads(transport.messages[-2]),
+                         {"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": 1}})
+        self.assertEqual(errors, [])
+
+    def test_request_deadline(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        errors = []  # type: List[Any]
+        client.send_request(Request.shutdown(), lambda _: None, errors.append, timeout=0)
+        client.send_request(Request.shutdown(), lambda _: None, errors.append, timeout=60)
+        self.assertEqual(client.pending_requests(), 2)
+        client.sweep_deadlines()
+        self.assertEqual(errors, [{"code": ErrorCode.Timeout, "message": "timeout on shutdown"}])
+        self.assertEqual(client.pending_requests(), 1)
+        self.assertEqual(json.loads(transport.messages[-1]),
+                         {"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": 1}})
+
+    def test_sweep_forgets_cancelled_requests_that_are_never_answered(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        responses = []  # type: List[Any]
+        with unittest.mock.patch("LSP.plugin.core.rpc.CANCELLED_RESPONSE_TIMEOUT", 0):
+            client.send_request(Request.hover({}), responses.append).cancel()
+        client.send_request(Request.hover({}), responses.append, timeout=0)
+        self.assertEqual(len(client._cancelled_requests), 1)
+        client.sweep_deadlines()
+        self.assertEqual(list(client._cancelled_requests), [2])
+        transport.receive('{"jsonrpc": "2.0", "id": 2, "result": "late"}')
+        self.assertEqual(len(client._cancelled_requests), 0)
+        self.assertEqual(responses, [])
+        transport.close()
+
+    def test_closing_the_transport_stops_the_sweep(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        client.send_request(Request.hover({}), lambda _: None, timeout=60).cancel()
+        timer = client._sweep_timer
+        self.assertIsNotNone(timer)
+        client.exiting = True
+        transport.close()
+        self.assertIsNone(client._sweep_timer)
+        self.assertTrue(timer.finished.is_set())
+        client.send_request(Request.hover({}), lambda _: None, timeout=60)
+        self.assertIsNone(client._sweep_timer)
+
+    def test_request_fails_when_send_queue_is_full(self):
+        transport = FullTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        errors = []  # type: List[Any]
+        client.send_request(Request.hover({}), lambda _: None, errors.append, view_id=1)
+        client.execute_request(Request.shutdown(), lambda _: None, errors.append, timeout=5)
+        self.assertEqual([error["code"] for error in errors], [ErrorCode.ServerBusy, ErrorCode.ServerBusy])
+        self.assertEqual(client.pending_requests(), 0)
+
+    def test_request_deadline_errors_are_handled_on_dispatch(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        dispatch = DeferredQueue()
+        client = Client(transport, settings, dispatch)
+        errors = []  # type: List[Any]
+        client.send_request(Request.hover({}), lambda _: None, errors.append, timeout=0)
+        client.sweep_deadlines()
+        self.assertEqual(errors, [])
+        dispatch.run()
+        self.assertEqual(errors, [{"code": ErrorCode.Timeout, "message": "timeout on textDocument/hover"}])
+
+    def test_identical_requests_share_a_round_trip(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        responses = []  # type: List[Tuple[int, Any]]
+        client.send_request(Request.hover({"x": 1, "y": 2}), lambda r: responses.append((1, r)), document_version=1)
+        client.send_request(Request.hover({"y": 2, "x": 1}), lambda r: responses.append((2, r)), document_version=1)
+        client.send_request(Request.hover({"x": 1, "y": 2}), lambda r: responses.append((3, r)), document_version=2)
+        self.assertEqual(len(transport.messages), 2)
+        transport.receive('{"jsonrpc": "2.0", "id": 1, "result": "a"}')
+        transport.receive('{"jsonrpc": "2.0", "id": 2, "result": "b"}')
+        self.assertEqual(responses, [(1, "a"), (2, "a"), (3, "b")])
+        self.assertEqual(client.pending_requests(), 0)
+
+    def test_shared_request_is_cancelled_by_its_last_sharer(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        first = client.send_request(Request.hover({}), document_version=1)
+        second = client.send_request(Request.hover({}), document_version=1)
+        self.assertIsNot(first, second)
+        first.cancel()
+        first.cancel()
+        self.assertEqual(len(transport.messages), 1)
+        second.cancel()
+        self.assertEqual(json.loads(transport.messages[-1])["method"], "$/cancelRequest")
+        self.assertEqual(len(transport.messages), 2)
+
+    def test_cancelled_sharer_is_not_answered(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        responses = []  # type: List[Tuple[int, Any]]
+        errors = []  # type: List[Tuple[int, Any]]
+        first = client.send_request(Request.hover({}), lambda r: responses.append((1, r)),
+                                    lambda e: errors.append((1, e)), document_version=1)
+        second = client.send_request(Request.hover({}), lambda r: responses.append((2, r)),
+                                     lambda e: errors.append((2, e)), document_version=1)
+        rejections = []  # type: List[Any]
+        first.then(None, rejections.append)
+        first.cancel()
+        self.assertEqual(rejections, [{"code": ErrorCode.RequestCancelled, "message": "cancelled"}])
+        transport.receive('{"jsonrpc": "2.0", "id": %d, "result": "a"}' % second.request_id)
+        self.assertEqual(responses, [(2, "a")])
+        self.assertEqual(errors, [])
+        self.assertEqual(client.pending_requests(), 0)
+
+    def test_sharers_are_superseded_per_view(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        responses = []  # type: List[Tuple[int, Any]]
+        client.send_request(Request.hover({}), lambda r: responses.append((1, r)), view_id=1, document_version=1)
+        client.send_request(Request.hover({}), lambda r: responses.append((2, r)), view_id=2, document_version=1)
+        client.send_request(Request.hover({"x": 1}), lambda r: responses.append((3, r)), view_id=2)
+        client.send_request(Request.hover({}), lambda r: responses.append((4, r)), view_id=1, document_version=1)
+        self.assertEqual(len(transport.messages), 2)
+        transport.receive('{"jsonrpc": "2.0", "id": 2, "result": "b"}')
+        transport.receive('{"jsonrpc": "2.0", "id": 1, "result": "a"}')
+        self.assertEqual(responses, [(3, "b"), (4, "a")])
+        client.send_request(Request.hover({}), lambda r: None, view_id=1, document_version=2)
+        client.send_request(Request.hover({}), lambda r: None, view_id=2, document_version=2)
+        client.cancel_view_requests(1)
+        self.assertEqual(len(transport.messages), 3)
+        client.cancel_view_requests(2)
+        self.assertEqual(json.loads(transport.messages[-1]),
+                         {"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": 3}})
+        self.assertEqual(client.pending_requests(), 0)
+
+    def test_records_metrics_per_method(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        client.send_request(Request.hover({}), lambda r: None)
+        response = '{"jsonrpc": "2.0", "id": 1, "result": "a"}'
+        transport.receive(response)
+        hover = client.metrics.to_dict()["textDocument/hover"]
+        self.assertEqual((hover["sent"], hover["responses"], hover["errors"]), (1, 1, 0))
+        self.assertEqual(hover["bytes_out"], len(transport.messages[0]))
+        self.assertEqual(hover["bytes_in"], len(response))
+        self.assertEqual(hover["time_to_response"]["count"], 1)
+        self.assertEqual(hover["handler_time"]["count"], 1)
+
+    def test_records_bytes_and_first_byte_of_framed_responses(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        client.send_request(Request.hover({}), lambda r: None)
+        client.send_request(Request.hover({}), lambda r: None)
+        body = '{"jsonrpc": "2.0", "id": 1, "result": "\u00e9"}'.encode("UTF-8")
+        framer = ContentLengthFramer(client.receive_payload)
+        framer.feed(b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n\r\n" + body)
+        transport.receive('{"jsonrpc": "2.0", "id": 2, "result": "\u00e9"}')
+        hover = client.metrics.to_dict()["textDocument/hover"]
+        self.assertEqual(hover["bytes_in"], 2 * len(body))
+        self.assertEqual(hover["time_to_first_byte"]["count"], 1)
+        self.assertEqual(hover["time_to_response"]["count"], 2)
+
+    def test_cancels_requests_of_closed_view(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        client.send_request(Request.hover({}), lambda r: None, view_id=1)
+        client.send_request(Request.complete({}), lambda r: None, view_id=1)
+        client.send_request(Request.hover({}), lambda r: None, view_id=2)
+        client.cancel_view_requests(1)
+        self.assertEqual(client.pending_requests(), 1)
+        cancelled = [json.loads(message)["params"]["id"] for message in transport.messages[3:]]
+        self.assertEqual(sorted(cancelled), [1, 2])
+
+    def test_streams_array_results_to_partial_handler(self):
+        transport = MockTransport()
+        settings = MockSettings()
+        client = Client(transport, settings, InlineQueue())
+        batches = []  # type: List[List[Any]]
+        responses = []  # type: List[Any]
+        client.send_request(Request.references({}), responses.append, partial_handler=batches.append)
+        elements = list(range(STREAMED_BATCH_SIZE + 1))
+        transport.receive(json.dumps({"jsonrpc": "2.0", "id": 1, "result": elements}))
+        self.assertEqual(batches, [elements[:-1], elements[-1:]])
+        self.assertEqual(responses, [None])
+        self.assertEqual(client.pending_requests(), 0)
+
+    def test_handlers_run_off_the_reader_thread_in_order(self):
+        transport = MockTransport()
+        client = Client(transport, MockSettings())
+        release = threading.Event()
+        handled = []  # type: List[Tuple[str, Any]]
+
+        def slow(params):
+            release.wait(5)
+            handled.append(("slow", threading.current_thread()))
+
+        client.on_notification("slow", slow)
+        client.on_notification("fast", lambda params: handled.append(("fast", threading.current_thread())))
+        transport.receive('{"jsonrpc": "2.0", "method": "slow"}')
+        transport.receive('{"jsonrpc": "2.0", "method": "fast"}')
+        self.assertTrue(wait_for(lambda: client.dispatch_depth() == 1))  # fast waits for slow
+        release.set()
+        self.assertTrue(wait_for(lambda: len(handled) == 2))
+        self.assertEqual([name for name, _ in handled], ["slow", "fast"])
+        self.assertNotEqual(handled[0][1], threading.current_thread())
+
     def test_server_request(self):
         transport = MockTransport()
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         pings = []  # type: List[Tuple[Any, Dict[str, Any]]]
@@ -246,7 +527,7 @@ class ClientTest(unittest.TestCase):
     def test_server_request_non_integer_request(self):
         transport = MockTransport()
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         pings = []  # type: List[Tuple[Any, Dict[str, Any]]]
@@ -261,7 +542,7 @@ class ClientTest(unittest.TestCase):
     def test_server_request_unknown(self):
         transport = MockTransport()
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         transport.receive('{ "id": "abcd-1234-efgh-5678", "method": "ping"}')
@@ -281,7 +562,7 @@ class ClientTest(unittest.TestCase):
     def test_server_request_exception_during_handler(self):
         transport = MockTransport()
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
 
@@ -306,7 +587,7 @@ class ClientTest(unittest.TestCase):
     def test_server_request_send_error(self):
         transport = MockTransport()
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
 
@@ -331,7 +612,7 @@ class ClientTest(unittest.TestCase):
     def do_error_response_handler(self, method):
         transport = MockTransport(return_error)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         req = Request.initialize(dict())
@@ -352,7 +633,7 @@ class ClientTest(unittest.TestCase):
     def do_error_display_handler(self, method):
         transport = MockTransport(return_error)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         req = Request.initialize(dict())
@@ -375,7 +656,7 @@ class ClientTest(unittest.TestCase):
         set_exception_logging(False)
         transport = MockTransport(raise_error)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         errors = []
         client.set_transport_failure_handler(lambda: errors.append(""))
         self.assertTrue(transport.has_started)
@@ -386,7 +667,7 @@ class ClientTest(unittest.TestCase):
         set_exception_logging(False)
         transport = MockTransport(return_empty_dict_result)
         settings = MockSettings()
-        client = Client(transport, settings)
+        client = Client(transport, settings, InlineQueue())
         self.assertIsNotNone(client)
         self.assertTrue(transport.has_started)
         req = Request.initialize(dict())
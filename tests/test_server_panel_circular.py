@@ -44,3 +44,11 @@ class LspServerPanelTests(TestCase):
         self.assertEqual(self.panel.substr(line_regions[n - 3]), "test: one")
         self.assertEqual(self.panel.substr(line_regions[n - 2]), "two")
         self.assertEqual(self.panel.substr(line_regions[n - 1]), "three")
+
+    def test_server_panel_batch_update(self):
+        n = SERVER_PANEL_MAX_LINES
+        self.panel.run_command("lsp_update_server_panel", {"messages": [["test", str(i)] for i in range(n + 2)]})
+        self.assert_total_lines_equal(n)
+        line_regions = self.panel.split_by_newlines(sublime.Region(0, self.panel.size()))
+        self.assertEqual(self.panel.substr(line_regions[0]), "test: 2")
+        self.assertEqual(self.panel.substr(line_regions[n - 1]), "test: {}".format(n + 1))
@@ -275,3 +275,31 @@ class SessionTest(unittest.TestCase):
         self.assertTrue(session.should_notify_did_change())
         self.assertFalse(session.should_notify_will_save())
         self.assertEqual(session.should_notify_did_save(), (False, False))
+
+    def test_capability_index_follows_registrations(self) -> None:
+        client = MockClient()
+        client.responses = {
+            'initialize': {
+                'capabilities': {
+                    'hoverProvider': True,
+                    'textDocumentSync': {"openClose": True, "change": TextDocumentSyncKindNone}}}}
+        session = Session(TEST_CONFIG, [], client)
+        self.assertTrue(session.has_capability('hoverProvider'))
+        self.assertFalse(session.has_capability('textDocumentSync.willSave'))
+        version = session.capabilities_version
+
+        session._handle_register_capability({"registrations": [
+            {"method": "textDocument/didChange", "id": "1", "registerOptions": {"syncKind": 2}},
+            {"method": "textDocument/rename", "id": "2"}]}, 1)
+        self.assertGreater(session.capabilities_version, version)
+        self.assertEqual(session.get_capability('renameProvider.id'), "2")
+        self.assertEqual(session.get_capability('textDocumentSync.change.syncKind'), 2)
+        self.assertEqual(session.text_sync_kind(), TextDocumentSyncKindIncremental)
+        self.assertTrue(session.has_capability('textDocumentSync.openClose'))
+
+        version = session.capabilities_version
+        session._handle_unregister_capability({"unregisterations": [{"method": "textDocument/rename", "id": "2"}]}, 2)
+        self.assertGreater(session.capabilities_version, version)
+        self.assertFalse(session.has_capability('renameProvider'))
+        self.assertIsNone(session.get_capability('renameProvider.id'))
+        self.assertTrue(session.has_capability('hoverProvider'))
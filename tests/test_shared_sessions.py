@@ -0,0 +1,87 @@
+from LSP.plugin.core.protocol import WorkspaceFolder
+from LSP.plugin.core.shared_sessions import SessionRegistry, session_key
+from LSP.plugin.core.types import ClientConfig
+import threading
+import unittest
+
+
+def folders(*paths):
+    return [WorkspaceFolder.from_path(path) for path in paths]
+
+
+class SessionRegistryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = SessionRegistry()
+        self.config = ClientConfig("pyls", ["pyls"], None, settings={"pyls": {"plugins": {}}})
+        self.key = session_key(self.config, folders("/b", "/a"))
+        self.started = []
+
+    def start(self, shared):
+        session = object()
+        self.started.append(session)
+        return session
+
+    def test_key_ignores_folder_order(self):
+        self.assertEqual(self.key, session_key(self.config, folders("/a", "/b")))
+        self.assertNotEqual(self.key, session_key(ClientConfig("clangd", ["clangd"], None), folders("/a", "/b")))
+
+    def test_key_tells_project_overrides_apart(self):
+        same = ClientConfig("pyls", ["pyls"], None, settings={"pyls": {"plugins": {}}})
+        overridden = ClientConfig("pyls", ["pyls"], None, settings={"pyls": {"plugins": {"pylint": True}}})
+        self.assertEqual(self.key, session_key(same, folders("/a", "/b")))
+        self.assertNotEqual(self.key, session_key(overridden, folders("/a", "/b")))
+
+    def test_windows_attach_to_one_session(self):
+        first, initialized = self.registry.attach(self.key, "w1", self.start)
+        self.assertFalse(initialized)
+        second, initialized = self.registry.attach(self.key, "w2", self.start)
+        self.assertIs(first, second)
+        self.assertFalse(initialized)
+        self.assertEqual(len(self.started), 1)
+        self.assertEqual(self.registry.initialized(first), ["w1", "w2"])
+        _, initialized = self.registry.attach(self.key, "w3", self.start)
+        self.assertTrue(initialized)
+        self.assertEqual(self.registry.windows(first), ["w1", "w2", "w3"])
+
+    def test_last_window_ends_session(self):
+        shared, _ = self.registry.attach(self.key, "w1", self.start)
+        self.registry.attach(self.key, "w2", self.start)
+        self.assertFalse(self.registry.detach(shared, "w1"))
+        self.assertTrue(self.registry.detach(shared, "w2"))
+        another, _ = self.registry.attach(self.key, "w3", self.start)
+        self.assertIsNot(another, shared)
+        self.assertEqual(len(self.started), 2)
+        self.assertEqual(self.registry.ended(shared), ["w2"])
+        self.assertEqual(self.registry.windows(another), ["w3"])
+
+    def test_forgets_session_that_did_not_start(self):
+        shared, _ = self.registry.attach(self.key, "w1", lambda shared: None)
+        self.assertIsNone(shared)
+        shared, _ = self.registry.attach(self.key, "w1", self.start)
+        self.assertIs(shared.session, self.started[0])
+
+    def test_starts_session_outside_of_the_lock(self):
+        starting = threading.Event()
+        proceed = threading.Event()
+
+        def slow_start(shared):
+            starting.set()
+            self.assertTrue(proceed.wait(5))
+            return self.start(shared)
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.registry.attach(self.key, "w1", slow_start)))
+        thread.start()
+        self.assertTrue(starting.wait(5))
+        other = session_key(ClientConfig("clangd", ["clangd"], None), folders("/a"))
+        other_shared, _ = self.registry.attach(other, "w2", self.start)
+        self.assertIs(other_shared.session, self.started[0])
+        waiter = threading.Thread(target=lambda: results.append(self.registry.attach(self.key, "w3", self.start)))
+        waiter.start()
+        proceed.set()
+        thread.join(5)
+        waiter.join(5)
+        self.assertEqual(len(self.started), 2)
+        self.assertIs(results[0][0], results[1][0])
+        self.assertEqual(self.registry.windows(results[0][0]), ["w1", "w3"])
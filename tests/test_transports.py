@@ -1,10 +1,31 @@
 import unittest
+import unittest.mock
 import io
+import json
+import os
+from LSP.plugin.core.protocol import ErrorCode
+from LSP.plugin.core.transports import connect_unix
+from LSP.plugin.core.transports import ConnectingTransport
+from LSP.plugin.core.transports import ContentLengthFramer
+from LSP.plugin.core.transports import create_unix_socket_path
+from LSP.plugin.core.transports import document_uri
+from LSP.plugin.core.transports import is_full_did_change
+from LSP.plugin.core.transports import message_priority
+from LSP.plugin.core.transports import PRIORITY_BACKGROUND
+from LSP.plugin.core.transports import PRIORITY_INTERACTIVE
+from LSP.plugin.core.transports import PRIORITY_SYNC
+from LSP.plugin.core.transports import received_frame
+from LSP.plugin.core.transports import SendQueue
+from LSP.plugin.core.transports import SendQueueFull
+from LSP.plugin.core.transports import StdioTransport
 from LSP.plugin.core.transports import TCPTransport
+from LSP.plugin.core.transports import Transport
+import socket
+import threading
 import time
 try:
-    from typing import List
-    assert List
+    from typing import Any, Dict, List
+    assert Any and Dict and List
 except ImportError:
     pass
 
@@ -37,19 +58,20 @@ class FakeProcess(object):
 class FakeSocket(object):
     def __init__(self, received: bytes) -> None:
         self.received = received
-        self.sent = []  # type: List[str]
+        self.sent = []  # type: List[bytes]
         self.index = 0
 
-    def recv(self, length: int) -> bytes:
-        slc = self.received[self.index:length]
+    def recv_into(self, buffer: memoryview) -> int:
+        slc = self.received[self.index:self.index + len(buffer)]
         if slc:
-            self.index = max(len(self.received), self.index + length)
-            return slc
+            buffer[:len(slc)] = slc
+            self.index += len(slc)
+            return len(slc)
         else:
             time.sleep(1)  # simulate blocking for the duration of the test.
-            return b''
+            return 0
 
-    def sendall(self, payload: str) -> None:
+    def sendall(self, payload: bytes) -> None:
         self.sent.append(payload)
 
 
@@ -88,5 +110,351 @@ class TCPTransportTests(unittest.TestCase):
         t.send("hello")
         t.send("world")
         time.sleep(0.1)
-        self.assertEqual(sock.sent, [json_rpc_message("hello"), json_rpc_message("world")])
+        # Messages that are queued at the same time may be coalesced into a single write.
+        self.assertEqual(b"".join(sock.sent), json_rpc_message("hello") + json_rpc_message("world"))
         t.close()
+
+    def test_write_streaming_payload(self):
+        sock = FakeSocket(b'')
+        t = TCPTransport(sock)
+        payload = {"method": "textDocument/didOpen", "params": {"text": "h\u00e9llo\n" * 100000}}
+        t.send_payload(payload)
+        t.start(lambda _: None, lambda: None)
+        t.send_queue.put(None)
+        t.write_thread.join(1)
+        self.assertEqual(b"".join(sock.sent), json_rpc_message(json.dumps(payload, separators=(',', ':'))))
+
+    def test_write_non_ascii_message(self):
+        sock = FakeSocket(b'')
+        t = TCPTransport(sock)
+        t.start(lambda msg: None, lambda: None)
+        t.send("h\u00e9llo")
+        time.sleep(0.1)
+        self.assertEqual(b"".join(sock.sent), b'Content-Length: 6\r\n\r\nh\xc3\xa9llo')
+        t.close()
+
+
+class StdioTransportTests(unittest.TestCase):
+    def test_read_messages(self):
+        process = FakeProcess()
+        t = StdioTransport(process)  # type: ignore
+        received = []
+        closed = []
+        t.start(received.append, lambda: closed.append(True))
+        t.read_thread.join(1)
+        self.assertEqual(received, ["hello", "world"])
+        t.close()
+
+    def test_write_messages(self):
+        stdin_read, stdin_write = os.pipe()
+        stdout_read, stdout_write = os.pipe()
+        process = FakeProcess()
+        process.stdin = open(stdin_write, "wb")  # type: ignore
+        process.stdout = open(stdout_read, "rb")  # type: ignore
+        t = StdioTransport(process)  # type: ignore
+        t.start(lambda msg: None, lambda: None)
+        t.send("hello")
+        t.send("world")
+        expected = json_rpc_message("hello") + json_rpc_message("world")
+        written = b""
+        while len(written) < len(expected):
+            written += os.read(stdin_read, len(expected))
+        self.assertEqual(written, expected)
+        os.close(stdout_write)  # EOF ends the read thread
+        t.read_thread.join(1)
+        os.close(stdin_read)
+        process.stdin.close()
+        process.stdout.close()
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs Unix domain sockets")
+class UnixTransportTests(unittest.TestCase):
+    def test_connect_and_exchange_messages(self):
+        path = create_unix_socket_path()
+        accepted = []
+
+        def serve():
+            # Listen a little later, like a server that is still starting up.
+            time.sleep(0.1)
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+            listener.listen(1)
+            accepted.append(listener.accept()[0])
+            listener.close()
+
+        server = threading.Thread(target=serve)
+        server.start()
+        transport = TCPTransport(connect_unix(path))
+        server.join()
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+        received = []
+        closed = []
+        transport.start(received.append, lambda: closed.append(True))
+        server_socket = accepted[0]
+        server_socket.sendall(json_rpc_message("hello"))
+        transport.send("world")
+        expected = json_rpc_message("world")
+        written = b""
+        while len(written) < len(expected):
+            written += server_socket.recv(len(expected))
+        self.assertEqual(written, expected)
+        server_socket.close()
+        transport.read_thread.join(1)
+        self.assertEqual(received, ["hello"])
+        self.assertEqual(closed, [True])
+
+
+class ConnectingTransportTests(unittest.TestCase):
+    def setUp(self):
+        self.client_socket, self.server_socket = socket.socketpair()
+        self.connected = threading.Event()
+        self.closed = []
+
+    def tearDown(self):
+        self.client_socket.close()
+        self.server_socket.close()
+
+    def connect(self):
+        self.assertTrue(self.connected.wait(1))
+        return self.client_socket
+
+    def test_sends_queued_messages_once_connected(self):
+        t = ConnectingTransport(self.connect, TCPTransport)
+        t.start(lambda _: None, lambda: self.closed.append(True))
+        t.send("hello")
+        t.send_payload({"id": 1})
+        self.assertEqual(t.queue_depth(), 2)
+        self.connected.set()
+        t.connect_thread.join(1)
+        t.send("world")
+        expected = json_rpc_message("hello") + json_rpc_message('{"id":1}') + json_rpc_message("world")
+        written = b""
+        while len(written) < len(expected):
+            written += self.server_socket.recv(len(expected))
+        self.assertEqual(written, expected)
+        t.close()
+        self.assertEqual(self.closed, [True])
+
+    def test_closes_when_connecting_fails(self):
+        def refuse():
+            raise Exception("Timeout connecting to socket")
+
+        t = ConnectingTransport(refuse, TCPTransport)
+        t.start(lambda _: None, lambda: self.closed.append(True))
+        t.connect_thread.join(1)
+        self.assertEqual(self.closed, [True])
+
+    def test_close_while_connecting(self):
+        t = ConnectingTransport(self.connect, TCPTransport)
+        t.start(lambda _: None, lambda: self.closed.append(True))
+        t.close()
+        self.connected.set()
+        t.connect_thread.join(1)
+        self.assertEqual(self.closed, [True])
+        self.assertEqual(self.server_socket.recv(1), b"")
+
+    def test_refuses_requests_while_too_many_are_queued(self):
+        t = ConnectingTransport(self.connect, TCPTransport)
+        t.start(lambda _: None, lambda: self.closed.append(True))
+        with unittest.mock.patch("LSP.plugin.core.transports.MAX_QUEUED_MESSAGES", 2):
+            t.send_payload({"id": 1, "method": "textDocument/hover"})
+            t.send_payload({"method": "textDocument/didOpen"})
+            with self.assertRaises(SendQueueFull):
+                t.send_payload({"id": 2, "method": "textDocument/hover"})
+            t.send_payload({"method": "textDocument/didChange"})
+            t.send_payload({"id": 3, "method": "shutdown"})
+        self.assertEqual(t.queue_depth(), 4)
+        t.close()
+
+    def test_queued_request_refused_once_connected_gets_an_error(self):
+        class FullTransport(Transport):
+            def __init__(self):
+                pass
+
+            def start(self, on_receive, on_closed):
+                pass
+
+            def send(self, message):
+                pass
+
+            def send_payload(self, payload):
+                if "id" in payload:
+                    raise SendQueueFull()
+                return 0
+
+            def close(self):
+                pass
+
+        received = []  # type: List[str]
+        t = ConnectingTransport(self.connect, lambda sock: FullTransport())
+        t.start(received.append, lambda: self.closed.append(True))
+        t.send_payload({"method": "textDocument/didOpen"})
+        t.send_payload({"id": 1, "method": "textDocument/hover"})
+        self.connected.set()
+        t.connect_thread.join(1)
+        self.assertFalse(t.connect_thread.is_alive())
+        self.assertEqual([json.loads(message) for message in received], [{
+            "jsonrpc": "2.0", "id": 1,
+            "error": {"code": ErrorCode.ServerBusy, "message": "too many messages queued for textDocument/hover"}}])
+
+
+def did_change(uri, text, full=True):
+    change = {"text": text}  # type: Dict[str, Any]
+    if not full:
+        change["range"] = {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}}
+    return {"method": "textDocument/didChange", "params": {"textDocument": {"uri": uri}, "contentChanges": [change]}}
+
+
+def hover(uri):
+    return {"id": 1, "method": "textDocument/hover", "params": {"textDocument": {"uri": uri}}}
+
+
+class SendQueueTests(unittest.TestCase):
+    def put(self, queue, payload):
+        queue.put((b"", payload), document_uri(payload), is_full_did_change(payload))
+
+    def drain(self, queue):
+        messages = []
+        while queue.qsize():
+            messages.append(queue.get()[1])
+        return messages
+
+    def test_full_did_change_supersedes_queued_did_change(self):
+        queue = SendQueue()
+        self.put(queue, did_change("file:///a", "1"))
+        self.put(queue, did_change("file:///b", "1"))
+        self.put(queue, did_change("file:///a", "2"))
+        self.assertEqual(queue.qsize(), 2)
+        self.assertEqual(self.drain(queue), [did_change("file:///b", "1"), did_change("file:///a", "2")])
+
+    def test_no_supersession_across_other_messages_about_the_document(self):
+        queue = SendQueue()
+        self.put(queue, did_change("file:///a", "1"))
+        self.put(queue, hover("file:///a"))
+        self.put(queue, did_change("file:///a", "2"))
+        self.assertEqual(self.drain(queue), [did_change("file:///a", "1"), hover("file:///a"),
+                                             did_change("file:///a", "2")])
+
+    def test_incremental_did_change_is_never_superseded(self):
+        queue = SendQueue()
+        self.put(queue, did_change("file:///a", "1", full=False))
+        self.put(queue, did_change("file:///a", "2"))
+        self.put(queue, did_change("file:///a", "3", full=False))
+        self.assertEqual(queue.qsize(), 3)
+
+    def test_refuses_requests_while_full(self):
+        queue = SendQueue(maxsize=1)
+        queue.put_payload(hover("file:///a"))
+        with self.assertRaises(SendQueueFull):
+            queue.put_payload(dict(hover("file:///a"), id=2))
+        queue.put_payload({"id": 3, "method": "shutdown", "params": None})
+        queue.put_payload(did_change("file:///a", "1", full=False))
+        queue.put_payload({"id": 7, "result": None})
+        self.assertEqual(queue.qsize(), 4)
+
+    def test_full_did_change_supersedes_while_full(self):
+        queue = SendQueue(maxsize=1)
+        self.put(queue, did_change("file:///a", "1"))
+        self.put(queue, did_change("file:///a", "2"))
+        self.assertEqual(self.drain(queue), [did_change("file:///a", "2")])
+
+
+class SendQueuePriorityTests(unittest.TestCase):
+    def drain(self, queue):
+        messages = []
+        while queue.qsize():
+            messages.append(json.loads(queue.get()[1].decode("UTF-8")))
+        return messages
+
+    def request(self, request_id, method, uri=None):
+        payload = {"id": request_id, "method": method, "params": {}}  # type: Dict[str, Any]
+        if uri:
+            payload["params"]["textDocument"] = {"uri": uri}
+        return payload
+
+    def test_priority_classes(self):
+        queue = SendQueue()
+        payloads = [self.request(1, "workspace/executeCommand"), self.request(2, "textDocument/hover"),
+                    did_change("file:///a", "1"), {"method": "$/cancelRequest", "params": {"id": 0}}]
+        for payload in payloads:
+            queue.put_payload(payload)
+        self.assertEqual(self.drain(queue), [payloads[2], payloads[3], payloads[1], payloads[0]])
+
+    def test_did_change_does_not_overtake_request_about_the_document(self):
+        queue = SendQueue()
+        payloads = [self.request(1, "textDocument/documentSymbol", "file:///a"), did_change("file:///a", "1"),
+                    did_change("file:///b", "1")]
+        for payload in payloads:
+            queue.put_payload(payload)
+        self.assertEqual(self.drain(queue), [payloads[2], payloads[0], payloads[1]])
+
+    def test_cancel_does_not_overtake_its_request(self):
+        queue = SendQueue()
+        payloads = [self.request(1, "workspace/symbol"), {"method": "$/cancelRequest", "params": {"id": 1}},
+                    {"method": "$/cancelRequest", "params": {"id": 2}}]
+        for payload in payloads:
+            queue.put_payload(payload)
+        self.assertEqual(self.drain(queue), [payloads[2], payloads[0], payloads[1]])
+
+    def test_message_priority(self):
+        self.assertEqual(message_priority(did_change("file:///a", "1")), PRIORITY_SYNC)
+        self.assertEqual(message_priority(self.request(1, "initialize")), PRIORITY_SYNC)
+        self.assertEqual(message_priority({"id": 1, "result": None}), PRIORITY_INTERACTIVE)
+        self.assertEqual(message_priority(self.request(1, "textDocument/completion")), PRIORITY_INTERACTIVE)
+        self.assertEqual(message_priority(self.request(1, "workspace/executeCommand")), PRIORITY_BACKGROUND)
+
+
+class ContentLengthFramerTests(unittest.TestCase):
+    def setUp(self):
+        self.received = []  # type: List[str]
+
+    def test_feed_fragmented_messages(self):
+        framer = ContentLengthFramer(self.received.append)
+        data = json_rpc_message("hello") + json_rpc_message("world")
+        for i in range(0, len(data)):
+            framer.feed(data[i:i + 1])
+        self.assertEqual(self.received, ["hello", "world"])
+
+    def test_feed_multiple_messages_at_once(self):
+        framer = ContentLengthFramer(self.received.append)
+        framer.feed(json_rpc_message("hello") + json_rpc_message("world") + json_rpc_message("!")[:5])
+        self.assertEqual(self.received, ["hello", "world"])
+
+    def test_read_from_grows_buffer_for_large_message(self):
+        payload = "x" * 10000
+        stream = io.BytesIO(json_rpc_message(payload) + json_rpc_message("small"))
+        framer = ContentLengthFramer(self.received.append, chunk_size=16)
+        while framer.read_from(stream.readinto):
+            framer.process()
+        self.assertEqual(self.received, [payload, "small"])
+
+    def test_content_length_counts_bytes(self):
+        framer = ContentLengthFramer(self.received.append)
+        payload = '{"text":"\u00e9\U00010000"}'
+        body = payload.encode("UTF-8")
+        framer.feed(b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n\r\n" + body)
+        self.assertEqual(self.received, [payload])
+
+    def test_received_frame_tells_when_a_message_started_to_arrive(self):
+        frames = []  # type: List[Any]
+        framer = ContentLengthFramer(lambda _: frames.append(received_frame()))
+        body = '"\u00e9"'.encode("UTF-8")
+        data = b"Content-Length: 4\r\n\r\n" + body + json_rpc_message("hello")
+        before = time.monotonic()
+        framer.feed(data[:10])
+        between = time.monotonic()
+        framer.feed(data[10:])
+        self.assertEqual([size for _, size in frames], [4, 5])
+        self.assertTrue(before <= frames[0][0] <= between)
+        self.assertGreaterEqual(frames[1][0], between)
+        self.assertIsNone(received_frame())
+
+    def test_ignores_other_headers(self):
+        framer = ContentLengthFramer(self.received.append)
+        framer.feed(b"Content-Length: 5\r\nContent-Type: application/vscode-jsonrpc; charset=utf-8\r\n\r\nhello")
+        self.assertEqual(self.received, ["hello"])
+
+    def test_read_from_returns_zero_on_eof(self):
+        framer = ContentLengthFramer(self.received.append)
+        self.assertEqual(framer.read_from(io.BytesIO(b"").readinto), 0)
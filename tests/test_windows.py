@@ -1,8 +1,10 @@
 from LSP.plugin.core.diagnostics import DiagnosticsStorage
 from LSP.plugin.core.sessions import create_session
 from LSP.plugin.core.sessions import Session
+from LSP.plugin.core.shared_sessions import SessionRegistry
 from LSP.plugin.core.types import ClientConfig
 from LSP.plugin.core.types import LanguageConfig
+from LSP.plugin.core.url import filename_to_uri
 from LSP.plugin.core.windows import WindowManager
 from LSP.plugin.core.windows import WindowRegistry
 from LSP.plugin.core.workspace import ProjectFolders
@@ -159,6 +161,14 @@ class WindowManagerTests(unittest.TestCase):
         self.assertEqual(len(wm._sessions), 0)
         self.assertEqual(len(docs._sessions), 0)
 
+    def test_cancels_requests_of_closed_view(self):
+        _, _, _, wm = self.make([[MockView(__file__)]])
+        session = wm.get_session(TEST_CONFIG.name, __file__)
+        self.assertIsNotNone(session)
+        view = MockView(__file__)
+        wm.cancel_view_requests(view)
+        self.assertEqual(session.client.cancelled_views, [view.id()])
+
     def test_ends_sessions_when_quick_switching(self):
         test_window, docs, _, wm = self.make([[MockView(__file__)]], folders=[os.path.dirname(__file__)])
 
@@ -200,6 +210,15 @@ class WindowManagerTests(unittest.TestCase):
         # our starting document must be loaded
         self.assertListEqual(docs._documents, [__file__])
 
+    def test_drops_log_buffer_of_ended_session(self):
+        _, _, _, wm = self.make([[MockView(__file__)]])
+        wm.server_panel_factory = lambda window: None
+        wm._handle_log_message(TEST_CONFIG.name, {"message": "hello"})
+        self.assertIn(TEST_CONFIG.name, wm._log_buffers)
+        wm.end_sessions()
+        test_sublime._run_timeout()
+        self.assertNotIn(TEST_CONFIG.name, wm._log_buffers)
+
     def test_invokes_language_handler(self):
         _, docs, dispatcher, wm = self.make([[MockView(__file__)]])
 
@@ -247,3 +266,110 @@ class WindowManagerTests(unittest.TestCase):
             wm.activate_view(another_view)
             _ = wm.get_session(TEST_CONFIG.name, outside_file)
             self.assertEqual(len(wm._sessions), 1)
+
+
+class HandlerRecordingClient(MockClient):
+    def __init__(self) -> None:
+        super().__init__()
+        self.request_handlers = {}  # type: Dict[str, Callable]
+        self.notification_handlers = {}  # type: Dict[str, Callable]
+
+    def on_notification(self, name, handler: 'Callable') -> None:
+        self.notification_handlers[name] = handler
+
+    def on_request(self, name, handler: 'Callable') -> None:
+        self.request_handlers[name] = handler
+
+
+class SharedSessionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = SessionRegistry()
+        self.started = 0
+
+    def start_session(self,
+                      window: MockWindow,
+                      workspace_folders: 'List[WorkspaceFolder]',
+                      config: ClientConfig,
+                      on_pre_initialize: 'Callable[[Session], None]',
+                      on_post_initialize: 'Callable[[Session], None]',
+                      on_post_exit: 'Callable[[str], None]',
+                      on_stderr_log: 'Optional[Callable[[str], None]]') -> 'Optional[Session]':
+        self.started += 1
+        return create_session(
+            config=TEST_CONFIG,
+            workspace_folders=workspace_folders,
+            env=dict(),
+            settings=MockSettings(),
+            bootstrap_client=HandlerRecordingClient(),
+            on_pre_initialize=on_pre_initialize,
+            on_post_initialize=on_post_initialize,
+            on_post_exit=on_post_exit,
+            on_stderr_log=on_stderr_log)
+
+    def make(self) -> 'Tuple[MockWindow, MockDocuments, WindowManager]':
+        docs = MockDocuments()
+        window = MockWindow([[MockView(__file__)]], [os.path.dirname(__file__)])
+        settings = MockSettings()
+        settings.share_sessions_between_windows = True
+        wm = WindowManager(
+            window=window,
+            workspace=ProjectFolders(window),
+            settings=settings,
+            configs=MockConfigs(),
+            documents=docs,
+            diagnostics=DiagnosticsStorage(None),
+            session_starter=self.start_session,
+            sublime=test_sublime,
+            handler_dispatcher=MockHandlerDispatcher(),
+            session_registry=self.registry)
+        wm.start_active_views()
+        return window, docs, wm
+
+    def test_windows_with_same_folders_share_a_session(self):
+        _, docs1, wm1 = self.make()
+        _, docs2, wm2 = self.make()
+        self.assertEqual(self.started, 1)
+        session = wm1.get_session(TEST_CONFIG.name, __file__)
+        self.assertIsNotNone(session)
+        self.assertIs(wm2.get_session(TEST_CONFIG.name, __file__), session)
+        self.assertIs(docs1._sessions[TEST_CONFIG.name], session)
+        self.assertIs(docs2._sessions[TEST_CONFIG.name], session)
+
+    def test_routes_diagnostics_and_edits(self):
+        window1, _, wm1 = self.make()
+        window2, _, wm2 = self.make()
+        view = window2.active_view()
+        window2.find_open_file = lambda path: view if path == __file__ else None
+        client = wm1.get_session(TEST_CONFIG.name, __file__).client
+
+        client.notification_handlers["textDocument/publishDiagnostics"]({
+            "uri": filename_to_uri(__file__),
+            "diagnostics": [{"message": "error", "range": {"start": {"line": 0, "character": 0},
+                                                           "end": {"line": 0, "character": 1}}}]})
+        self.assertEqual(len(wm1.diagnostics.get_by_file(__file__)[TEST_CONFIG.name]), 1)
+        self.assertEqual(len(wm2.diagnostics.get_by_file(__file__)[TEST_CONFIG.name]), 1)
+
+        client.request_handlers["workspace/applyEdit"]({"edit": {"changes": {filename_to_uri(__file__): []}}}, 1)
+        self.assertEqual(window1.commands, [])
+        self.assertEqual([command for command, _ in window2.commands], ["lsp_apply_workspace_edit"])
+
+    def test_ends_session_with_last_window(self):
+        _, docs1, wm1 = self.make()
+        _, docs2, wm2 = self.make()
+        session = wm1.get_session(TEST_CONFIG.name, __file__)
+
+        wm1.end_sessions()
+        self.assertEqual(len(docs1._sessions), 0)
+        self.assertIsNotNone(session.client)
+        self.assertIs(docs2._sessions[TEST_CONFIG.name], session)
+
+        _, _, wm3 = self.make()
+        self.assertEqual(self.started, 1)
+
+        wm2.end_sessions()
+        wm3.end_sessions()
+        self.assertIsNone(session.client)
+
+        self.make()
+        self.assertEqual(self.started, 2)